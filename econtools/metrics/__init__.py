@@ -1,3 +1,12 @@
 # flake8: noqa
-from .core import reg, ivreg, f_test
+from .core import reg, ivreg, f_test, f_test_batch, f_test_nl
 from .locallinear import llr, kdensity
+from .weakiv import weakiv
+from .randinf import randinf
+from .poisson import ppml
+from .did import att_gt
+from .eventstudy import eventstudy
+from .partial import PartialCache
+from .update import UpdatableReg
+from .distributed import (distreg, LocalExecutor, ProcessExecutor,
+                          SocketExecutor)
@@ -0,0 +1,160 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from econtools.metrics.regutil import group_sums
+
+
+def is_column_source(data):
+    """
+    True if `data` is column data that :py:class:`ColumnSource` reads in
+    blocks: a dict of 1D arrays (e.g., NumPy memmaps), a structured array or
+    memmap, or a pyarrow ``Table`` or ``RecordBatch``.
+    """
+    if isinstance(data, pd.DataFrame):
+        return False
+    if isinstance(data, dict):
+        return True
+    if isinstance(data, np.ndarray) and data.dtype.names is not None:
+        return True
+    return _is_arrow(data)
+
+
+def _is_arrow(data):
+    # pyarrow is optional, so check the type instead of importing it
+    return (type(data).__module__.split('.')[0] == 'pyarrow' and
+            type(data).__name__ in ('Table', 'RecordBatch'))
+
+
+class ColumnSource(object):
+    """
+    Row blocks of named columns without copying the whole dataset.
+
+    Args:
+        data: A dict of equal-length 1D arrays (e.g., NumPy memmaps or
+            column views of a 2D memmap), a structured array or memmap, or a
+            pyarrow ``Table`` or ``RecordBatch``.
+
+    Notes:
+        Slicing a memmap or an Arrow table doesn't copy, so only the block
+        being read is in memory. Missing values are NaN in float columns,
+        ``None``/NaN in object columns, and, for Arrow, nulls in the
+        validity bitmap of each chunk.
+    """
+
+    def __init__(self, data):
+        if not is_column_source(data):
+            raise ValueError("Unsupported column data {}".format(type(data)))
+        self.data = data
+        self.is_arrow = _is_arrow(data)
+        if self.is_arrow:
+            self.names = list(data.schema.names)
+            self.n_rows = data.num_rows
+        else:
+            self.names = list(data.dtype.names if isinstance(data, np.ndarray)
+                              else data.keys())
+            lengths = set(len(data[name]) for name in self.names)
+            if len(lengths) > 1:
+                raise ValueError("Columns must have the same length")
+            self.n_rows = lengths.pop() if lengths else 0
+
+    def check(self, names):
+        missing = [name for name in names if name not in self.names]
+        if missing:
+            raise ValueError("Columns not in data: {}".format(missing))
+
+    def values(self, name, start, stop):
+        """
+        Rows `start:stop` of column `name` and a flag for non-missing rows.
+        """
+        if self.is_arrow:
+            return self._arrow_values(name, start, stop)
+        values = np.asarray(self.data[name][start:stop])
+        if values.dtype.kind == 'f':
+            valid = ~np.isnan(values)
+        elif values.dtype.kind == 'O':
+            valid = pd.notnull(values)
+        else:
+            valid = np.ones(len(values), dtype=bool)
+        return values, valid
+
+    def floats(self, name, start, stop):
+        """ Like `values`, as float64 (NaN is missing). """
+        values, valid = self.values(name, start, stop)
+        if values.dtype.kind == 'O':
+            values = np.where(valid, values, np.nan)
+        try:
+            values = values.astype(np.float64)
+        except (TypeError, ValueError):
+            raise ValueError("Column `{}` is not numeric".format(name))
+        return values, valid & ~np.isnan(values)
+
+    def _arrow_values(self, name, start, stop):
+        column = self.data.column(self.data.schema.get_field_index(name))
+        column = column.slice(start, stop - start)
+        chunks = column.chunks if hasattr(column, 'chunks') else [column]
+        values = [chunk.to_numpy(zero_copy_only=False) for chunk in chunks]
+        valid = [_arrow_valid(chunk) for chunk in chunks]
+        if not values:
+            return np.empty(0), np.empty(0, dtype=bool)
+        return np.concatenate(values), np.concatenate(valid)
+
+
+class BlockClusters(object):
+    """
+    Cluster sums of scores accumulated one block of rows at a time, with
+    cluster codes that are consistent across blocks.
+
+    Args:
+        K (int): Number of columns of the scores.
+
+    Attributes:
+        n_clusters (int): Number of clusters seen so far.
+    """
+
+    def __init__(self, K):
+        self.index = None
+        self.n_clusters = 0
+        self._sums = np.zeros((16, K))
+
+    def add(self, cluster_id, xu):
+        """ Add the rows of `xu` to the sums of their clusters. """
+        if len(cluster_id) == 0:
+            return
+        codes, uniques = pd.factorize(cluster_id)
+        if self.index is None:
+            pos = np.arange(len(uniques))
+            self.index = pd.Index(uniques)
+        else:
+            pos = self.index.get_indexer(uniques)
+            new = pos < 0
+            pos[new] = self.n_clusters + np.arange(new.sum())
+            if new.any():
+                self.index = self.index.append(pd.Index(uniques[new]))
+        self.n_clusters = len(self.index)
+        if self.n_clusters > len(self._sums):
+            sums = np.zeros((2 * self.n_clusters, self._sums.shape[1]))
+            sums[:len(self._sums)] = self._sums
+            self._sums = sums
+        self._sums[pos] += group_sums(codes, xu, len(uniques))
+
+    def totals(self):
+        """ Cluster IDs and the sums for each. """
+        if self.index is None:
+            return np.empty(0), self._sums[:0]
+        return self.index.values, self._sums[:self.n_clusters]
+
+    def meat(self):
+        """ Cluster-robust meat, `sum_g (sum_i xu_i)'(sum_i xu_i)`. """
+        scores = self._sums[:self.n_clusters]
+        return scores.T.dot(scores)
+
+
+def _arrow_valid(array):
+    """ Non-null flags from the validity bitmap of an Arrow array. """
+    if array.null_count == 0:
+        return np.ones(len(array), dtype=bool)
+    bitmap = np.frombuffer(array.buffers()[0], dtype=np.uint8)
+    bits = np.unpackbits(bitmap, bitorder='little')
+    return bits[array.offset:array.offset + len(array)].astype(bool)
@@ -1,5 +1,10 @@
 from __future__ import division
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+
 import pandas as pd
 import numpy as np
 import numpy.linalg as la    # scipy.linalg yields slightly diff results (tsls)
@@ -7,25 +12,67 @@ from numpy.linalg import matrix_rank        # not in `scipy.linalg`
 from scipy.linalg import sqrtm              # notin `numpy.linalg`
 
 import scipy.stats as stats
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 
 from econtools.util import force_list, force_df
-from econtools.metrics.regutil import (unpack_shac_args, flag_sample,
-                                       flag_nonsingletons, set_sample,)
-
-
-def reg(df, y_name, x_name,
+from econtools.metrics.regutil import (unpack_shac_args, unpack_hac_args,
+                                       flag_sample,
+                                       prune_singletons, set_sample,
+                                       group_sums, demean_codes, demean_multi,
+                                       ClusterStructure,
+                                       recover_fixed_effects)
+from econtools.metrics.design import (Design, SparseDesign, Float32Design,
+                                      as_float, densify, downcast_error,
+                                      is_sparse_frame)
+from econtools.metrics.factor import (has_factor_terms, factor_sources,
+                                      expand_factors)
+from econtools.metrics.formula import is_formula, compile_formula
+from econtools.metrics.columns import (ColumnSource, BlockClusters,
+                                       is_column_source)
+
+EARTH_RADIUS_KM = 6371.0088     # Mean radius, for great-circle SHAC distances
+
+
+def reg(df, y_name, x_name=None,
         a_name=None, nosingles=True,
-        vce_type=None, cluster=None, shac=None,
+        vce_type=None, cluster=None, shac=None, hac=None,
         addcons=None, nocons=False,
-        awt_name=None
+        awt_name=None, fwt_name=None, collapse=False,
+        dtype='float64', cache=None, block_size=2**20, save_fe=False,
         ):
     """OLS Regression.
 
     Args:
-        df (DataFrame): Data with any relevant variables.
-        y_name (str): Column name in ``df`` of the dependent variable.
+        df (DataFrame): Data with any relevant variables. May also be column
+                data that is too large to copy: a dict of 1D arrays (e.g.,
+                NumPy memmaps or column views of a 2D memmap), a structured
+                array or memmap, or a pyarrow ``Table`` or ``RecordBatch``
+                (nulls are missing). Cross products are accumulated over
+                blocks of ``block_size`` rows sliced from the data, so the
+                full design matrix is never in memory. Column data supports
+                ``vce_type`` ``None``, ``'robust'``/``'hc1'``, and
+                ``'cluster'``, and weights, but not ``a_name``, factor
+                variables, ``collapse``, ``dtype``, or ``cache``. Results
+                have no ``yhat`` or ``resid``.
+        y_name (str): Column name in ``df`` of the dependent variable, or a
+                formula like ``'y ~ x1 + i.year | fe1 + fe2'`` giving the
+                dependent variable, regressors, and (optionally) fixed
+                effects to absorb (``a_name``); ``1`` in the regressors adds
+                a constant. Parsed formulas are cached. See
+                :py:func:`~econtools.metrics.formula.compile_formula`.
         x_name (str or list): Column name(s) in ``df`` of the independent
-                variables/regressors
+                variables/regressors (None if ``y_name`` is a formula).
+                Columns with a pandas ``SparseDtype`` (e.g., from
+                ``pd.DataFrame.sparse.from_spmatrix`` applied to a
+                ``scipy.sparse`` matrix) are kept sparse: cross products and
+                score sums use sparse kernels and only K-by-K matrices are
+                dense. Sparse columns are made dense if ``a_name`` is used or
+                with ``vce_type='shac'``. Stata-style factor-variable syntax
+                (``i.state``, ``ib2010.year``, ``i.year#c.treat``,
+                ``i.a##i.b``) is expanded into sparse indicator columns; see
+                :py:func:`~econtools.metrics.factor.expand_factors`.
 
     Keyword Args:
         vce_type (str): Type of estimator to use for variance-covariance matrix
@@ -36,6 +83,8 @@ def reg(df, y_name, x_name,
                 - 'hc3'
                 - 'cluster' (requires kwarg ``cluster``)
                 - 'shac' (requires kwarg ``shac``)
+                - 'hac' (Newey-West, requires kwarg ``hac``)
+                - 'driscoll-kraay' (requires kwarg ``hac``)
         cluster (str): Column name in ``df`` used to cluster standard errors.
         shac (dict): Arguments to pass to spatial HAC estimator.
             Requires:
@@ -44,10 +93,54 @@ def reg(df, y_name, x_name,
                 - **kern** (*str*): Kernel to use in estimation. May be
                     triangle (``tria``) or uniform (``unif``).
                 - **band** (float): Bandwidth for kernel.
-        a_name (str) - Column name in ``df`` that defines groups for within
-            transformation (demeaning).
+            Optional:
+                - **metric** (*str*): ``'euclidean'`` (default) distance in
+                    the units of ``x`` and ``y``, or ``'haversine'`` for
+                    great-circle distance with ``x`` and ``y`` in degrees
+                    longitude and latitude and ``band`` in km.
+                - **n_jobs** (*int*): Threads for the all-pairs Euclidean
+                    estimator used for cross sections (-1 for all cores).
+                    Defaults to 1.
+            Optional, for panels (space-time Conley):
+                - **time** (*str*): Column name in ``df`` of integer time
+                    periods. Scores at locations within ``band`` of each
+                    other are correlated across periods up to ``lag`` apart,
+                    with the spatial kernel times a Bartlett kernel in the
+                    time difference.
+                - **lag** (*int*): Maximum lag. Defaults to
+                    ``floor(4 * (T / 100) ** (2 / 9))`` for ``T`` periods.
+        hac (dict): Arguments to pass to time-series HAC estimators.
+            Defaults to ``vce_type='hac'`` if passed.
+                - **time** (*str*): Column name in ``df`` of integer time
+                    periods. Lags are differences in ``time``, so gaps are
+                    respected.
+                - **panel** (*str*, optional): Column name in ``df`` of
+                    panel units. With ``'hac'``, scores are only correlated
+                    within units (and ``time`` must be unique within each
+                    unit). Ignored by ``'driscoll-kraay'``, which sums
+                    scores across units within each period first.
+                - **lags** (*int*, optional): Maximum lag. Defaults to
+                    ``floor(4 * (T / 100) ** (2 / 9))`` for ``T`` periods.
+                - **kern** (*str*, optional): ``'bartlett'`` (default) or
+                    ``'parzen'``.
+        a_name (str or list) - Column name(s) in ``df`` that define groups
+            for within transformation (demeaning). With several names, the
+            fixed effects are absorbed by alternating projections and the
+            degrees of freedom they use are exact for the first two that
+            are not nested within ``cluster``.
         awt_name (str): Column name in ``df`` to use for analytic weights in
             regression.
+        fwt_name (str): Column name in ``df`` to use for frequency weights,
+            i.e., the number of observations each row represents. Cannot be
+            used with ``awt_name``.
+        collapse (bool): Defaults to False. Before estimation, collapse rows
+            with identical regressors, ``a_name``, ``cluster``, and ``shac``
+            coordinates into a single frequency-weighted row that keeps the
+            mean and within-cell sum of squares of ``y_name``. Coefficients
+            and all VCE types are identical to the uncollapsed regression.
+            Useful when all regressors are discrete. With ``collapse``,
+            ``yhat`` and ``resid`` in the returned results are for the
+            collapsed cells.
         addcons (bool): Defaults to False. Add a constant to independent
             variables. Has no effect if ``a_name`` is passed.
         nocons (bool): Defaults to False. Flag so estimators know that
@@ -55,71 +148,188 @@ def reg(df, y_name, x_name,
             affects degrees of freedom.
         nosingles (bool): Defaults to True. Drop observations that are obsorbed
             by the within transformation. Has no effect if ``a_name=None``.
+            With several fixed effects, singletons are dropped repeatedly
+            until none are left, and the number dropped in each round is
+            saved in the ``singletons`` attribute of the results.
+        dtype (str): Defaults to ``'float64'``. If ``'float32'``, dense
+            regressors (and row-level products like weighted rows) are kept
+            in single precision, halving their memory. Cross products, the
+            bread, and the VCE are still accumulated in float64 one block of
+            rows at a time, the solution gets one step of iterative
+            refinement, and precision diagnostics are saved in the
+            ``float32_diag`` attribute of the results. Sparse regressors
+            stay float64; ``a_name`` and ``shac`` need temporary dense
+            float64 copies.
+        cache (PartialCache): Defaults to None. A
+            :py:class:`~econtools.metrics.partial.PartialCache` of control
+            variables shared across calls that only change the other
+            regressors (or ``y_name``), so the controls are demeaned and
+            partialled out once per sample. Results are the same as without
+            the cache. Cannot be used with ``collapse``.
+        block_size (int): Defaults to ``2**20``. Rows read at a time when
+            ``df`` is column data (ignored for a DataFrame).
+        save_fe (bool): Defaults to False. If True, keep what
+            :py:meth:`~econtools.metrics.core.Results.fixed_effects` needs to
+            recover the fixed effects in ``a_name``: the group codes and
+            :math:`y - X\\hat\\beta` before demeaning (N-length arrays).
 
     Returns:
         A :py:class:`~econtools.metrics.core.Results` object
     """
 
+    if is_formula(y_name):
+        if x_name is not None:
+            raise ValueError("`x_name` must be None when using a formula")
+        plan, a_name, addcons = _from_formula(y_name, a_name, addcons,
+                                              iv=False)
+        y_name, x_name = plan.y_name, list(plan.x_name)
+    elif x_name is None:
+        raise ValueError("`x_name` is required without a formula")
+
+    if is_column_source(df):
+        RegWorker = BlockRegression(
+            df, y_name, x_name, block_size=block_size,
+            a_name=a_name, addcons=addcons, nocons=nocons,
+            vce_type=vce_type, cluster=cluster, shac=shac, hac=hac,
+            awt_name=awt_name, fwt_name=fwt_name, collapse=collapse,
+            dtype=dtype, cache=cache,
+        )
+        return RegWorker.main()
+
     RegWorker = Regression(
         df, y_name, x_name,
         a_name=a_name, nosingles=nosingles, addcons=addcons, nocons=nocons,
-        vce_type=vce_type, cluster=cluster, shac=shac,
-        awt_name=awt_name,
+        vce_type=vce_type, cluster=cluster, shac=shac, hac=hac,
+        awt_name=awt_name, fwt_name=fwt_name, collapse=collapse,
+        dtype=dtype, cache=cache, save_fe=save_fe,
     )
 
     results = RegWorker.main()
     return results
 
 
-def ivreg(df, y_name, x_name, z_name, w_name,
-          a_name=None, nosingles=True,
+def ivreg(df, y_name, x_name=None, z_name=None, w_name=None,
+          a_name=None, nosingles=True, zcat_name=None,
           iv_method='2sls', _kappa_debug=None,
-          vce_type=None, cluster=None, shac=None,
+          vce_type=None, cluster=None, shac=None, hac=None,
           addcons=None, nocons=False,
-          awt_name=None,
+          awt_name=None, save_fe=False,
           ):
     """Instrumental Variables Regression
 
     Args:
         df (DataFrame): Data with any relevant variables.
-        y_name (str): Column name in ``df`` of the dependent variable.
+        y_name (str): Column name in ``df`` of the dependent variable, or a
+            formula like ``'y ~ w1 + w2 | fe | (x ~ z1 + z2)'`` with the
+            exogenous regressors before the first ``|`` and the endogenous
+            regressors and excluded instruments in the IV part.
         x_name (str or list): Column name(s) in ``df`` of the endogenous
             regressor(s).
         z_name (str or list): Column name(s) in ``df`` of the excluded
             instrument(s)
         w_name (str or list): Column name(s) in ``df`` of the included
-            instruments/exogenous regressors
+            instruments/exogenous regressors. Factor-variable syntax (see
+            :py:func:`~econtools.reg`) may be used in ``x_name``,
+            ``z_name``, and ``w_name``, which must be None if ``y_name``
+            is a formula.
 
     Keyword Args:
-        a_name (str) - Column name in ``df`` that defines groups for within
+        a_name (str or list) - Column name(s) in ``df`` that define groups
+            for within
             transformation (demeaning). **All other keyword args in
             :py:func:`~econtools.reg` may also be used.
+        zcat_name (str): Column name in ``df`` of a categorical excluded
+            instrument, e.g. examiner or judge ID. Its dummies are used as
+            instruments (in addition to ``z_name``, which may be empty)
+            without being created; the first stage is calculated with group
+            means. Supports ``iv_method`` ``'2sls'``, ``'jive'``, and
+            ``'ujive'``. For the jackknife estimators, observations in
+            singleton ``zcat_name`` groups are dropped if ``nosingles`` is
+            True and ``a_name`` groups must nest ``zcat_name`` groups.
         iv_method (str): Instrumental variables method to use.
             Options are:
                 - ``'2sls'``, two-stage least squares (default)
                 - ``'liml'``, limited-information maximum likelihood.
+                - ``'gmm2s'``, two-step efficient GMM.
+                - ``'igmm'``, iterated efficient GMM.
+                - ``'jive'``, jackknife IV (JIVE1, Angrist, Imbens, and Krueger
+                  1999).
+                - ``'ujive'``, unbiased jackknife IV (Kolesar 2013),
+                  :math:`(\\tilde X'X)^{-1}\\tilde X'y`, where
+                  :math:`\\tilde X` is the leave-one-out fit of ``x_name``
+                  on the instruments less that on ``w_name``. Unlike the
+                  other methods, ``w_name`` is not partialled out of ``y``
+                  (effects absorbed with ``a_name`` are).
+            The GMM weight matrix is the inverse of the outer product of the
+            moment scores implied by ``vce_type`` (robust, cluster, or
+            spatial HAC). With the default ``vce_type``, GMM is 2SLS.
+            JIVE estimators use closed-form leave-one-out first-stage fitted
+            values instead of re-estimating the first stage N times.
 
     Returns:
         A modified :py:class:`~econtools.metrics.core.Results` object:
             - No r-squared (`r2` or `r2_a`)
             - ``kappa`` attribute (always 1 if ``iv_method='2sls'``)
+            - ``J``, ``J_df``, and ``J_p`` attributes (GMM only), Hansen's J
+              statistic of overidentifying restrictions, its degrees of
+              freedom, and p-value.
     """
 
+    if is_formula(y_name):
+        if not (x_name is None and z_name is None and w_name is None):
+            raise ValueError("`x_name`, `z_name`, and `w_name` must be None "
+                             "when using a formula")
+        plan, a_name, addcons = _from_formula(y_name, a_name, addcons,
+                                              iv=True)
+        y_name = plan.y_name
+        x_name, z_name = list(plan.endog), list(plan.instruments)
+        w_name = list(plan.x_name)
+    elif x_name is None or z_name is None or w_name is None:
+        raise ValueError("`x_name`, `z_name`, and `w_name` are required "
+                         "without a formula")
+
     IVRegWorker = IVReg(
         df, y_name, x_name, z_name, w_name,
         a_name=a_name, nosingles=nosingles, addcons=addcons, nocons=nocons,
+        zcat_name=zcat_name,
         iv_method=iv_method, _kappa_debug=_kappa_debug,
-        vce_type=vce_type, cluster=cluster, shac=shac,
-        awt_name=awt_name,
+        vce_type=vce_type, cluster=cluster, shac=shac, hac=hac,
+        awt_name=awt_name, save_fe=save_fe,
     )
 
     results = IVRegWorker.main()
     return results
 
 
+def _from_formula(formula, a_name, addcons, iv):
+    """ Compile `formula` and merge it with the `a_name` and `addcons` args """
+    plan = compile_formula(formula)
+    if plan.is_iv and not iv:
+        raise ValueError("Use `ivreg` for a formula with an IV part")
+    elif iv and not plan.is_iv:
+        raise ValueError("`ivreg` formula needs an IV part, "
+                         "e.g. '(x ~ z1 + z2)'")
+    if plan.a_name is not None:
+        if a_name is not None:
+            raise ValueError("`a_name` set both in formula and as argument")
+        a_name = (list(plan.a_name) if isinstance(plan.a_name, list)
+                  else plan.a_name)
+    if plan.addcons:
+        addcons = True
+    return plan, a_name, addcons
+
+
 # Workhorse classes
 class RegBase(object):
 
+    fwt_name = None
+    collapse = False
+    hac = None
+    sparse_x = False    # Keep sparse regressors in a `SparseDesign`
+    dtype = 'float64'
+    cache = None        # `PartialCache` of demeaned controls
+    save_fe = False     # Keep data for `Results.fixed_effects`
+
     def __init__(self, df, y_name, x_name, **kwargs):
         self.df = df
         self.y_name = y_name
@@ -127,31 +337,71 @@ class RegBase(object):
 
         self.sample_cols_labels = (
             'y_name', 'x_name', 'a_name', 'cluster', 'shac_x', 'shac_y',
-            'awt_name'
+            'shac_time', 'awt_name', 'fwt_name', 'hac_time', 'hac_panel'
         )
 
         self.sample_store_labels = (
-            'y', 'x', 'A', 'cluster_id', 'shac_x', 'shac_y', 'AWT'
+            'y', 'x', 'A', 'cluster_id', 'shac_x', 'shac_y', 'shac_time',
+            'AWT', 'FWT', 'hac_time', 'hac_panel'
         )
+        self.y_wss = None
+        self.singleton_rounds = []
+
+        if self.awt_name is not None and self.fwt_name is not None:
+            raise ValueError("Cannot use analytic and frequency weights")
+        if self.dtype not in ('float64', 'float32'):
+            raise ValueError("`dtype` must be 'float64' or 'float32'")
+        if self.cache is not None and self.collapse:
+            raise ValueError("Cannot use `cache` with `collapse`")
+        self._cache_entry = None
+        self.downcast_err = 0.
+        # Several `a_name`s are absorbed as multi-way fixed effects
+        if isinstance(self.a_name, (list, tuple)):
+            self.a_name = (list(self.a_name) if len(self.a_name) > 1
+                           else (self.a_name[0] if self.a_name else None))
 
         self.vars_in_reg = ('y', 'x')
         self.add_constant_to = 'x'
 
         # Set `vce_type`
-        self.vce_type = _set_vce_type(self.vce_type, self.cluster, self.shac)
+        self.vce_type = _set_vce_type(self.vce_type, self.cluster, self.shac,
+                                      self.hac)
         # Unpack spatial HAC args
         sp_args = unpack_shac_args(self.shac)
         self.shac_x = sp_args[0]
         self.shac_y = sp_args[1]
         self.shac_band = sp_args[2]
         self.shac_kern = sp_args[3]
+        self.shac_time = sp_args[4]
+        self.shac_lag = sp_args[5]
+        self.shac_metric = sp_args[6]
+        self.shac_n_jobs = sp_args[7]
+        # Unpack time-series HAC args
+        hac_args = unpack_hac_args(self.hac)
+        self.hac_time = hac_args[0]
+        self.hac_panel = hac_args[1] if self.vce_type == 'hac' else None
+        self.hac_lags = hac_args[2]
+        self.hac_kern = hac_args[3]
 
         # Force variable names to lists
         self.x_name = force_list(x_name)
+        self.factor_terms = dict()
+        self._parse_factor_vars('x_name', 'x')
+
+    def _parse_factor_vars(self, name_label, store_label):
+        """
+        If `name_label` uses factor-variable syntax, keep the terms for
+        `store_label` and replace the names with their source columns.
+        """
+        names = self.__dict__[name_label]
+        if has_factor_terms(names, self.df.columns):
+            self.factor_terms[store_label] = names
+            self.__dict__[name_label] = factor_sources(names, self.df.columns)
 
     def main(self):
         self.set_sample()
         self.estimate()
+        self._store_fe_data()
         self.get_vce()
         self.set_dof()
         self.inference()
@@ -160,26 +410,41 @@ class RegBase(object):
 
     def set_sample(self):
         sample_cols = tuple(
-            [self.__dict__[x] for x in self.sample_cols_labels])
+            [getattr(self, x) for x in self.sample_cols_labels])
         self.sample = flag_sample(self.df, *sample_cols)
-        if self.nosingles and self.a_name:
-            self.sample &= flag_nonsingletons(self.df, self.a_name,
-                                              self.sample)
+        self._drop_singletons()
 
         sample_vars = set_sample(self.df, self.sample, sample_cols)
         self.__dict__.update(dict(zip(self.sample_store_labels, sample_vars)))
         self.x = force_df(self.x)
         self.y = self.y.squeeze()
 
-        # Force regression variables to float64
+        # Force regression variables to float64 (factor variables are
+        # expanded after collapsing, from their source columns)
         for var in self.vars_in_reg:
-            self.__dict__[var] = self.__dict__[var].astype(np.float64)
+            if var in self.factor_terms:
+                continue
+            self.__dict__[var] = self._as_float(var, self.__dict__[var])
+
+        if self.collapse:
+            self._collapse_sample()
+
+        for var, terms in self.factor_terms.items():
+            self.__dict__[var] = self._as_float(
+                var, expand_factors(self.__dict__[var], terms))
+
+        if self.cache is not None:
+            self._cache_entry = self.cache.entry(
+                self.df, self.sample.values, self.a_name, self.fwt_name,
+                self.awt_name)
 
         # Demean or add constant
         if self.a_name is not None:
             self._demean_sample()
         elif self.addcons:
-            _cons = np.ones(self.y.shape[0])
+            single = self.dtype == 'float32' and self.add_constant_to == 'x'
+            _cons = np.ones(self.y.shape[0],
+                            dtype=np.float32 if single else np.float64)
             x = self.__dict__[self.add_constant_to]
             if x.empty:
                 x = pd.DataFrame(_cons, columns=['_cons'], index=self.y.index)
@@ -191,13 +456,141 @@ class RegBase(object):
         if self.AWT is not None:
             self._weight_sample()
 
+        # Cluster codes and counts, shared by the VCE and DoF
+        self.clusters = (ClusterStructure(self.cluster_id)
+                         if self.cluster_id is not None else None)
+
+        if self.sparse_x:
+            self.x = SparseDesign.from_frame(self.x)
+        if self.dtype == 'float32' and not isinstance(self.x, Design):
+            self.downcast_err = max(self.downcast_err,
+                                    downcast_error(self.x))
+            self.x = Float32Design.from_frame(self.x)
+
+    def _as_float(self, var, df):
+        """
+        Cast regression variable `var` to float64, or regressors `x` to
+        float32 in single-precision mode (keeping track of rounding error).
+        """
+        keep_sparse = self.sparse_x and var == 'x'
+        if self.dtype == 'float32' and var == 'x':
+            dense = densify(df) if not keep_sparse else df
+            if not is_sparse_frame(dense):
+                self.downcast_err = max(self.downcast_err,
+                                        downcast_error(dense))
+                return dense.astype(np.float32, copy=False)
+        return as_float(df, keep_sparse=keep_sparse)
+
+    def _drop_singletons(self):
+        """ Iteratively drop singletons across all grouping variables. """
+        names = self._singleton_groups()
+        if not (self.nosingles and names):
+            return
+        rows = np.flatnonzero(self.sample.values)
+        codes_list = [pd.factorize(self.df[name].values[rows])[0]
+                      for name in names]
+        keep, self.singleton_rounds = prune_singletons(codes_list)
+        self.sample = self.sample.copy()
+        self.sample.iloc[rows[~keep]] = False
+
+    def _singleton_groups(self):
+        """ Grouping variables whose singletons are dropped. """
+        return force_list(self.a_name) if self.a_name else []
+
+    def _collapse_sample(self):
+        """
+        Collapse rows with identical regressors and grouping variables into
+        frequency-weighted cells. `y` becomes the cell mean and its
+        within-cell sum of squares is kept in `y_wss` for the VCE.
+        """
+        if self.add_constant_to != 'x':
+            raise ValueError("`collapse` is only supported for OLS")
+        keys = [self.x] + [self.__dict__[name] for name in
+                           ('A', 'cluster_id', 'shac_x', 'shac_y',
+                            'shac_time', 'hac_time', 'hac_panel')
+                           if self.__dict__[name] is not None]
+        cell = np.zeros(self.y.shape[0], dtype=np.int64)
+        for key in keys:
+            for __, col in force_df(key).items():
+                col_codes, uniques = pd.factorize(col)
+                cell = pd.factorize(cell * len(uniques) + col_codes)[0]
+        __, first_row = np.unique(cell, return_index=True)
+
+        if self.FWT is None:
+            fwt = np.ones(self.y.shape[0])
+        else:
+            fwt = self.FWT.values.astype(np.float64)
+        y = self.y.values
+        n_cell = np.bincount(cell, weights=fwt)
+        y_mean = np.bincount(cell, weights=fwt * y) / n_cell
+        y_wss = np.bincount(cell, weights=fwt * (y - y_mean[cell]) ** 2)
+        if self.y_wss is not None:
+            y_wss += np.bincount(cell, weights=self.y_wss)
+
+        for name in ('x', 'A', 'cluster_id', 'shac_x', 'shac_y', 'shac_time',
+                     'hac_time', 'hac_panel'):
+            if self.__dict__[name] is not None:
+                self.__dict__[name] = self.__dict__[name].iloc[
+                    first_row].reset_index(drop=True)
+        self.y = pd.Series(y_mean, name=self.y.name)
+        self.FWT = pd.Series(n_cell, name=self.fwt_name)
+        self.y_wss = y_wss
+
     def _demean_sample(self):
         self.y_raw = self.y.copy()
+        self.x_raw = dict()     # Undemeaned regressors, for `fixed_effects`
         for var in self.vars_in_reg:
-            self.__dict__[var] = _demean(self.A, self.__dict__[var])
+            # Demeaned sparse columns aren't sparse; demean float32 in float64
+            self.__dict__[var] = as_float(self.__dict__[var])
+            if self.save_fe and var not in ('y', 'z'):
+                self.x_raw[var] = self.__dict__[var]
+            if self._cache_entry is None:
+                self.__dict__[var] = self._demean_within(self.__dict__[var])
+            else:
+                self.__dict__[var] = self._cache_entry.demean(
+                    self.__dict__[var], self._demean_within)
+
+    def _demean_within(self, df):
+        """ Demean `df` within the fixed effects in `A`. """
+        if isinstance(self.A, pd.DataFrame):
+            fwt = None if self.FWT is None else self.FWT.values
+            return _demean_multi(self.A, df, fwt)
+        elif self.FWT is None:
+            return _demean(self.A, df)
+        else:
+            return _demean_fwt(self.A, df, self.FWT)
+
+    def _store_fe_data(self):
+        """
+        Keep what `Results.fixed_effects` needs: group codes and `y - X*b`
+        before demeaning, which is the fixed effects plus residuals. Only
+        with `save_fe`, since these are N-length.
+        """
+        if self.A is None or not self.save_fe:
+            return
+        A = self.A.to_frame() if isinstance(self.A, pd.Series) else self.A
+        codes_list, levels = [], []
+        for __, col in A.items():
+            codes, uniques = pd.factorize(col)
+            codes_list.append(codes)
+            levels.append(uniques)
+        # Same weights as the demeaning (analytic weights aren't used there)
+        weights = None if self.FWT is None else self.FWT.values
+        self.results._fe = dict(
+            names=list(A.columns), codes_list=codes_list, levels=levels,
+            target=self._fe_target(), weights=weights,
+            single=not isinstance(self.A, pd.DataFrame))
+        self.__dict__.pop('x_raw', None)
+
+    def _fe_target(self):
+        beta = self.results.beta
+        x_raw = pd.concat([x for x in self.x_raw.values() if not x.empty],
+                          axis=1)
+        return self.y_raw.values - x_raw[beta.index].values.dot(beta.values)
 
     def _weight_sample(self):
         row_wt = _calc_aweights(self.AWT)
+        self.row_wt = row_wt
         for var in self.vars_in_reg:
             self.__dict__[var] = self.__dict__[var].multiply(row_wt, axis=0)
 
@@ -212,23 +605,39 @@ class RegBase(object):
         """
         X_inner_sum, X_for_resid = self._prep_inference_mats()
 
-        yhat = np.dot(X_for_resid, self.results.beta)
+        yhat = _xdot(X_for_resid, self.results.beta)
         resid = self.y - yhat
 
+        # With frequency weights, each row is several observations: squared
+        # residuals are summed over copies (plus the within-cell variation of
+        # `y` if collapsed) and residuals are summed within clusters
+        if self.FWT is None:
+            resid_sq = resid_sum = resid
+        else:
+            fwt = self.FWT.values
+            wss = 0 if self.y_wss is None else self.y_wss
+            resid_sq = np.sqrt(fwt * resid ** 2 + wss)
+            resid_sum = fwt * resid
+            self.results._ssr = resid_sq.dot(resid_sq)
+
         # Check through VCE types
         xpx_inv = self.results.xpx_inv
         if self.vce_type is None:
-            vce = vce_homosk(xpx_inv, resid)
+            vce = vce_homosk(xpx_inv, resid_sq)
+            if self.FWT is not None:
+                vce *= resid.shape[0] / self.FWT.sum()
         elif self.vce_type in ('robust', 'hc1'):
-            vce = vce_robust(xpx_inv, resid, X_inner_sum)
+            vce = vce_robust(xpx_inv, resid_sq, X_inner_sum)
         elif self.vce_type in ('hc2', 'hc3'):
-            vce = vce_hc23(xpx_inv, resid, X_inner_sum, hctype=self.vce_type)
+            vce = vce_hc23(xpx_inv, resid_sq, X_inner_sum,
+                           hctype=self.vce_type)
         elif self.vce_type == 'cluster':
-            vce = vce_cluster(xpx_inv, resid, X_inner_sum, self.cluster_id)
+            vce = vce_cluster(xpx_inv, resid_sum, X_inner_sum,
+                              self.clusters)
         elif self.vce_type == 'shac':
-            vce = vce_shac(xpx_inv, resid, X_inner_sum,
-                           self.shac_x, self.shac_y, self.shac_kern,
-                           self.shac_band)
+            vce = vce_shac(xpx_inv, resid_sum, X_inner_sum, *self._shac_args())
+        elif self.vce_type in ('hac', 'driscoll-kraay'):
+            vce = vce_hac(xpx_inv, resid_sum, X_inner_sum, *self._hac_args())
         else:
             raise ValueError
 
@@ -241,6 +650,18 @@ class RegBase(object):
 
         # Not VCE, but needs to go somewhere
         self.results._add_stat('sample', self.sample)
+        self.results._add_stat('singletons', self.singleton_rounds)
+
+    def _shac_args(self):
+        """ Args for `vce_shac` and `_meat_shac` after `x` and `resid` """
+        return (self.shac_x, self.shac_y, self.shac_kern, self.shac_band,
+                self.shac_time, self.shac_lag, self.shac_metric,
+                self.shac_n_jobs)
+
+    def _hac_args(self):
+        """ Args for `vce_hac` and `_meat_hac` after `time` and `panel` """
+        return (self.hac_time, self.hac_panel, self.hac_lags, self.hac_kern,
+                self.vce_type == 'driscoll-kraay')
 
     def _prep_inference_mats(self):
         """
@@ -266,10 +687,15 @@ class RegBase(object):
         elif vce_type in ('hc2', 'hc3'):
             df, vce_correct = df_hc23(N, K)
         elif vce_type == 'cluster':
-            df, vce_correct, g = df_cluster(N, K, self.cluster_id)
+            df, vce_correct, g = df_cluster(N, K, self.clusters)
             self.results._add_stat('g', g)
         elif vce_type == 'shac':
             df, vce_correct = df_shac(N, K)
+        elif vce_type == 'hac':
+            df, vce_correct = df_std(N, K)
+        elif vce_type == 'driscoll-kraay':
+            df, vce_correct, T = df_cluster(N, K, self.hac_time)
+            self.results._add_stat('T', T)
 
         self.results._add_stat('N', N)
         self.results._add_stat('K', K)
@@ -284,57 +710,80 @@ class RegBase(object):
         """
         # Set `N` and `K`
         N, K = self.x.shape
+        if self.FWT is not None:
+            N = self.FWT.sum()
+            N = int(N) if float(N).is_integer() else N
 
         if self.A is not None:
-            if not _fe_nested_in_cluster(self.cluster_id, self.A):
-                K += len(self.A.unique())    # Adjust dof's for group means
-            self.results.sst = self.y_raw
+            K += _fe_dof(self.A, self.clusters)     # Adjust for group means
+            self._set_sst(self.y_raw)
             self.results._nocons = True
         else:
             self.results._nocons = self.nocons
 
         return N, K
 
+    def _set_sst(self, y):
+        if self.FWT is None:
+            self.results.sst = y
+        else:
+            fwt = self.FWT.values
+            y_dev = y.values - fwt.dot(y.values) / fwt.sum()
+            wss = 0 if self.y_wss is None else self.y_wss.sum()
+            self.results._sst = fwt.dot(y_dev ** 2) + wss
+
     def inference(self):
-        vce = self.results.vce
-        beta = self.results.beta
-        t_df = self.results.df_t
+        _add_inference(self.results)
 
-        se = pd.Series(np.sqrt(np.diagonal(vce)), index=vce.columns)
-        t_stat = beta.div(se)
-        p_values = pd.Series(
-            stats.t.cdf(-np.abs(t_stat), t_df)*2,  # `t.cdf` is P(x<X)
-            index=vce.columns
-        )
 
-        self.results._add_stat('se', se)
-        self.results._add_stat('t_stat', t_stat)
-        self.results._add_stat('pt', p_values)
+def _add_inference(results):
+    """ Standard errors, t-stats, p-values, and 95% CIs from `vce`. """
+    vce = results.vce
+    beta = results.beta
+    t_df = results.df_t
+
+    se = pd.Series(np.sqrt(np.diagonal(vce)), index=vce.columns)
+    t_stat = beta.div(se)
+    p_values = pd.Series(
+        stats.t.cdf(-np.abs(t_stat), t_df)*2,  # `t.cdf` is P(x<X)
+        index=vce.columns
+    )
+
+    results._add_stat('se', se)
+    results._add_stat('t_stat', t_stat)
+    results._add_stat('pt', p_values)
 
-        conf_level = .95
-        crit_value = stats.t.ppf(conf_level + (1 - conf_level)/2, t_df)
-        ci_lo = beta - crit_value*se
-        ci_hi = beta + crit_value*se
+    conf_level = .95
+    crit_value = stats.t.ppf(conf_level + (1 - conf_level)/2, t_df)
+    ci_lo = beta - crit_value*se
+    ci_hi = beta + crit_value*se
 
-        self.results._add_stat('ci_lo', ci_lo)
-        self.results._add_stat('ci_hi', ci_hi)
+    results._add_stat('ci_lo', ci_lo)
+    results._add_stat('ci_hi', ci_hi)
 
-def _set_vce_type(vce_type, cluster, shac):
+def _set_vce_type(vce_type, cluster, shac, hac=None):
     """ Check for argument conflicts, then set `vce_type` if needed.  """
     # Check for valid arg
-    valid_vce = (None, 'robust', 'hc1', 'hc2', 'hc3', 'cluster', 'shac')
+    valid_vce = (None, 'robust', 'hc1', 'hc2', 'hc3', 'cluster', 'shac',
+                 'hac', 'driscoll-kraay')
     if vce_type not in valid_vce:
         raise ValueError("VCE type '{}' is not supported".format(vce_type))
     # Check for conflicts
+    hac_types = ('hac', 'driscoll-kraay')
     cluster_err = cluster and (vce_type != 'cluster' and vce_type is not None)
     shac_err = shac and (vce_type != 'shac' and vce_type is not None)
-    if (cluster and shac) or cluster_err or shac_err:
+    hac_err = ((hac and vce_type not in hac_types + (None,)) or
+               (vce_type in hac_types and not hac))
+    n_args = sum(bool(arg) for arg in (cluster, shac, hac))
+    if n_args > 1 or cluster_err or shac_err or hac_err:
         raise ValueError("VCE type conflict!")
     # Set `vce_type`
     if cluster:
         new_vce = 'cluster'
     elif shac:
         new_vce = 'shac'
+    elif hac and vce_type is None:
+        new_vce = 'hac'
     else:
         new_vce = vce_type
 
@@ -355,6 +804,52 @@ def _demean(A, df):
         demeaned = df - large_mean
         return demeaned
 
+def _demean_fwt(A, df, fwt):
+    """ Demean `df` within group `A` using frequency weights `fwt`. """
+    if df is None or df.empty:
+        return df
+    codes = pd.factorize(A)[0]
+    demeaned = demean_codes(codes, df.values, weights=fwt.values)
+    if df.ndim == 1:
+        return pd.Series(demeaned, index=df.index, name=df.name)
+    return pd.DataFrame(demeaned, index=df.index, columns=df.columns)
+
+def _demean_multi(A, df, fwt=None):
+    """ Demean `df` within each group in the columns of DataFrame `A`. """
+    if df is None or df.empty:
+        return df
+    codes_list = [pd.factorize(col)[0] for __, col in A.items()]
+    demeaned = demean_multi(codes_list, df.values, weights=fwt)
+    if df.ndim == 1:
+        return pd.Series(demeaned, index=df.index, name=df.name)
+    return pd.DataFrame(demeaned, index=df.index, columns=df.columns)
+
+def _fe_dof(A, cluster_id):
+    """
+    Number of group means absorbed by the fixed effects in `A`. Fixed effects
+    nested within clusters don't count. Among the rest, the first has no
+    redundant levels; the second has one per connected component of its
+    graph with the first (exact); later ones are assumed to have one (a lower
+    bound), as is the first if any fixed effect is nested within clusters.
+    """
+    if isinstance(A, pd.Series):
+        fes = [A]
+    else:
+        fes = [col for __, col in A.items()]
+    free = [fe for fe in fes if not _fe_nested_in_cluster(cluster_id, fe)]
+    if not free:
+        return 0
+    codes = [pd.factorize(fe)[0] for fe in free]
+    n_levels = [code.max() + 1 for code in codes]
+    redundant = len(free) - 1 + int(len(free) < len(fes))
+    if len(free) > 1:
+        graph = sp.csr_matrix(
+            (np.ones(len(codes[0])), (codes[0], codes[1] + n_levels[0])),
+            shape=(n_levels[0] + n_levels[1],) * 2)
+        n_components = connected_components(graph, directed=False)[0]
+        redundant += n_components - 1
+    return sum(n_levels) - redundant
+
 def _calc_aweights(aw):
     scaled_total = aw.sum() / len(aw)
     row_weights = np.sqrt(aw / scaled_total)
@@ -364,14 +859,13 @@ def _fe_nested_in_cluster(cluster_id, A):
     """ Check if FE's are nested within clusters (affects DOF correction). """
     if (cluster_id is None) or (A is None):
         return False
-    elif (cluster_id.name == A.name):
-        return True
-    else:
-        joint = pd.concat((cluster_id, A), axis=1)
-        names = [cluster_id.name, A.name]
-        pair_counts = joint.groupby(names)[A.name].count()
-        num_of_clusters = pair_counts.groupby(level=A.name).count()
-        return num_of_clusters.max() == 1
+    return _as_clusters(cluster_id).nests(A)
+
+def _as_clusters(cluster):
+    """ `cluster` as a `ClusterStructure` (built from a Series if needed). """
+    if isinstance(cluster, (ClusterStructure, BlockClusters)):
+        return cluster
+    return ClusterStructure(cluster)
 
 def _wrapSigma(Sigma, cols):
     return pd.DataFrame(Sigma, index=cols, columns=cols)
@@ -379,34 +873,310 @@ def _wrapSigma(Sigma, cols):
 
 class Regression(RegBase):
 
+    sparse_x = True
+
     def __init__(self, *args, **kwargs):
         super(Regression, self).__init__(*args, **kwargs)
 
     def estimate(self):
-        beta, xpx_inv = fitguts(self.y, self.x)
+        fwt = None if self.FWT is None else self.FWT.values
+        if isinstance(self.x, Design):
+            # Weight inside the float64 accumulation instead of scaling rows
+            beta, xpx_inv = fitguts(self.y, self.x, weights=fwt)
+        else:
+            y, x = self.y, self.x
+            if fwt is not None:
+                row_wt = np.sqrt(self.FWT)
+                y, x = y * row_wt, x.multiply(row_wt, axis=0)
+            if self._cache_entry is None:
+                beta, xpx_inv = fitguts(y, x)
+            else:
+                # Controls are partialled out with cached cross products
+                beta, xpx_inv = self._cache_entry.fit(y, x)
+        if isinstance(self.x, Float32Design):
+            beta, diag = _refine_float32(self.y, self.x, beta, xpx_inv,
+                                         self.downcast_err, weights=fwt)
         self.results = Results(beta=beta, xpx_inv=xpx_inv)
-        self.results.sst = self.y
+        if isinstance(self.x, Float32Design):
+            self.results._add_stat('float32_diag', diag)
+        self._set_sst(self.y)
+
+
+def _refine_float32(y, x, beta, xpx_inv, downcast_err, weights=None):
+    """
+    One step of iterative refinement of `beta` (residuals in float64) and
+    diagnostics of how far float32 regressors may move `beta`.
+    """
+    resid = np.asarray(y, dtype=np.float64) - x.dot(beta)
+    if weights is not None:
+        resid = weights * resid
+    delta = xpx_inv.dot(x.tdot(resid))
+    beta = beta + delta
+    # Condition number of X'X with columns scaled to unit length
+    xpx = la.inv(xpx_inv)
+    scale = 1 / np.sqrt(np.diagonal(xpx))
+    cond = la.cond(xpx * np.outer(scale, scale))
+    unit_roundoff = np.finfo(np.float32).eps / 2
+    diag = {
+        'cond': cond,
+        'downcast_err': downcast_err,
+        'refine_step': la.norm(delta) / max(la.norm(beta), 1e-300),
+        'err_bound': cond * max(downcast_err, unit_roundoff),
+    }
+    return beta, diag
+
+
+class BlockRegression(RegBase):
+    """
+    OLS on column data (memmaps, Arrow) read one block of rows at a time.
+    Only K-by-K cross products and a boolean sample flag are kept in memory.
+    """
+
+    def __init__(self, data, y_name, x_name, block_size=2**20, **kwargs):
+        self.source = ColumnSource(data)
+        self.y_name = y_name
+        self.x_name = force_list(x_name)
+        self.block_size = int(block_size)
+        self.__dict__.update(kwargs)
+
+        unsupported = [name for name in ('a_name', 'shac', 'hac', 'cache')
+                       if self.__dict__.get(name) is not None]
+        if self.collapse:
+            unsupported.append('collapse')
+        if self.dtype != 'float64':
+            unsupported.append('dtype')
+        if unsupported:
+            raise ValueError("Not supported with column data: {}".format(
+                ', '.join(unsupported)))
+        if self.awt_name is not None and self.fwt_name is not None:
+            raise ValueError("Cannot use analytic and frequency weights")
+        if self.block_size < 1:
+            raise ValueError("`block_size` must be positive")
+        self.vce_type = _set_vce_type(self.vce_type, self.cluster, None)
+        if self.vce_type not in (None, 'robust', 'hc1', 'cluster'):
+            raise ValueError("VCE type '{}' not supported with column "
+                             "data".format(self.vce_type))
+        if has_factor_terms(self.x_name, self.source.names):
+            raise ValueError("Factor variables are not supported with "
+                             "column data")
+        self.wt_name = (self.awt_name if self.awt_name is not None
+                        else self.fwt_name)
+        self.source.check([name for name in
+                           [self.y_name] + self.x_name +
+                           [self.wt_name, self.cluster] if name is not None])
+        self.x_cols = self.x_name + (['_cons'] if self.addcons else [])
+
+    def main(self):
+        self.estimate()
+        self.get_vce()
+        self.set_dof()
+        self.inference()
+
+        return self.results
+
+    def _blocks(self):
+        """
+        Rows of `y`, `x`, weights, and cluster IDs in the sample, one block
+        at a time. The sample is set on the first pass over the data.
+        """
+        first_pass = not hasattr(self, 'sample')
+        if first_pass:
+            sample = np.zeros(self.source.n_rows, dtype=bool)
+        for start in range(0, self.source.n_rows, self.block_size):
+            stop = min(start + self.block_size, self.source.n_rows)
+            cols = [self.source.floats(name, start, stop)
+                    for name in [self.y_name] + self.x_name]
+            wt = cluster_id = None
+            if self.wt_name is not None:
+                cols.append(self.source.floats(self.wt_name, start, stop))
+            if self.cluster is not None:
+                cluster_id, valid = self.source.values(self.cluster, start,
+                                                       stop)
+                cols.append((cluster_id, valid))
+            if first_pass:
+                in_sample = np.logical_and.reduce(
+                    [valid for __, valid in cols])
+                sample[start:stop] = in_sample
+            else:
+                in_sample = self.sample.values[start:stop]
+            if not in_sample.any():
+                continue
+            values = [v[in_sample] for v, __ in cols]
+            y = values[0]
+            x = [values[1 + j] for j in range(len(self.x_name))]
+            if self.addcons:
+                x.append(np.ones(len(y)))
+            if self.wt_name is not None:
+                wt = values[1 + len(self.x_name)]
+            if self.cluster is not None:
+                cluster_id = values[-1]
+            yield y, np.column_stack(x), wt, cluster_id
+        if first_pass:
+            self.sample = pd.Series(sample)
+
+    def estimate(self):
+        K = len(self.x_cols)
+        # Weighted means and centered cross products of `x` and `y`
+        moments = (0., np.zeros(K + 1), np.zeros((K + 1, K + 1)))
+        n = wt_sum = 0.
+        # Shifted sums for the total sum of squares
+        shift = None
+        dev_sum = dev_sq = 0.
+        for y, x, wt, __ in self._blocks():
+            if wt is not None:
+                wt_sum += wt.sum()
+            moments = _merge_cross(
+                moments, _cross_moments(np.column_stack((x, y)), wt))
+            n += len(y)
+            # Analytic weights scale `y` by root weights, as in `Regression`
+            t = y * np.sqrt(wt) if self.awt_name is not None else y
+            if shift is None:
+                shift = t.mean()
+            dev = t - shift
+            if self.fwt_name is not None:
+                dev_sum += wt.dot(dev)
+                dev_sq += wt.dot(dev ** 2)
+            else:
+                dev_sum += dev.sum()
+                dev_sq += dev.dot(dev)
+        if n == 0:
+            raise ValueError("No observations in the sample")
+
+        scale = 1.
+        if self.awt_name is not None:
+            # Normalize analytic weights to mean 1 in the sample
+            scale = n / wt_sum
+            sst = scale * (dev_sq - dev_sum ** 2 / n)
+            self._awt_scale = scale
+        elif self.fwt_name is not None:
+            sst = dev_sq - dev_sum ** 2 / wt_sum
+        else:
+            sst = dev_sq - dev_sum ** 2 / n
+        self._n_rows, self._wt_sum = int(n), wt_sum
+
+        wt_total, mean, dev_cross = moments
+        cross = scale * (dev_cross + wt_total * np.outer(mean, mean))
+        xpx_inv = la.inv(cross[:K, :K])
+        beta = pd.Series(xpx_inv.dot(cross[:K, K]), index=self.x_cols)
+        self.results = Results(beta=beta, xpx_inv=xpx_inv)
+        self.results._sst = sst
+        # SSR from centered moments; `y'y - b'X'y` cancels if `y` has a
+        # large mean
+        coef = np.append(-beta.values, 1)
+        self.results._ssr = scale * (coef.dot(dev_cross).dot(coef) +
+                                     wt_total * mean.dot(coef) ** 2)
+
+    def get_vce(self):
+        """ VCE, with residuals found in a second pass if needed. """
+        xpx_inv = self.results.xpx_inv
+        beta = self.results.beta.values
+        if self.vce_type is None:
+            n = self._wt_sum if self.fwt_name is not None else self._n_rows
+            vce = self.results.ssr / n * xpx_inv
+        else:
+            K = len(beta)
+            meat = np.zeros((K, K))
+            self.clusters = (BlockClusters(K) if self.vce_type == 'cluster'
+                             else None)
+            for y, x, wt, cluster_id in self._blocks():
+                u = y - x.dot(beta)
+                # Scores as `Regression` weights them (see `get_vce` there)
+                if self.awt_name is not None:
+                    u = self._awt_scale * wt * u
+                elif self.fwt_name is not None:
+                    u = (wt * u if self.clusters is not None
+                         else np.sqrt(wt) * u)
+                xu = x * u[:, np.newaxis]
+                if self.clusters is None:
+                    meat += xu.T.dot(xu)
+                else:
+                    self.clusters.add(cluster_id, xu)
+            if self.clusters is not None:
+                meat = self.clusters.meat()
+            vce = sandwich(xpx_inv, meat, xpx_inv.T)
+
+        vce = _wrapSigma((vce + vce.T) / 2, self.results.beta.index)
+        self.results._add_stat('vce', vce)
+        self.results._add_stat('sample', self.sample)
+        self.results._add_stat('singletons', [])
+
+    def _set_NK(self):
+        N = self._n_rows
+        if self.fwt_name is not None:
+            N = self._wt_sum
+            N = int(N) if float(N).is_integer() else N
+        self.results._nocons = self.nocons
+        return N, len(self.x_cols)
+
+
+def _cross_moments(z, wt=None):
+    """
+    Sum of weights, weighted column means, and weighted cross products of
+    the deviations from the means of the columns of `z`.
+    """
+    if wt is None:
+        wt_total = len(z)
+        mean = z.mean(axis=0)
+        dev = z - mean
+        return wt_total, mean, dev.T.dot(dev)
+    wt_total = wt.sum()
+    mean = wt.dot(z) / wt_total
+    dev = z - mean
+    return wt_total, mean, (dev * wt[:, np.newaxis]).T.dot(dev)
+
+
+def _merge_cross(a, b):
+    """ Combine the `_cross_moments` of two samples (Chan et al.). """
+    n_a, mean_a, cross_a = a
+    n_b, mean_b, cross_b = b
+    n = n_a + n_b
+    if n == 0:
+        return a
+    delta = mean_b - mean_a
+    return (n, mean_a + delta * n_b / n,
+            cross_a + cross_b + np.outer(delta, delta) * n_a * n_b / n)
 
 
 class IVReg(RegBase):
 
+    zcat_name = None
+
     def __init__(self, df, y_name, x_name, z_name, w_name, **kwargs):
         super(IVReg, self).__init__(df, y_name, x_name, **kwargs)
         # Handle extra variable stuff for IV
         self.z_name = force_list(z_name)
         self.w_name = force_list(w_name)
-        self.sample_cols_labels += ('z_name', 'w_name')
-        self.sample_store_labels += ('z', 'w')
+        self._parse_factor_vars('z_name', 'z')
+        self._parse_factor_vars('w_name', 'w')
+        self.sample_cols_labels += ('z_name', 'w_name', 'zcat_name')
+        self.sample_store_labels += ('z', 'w', 'ZC')
         self.vars_in_reg += ('z', 'w')
         self.add_constant_to = 'w'
 
+    def _singleton_groups(self):
+        names = super(IVReg, self)._singleton_groups()
+        jackknife = self.iv_method in ('jive', 'ujive')
+        if self.zcat_name and jackknife:
+            names = names + [self.zcat_name]
+        return names
+
     def estimate(self):
         y = self.y
         x = self.x
         w = self.w
         z = self.z
 
-        if self.iv_method == '2sls':
+        if self.ZC is not None:
+            if self.iv_method not in ('2sls', 'jive', 'ujive'):
+                raise ValueError("IV method '{}' not supported with "
+                                 "`zcat_name`".format(self.iv_method))
+            self.Xhat, self.Xtrue = self._cat_first_stage(
+                x, w, z, loo=(self.iv_method != '2sls'),
+                unbiased=(self.iv_method == 'ujive'))
+            beta, xpx_inv = fit_iv(y, self.Xhat, self.Xtrue, self.vce_type,
+                                   k_own=self._ujive_k())
+
+        elif self.iv_method == '2sls':
             self.Xhat, self.Xtrue = self._first_stage(x, w, z)
             beta, xpx_inv = fitguts(self.y, self.Xhat)
 
@@ -415,9 +1185,20 @@ class IVReg(RegBase):
                 y, x, z, w, self._kappa_debug, self.vce_type
             )
 
+        elif self.iv_method in ('gmm2s', 'igmm'):
+            beta, xpx_inv, self.Xhat, self.Xtrue, J, gmm_iter = self._gmm(
+                y, x, z, w, iterate=(self.iv_method == 'igmm')
+            )
+
+        elif self.iv_method in ('jive', 'ujive'):
+            self.Xhat, self.Xtrue = self._jive_first_stage(
+                x, w, z, unbiased=(self.iv_method == 'ujive'))
+            beta, xpx_inv = fit_iv(y, self.Xhat, self.Xtrue, self.vce_type,
+                                   k_own=self._ujive_k())
+
         else:
             raise ValueError(
-                "IV method '{}' not supported".format(self.method))
+                "IV method '{}' not supported".format(self.iv_method))
 
         self.results = Results(beta=beta, xpx_inv=xpx_inv)
         self.results.sst = self.y
@@ -426,6 +1207,41 @@ class IVReg(RegBase):
         self.results._add_stat('iv_method', self.iv_method)
         if self.iv_method == 'liml':
             self.results._add_stat('kappa', kappa)
+        elif self.iv_method in ('gmm2s', 'igmm'):
+            J_df = z.shape[1] - x.shape[1]
+            self.results._add_stat('J', J)
+            self.results._add_stat('J_df', J_df)
+            self.results._add_stat('J_p', stats.chi2.sf(J, J_df)
+                                   if J_df > 0 else np.nan)
+            self.results._add_stat('gmm_iter', gmm_iter)
+
+    def _ujive_k(self):
+        """ Number of UJIVE moments that leave out `w` (see `fit_iv`). """
+        if self.iv_method != 'ujive':
+            return 0
+        if self.vce_type in ('hc2', 'hc3'):
+            raise ValueError("VCE type '{}' not supported with UJIVE".format(
+                self.vce_type))
+        return self.x.shape[1]
+
+    def get_vce(self):
+        super(IVReg, self).get_vce()
+        if self.iv_method == 'ujive' and self.vce_type is not None:
+            self._ujive_vce()
+
+    def _ujive_vce(self):
+        """
+        Sandwich VCE for UJIVE. The bread `(Xhat'X)^-1` is not symmetric
+        because the moments for `x` leave out `w`. Scores use the structural
+        residual; `y - x*b` would add the fitted `w*gamma` to the meat.
+        """
+        Xhat = self.Xhat.values
+        u = self.results.resid.values
+        scores = Xhat * u[:, np.newaxis]
+        A = self.results.xpx_inv
+        vce = A.dot(self._score_meat(scores)).dot(A.T)
+        self.results._add_stat('vce', _wrapSigma((vce + vce.T) / 2,
+                                                 self.Xtrue.columns))
 
     def _first_stage(self, x, w, z):
         X = pd.concat((x, w), axis=1)
@@ -437,6 +1253,92 @@ class IVReg(RegBase):
             Xhat[an_x] = np.dot(Z, pi_hat)
         return Xhat, X
 
+    def _jive_first_stage(self, x, w, z, unbiased=False):
+        """
+        Leave-one-out first stage. If `h_i` is the leverage of obs `i`, its
+        leave-one-out fitted value is `(xhat_i - h_i*x_i)/(1 - h_i)`. For
+        UJIVE, the leave-one-out fit on `w` alone is subtracted.
+        """
+        X = pd.concat((x, w), axis=1)
+        Z = pd.concat((z, w), axis=1)
+        Xhat = X.copy()
+        Xhat[x.columns] = _loo_fitted(x.values, Z.values)
+        if unbiased and not w.empty:
+            Xhat[x.columns] -= _loo_fitted(x.values, w.values)
+        return Xhat, X
+
+    def _cat_first_stage(self, x, w, z, loo=False, unbiased=False):
+        """
+        First stage on categorical instrument `ZC` plus columns `z` and `w`
+        without creating dummies. With `D` the instrument dummies (after
+        within transformation and re-weighting), the projection onto
+        `[D, Zc]` is `P_D + P_{M_D Zc}` where `P_D` is a group-mean operator.
+        """
+        codes = pd.factorize(self.ZC)[0]
+        row_wt = self.row_wt.values if self.AWT is not None else None
+        if self.A is not None:
+            if row_wt is not None:
+                raise ValueError("`zcat_name` with both `a_name` and "
+                                 "`awt_name` is not supported")
+            if isinstance(self.A, pd.DataFrame):
+                raise ValueError("`zcat_name` with several `a_name`s is not "
+                                 "supported")
+            A_codes = pd.factorize(self.A)[0]
+            nested = _is_nested(codes, A_codes)
+            if loo and not nested:
+                raise ValueError("`a_name` must nest `zcat_name` for "
+                                 "leave-one-out estimators")
+            fe_codes = [codes, A_codes]
+        else:
+            nested = False
+            fe_codes = [codes]
+
+        def resid_on_D(v):
+            # `v` has already been demeaned by `A`, so `P_{M_A D} v = v -
+            # M_{A,D} v`
+            if row_wt is None:
+                return demean_multi(fe_codes, v)
+            wt_ss = np.bincount(codes, weights=row_wt ** 2)
+            coef = group_sums(codes, v * _col(row_wt, v)) / _col(wt_ss, v)
+            return v - coef[codes] * _col(row_wt, v)
+
+        Zc = pd.concat((z, w), axis=1).values
+        if Zc.shape[1] > 0:
+            Zc_resid = resid_on_D(Zc)
+            # Drop columns spanned by `D` (e.g., a constant)
+            keep = (np.sqrt((Zc_resid ** 2).sum(axis=0)) >
+                    1e-8 * np.sqrt((Zc ** 2).sum(axis=0)))
+            Zc_resid = Zc_resid[:, keep]
+            Zc = Zc[:, keep]
+        if Zc.shape[1] > 0:
+            ZZ_inv = la.inv(Zc_resid.T.dot(Zc_resid))
+
+        X = pd.concat((x, w), axis=1)
+        Xhat = X.copy()
+        xv = x.values
+        xhat = xv - resid_on_D(xv)
+        if Zc.shape[1] > 0:
+            xhat += Zc_resid.dot(ZZ_inv.dot(Zc_resid.T.dot(xv)))
+
+        if loo:
+            # Leverage of `[D, Zc]` is that of `D` plus that of `M_D Zc`
+            if row_wt is None:
+                h = 1 / np.bincount(codes)[codes].astype(np.float64)
+            else:
+                h = row_wt ** 2 / np.bincount(codes,
+                                              weights=row_wt ** 2)[codes]
+            if nested:
+                h -= 1 / np.bincount(A_codes)[A_codes].astype(np.float64)
+            if Zc.shape[1] > 0:
+                h += _get_h(Zc_resid, ZZ_inv)
+            h = h[:, np.newaxis]
+            xhat = (xhat - h * xv) / (1 - h)
+            if unbiased and not w.empty:
+                xhat -= _loo_fitted(xv, w.values)
+
+        Xhat[x.columns] = xhat
+        return Xhat, X
+
     def _liml(self, y, x, z, w, _kappa_debug, vce_type):
         Z = pd.concat((z, w), axis=1)
         kappa, ZZ_inv = self._liml_kappa(y, x, w, Z)
@@ -489,6 +1391,65 @@ class IVReg(RegBase):
         kappa = np.min(eigs)
         return kappa, ZZ_inv
 
+    def _gmm(self, y, x, z, w, iterate=False, tol=1e-10, maxiter=200):
+        """
+        Efficient GMM. Moments `Z'y` and `Z'X` are built once; each step only
+        re-weights them using the scores from the previous step's residuals.
+        """
+        X = pd.concat((x, w), axis=1)
+        Z = pd.concat((z, w), axis=1)
+        Zv = Z.values
+        ZX = Zv.T.dot(X.values)
+        Zy = Zv.T.dot(y.values)
+        ZZ = Zv.T.dot(Zv)
+
+        # First step is 2SLS
+        W = la.inv(ZZ)
+        beta = _gmm_beta(ZX, Zy, W)
+        u = y.values - X.values.dot(beta)
+        gmm_iter = 1
+        # Homoskedastic efficient GMM is 2SLS; keep `W` unscaled for the VCE
+        if self.vce_type is not None:
+            for gmm_iter in range(2, maxiter + 2):
+                W = la.inv(self._gmm_meat(Zv, u))
+                new_beta = _gmm_beta(ZX, Zy, W)
+                u = y.values - X.values.dot(new_beta)
+                change = np.max(np.abs(new_beta - beta))
+                beta = new_beta
+                if not iterate or change <= tol * (1 + np.max(np.abs(beta))):
+                    break
+            else:
+                raise ValueError("Iterated GMM did not converge")
+
+        Zu = Zv.T.dot(u)
+        if self.vce_type is None:
+            J = Zu.dot(W).dot(Zu) / (u.dot(u) / u.shape[0])
+        else:
+            J = Zu.dot(W).dot(Zu)
+
+        WZX = W.dot(ZX)
+        xpx_inv = la.inv(ZX.T.dot(WZX))
+        Xhat = pd.DataFrame(Zv.dot(WZX), columns=X.columns, index=X.index)
+        beta = pd.Series(beta, index=X.columns)
+        return beta, xpx_inv, Xhat, X, J, gmm_iter
+
+    def _gmm_meat(self, Z, u):
+        """ Outer product of moment scores `Z*u` implied by `vce_type`. """
+        return self._score_meat(Z * u[:, np.newaxis])
+
+    def _score_meat(self, Zu):
+        """ Outer product of moment scores `Zu` implied by `vce_type`. """
+        if self.vce_type in ('robust', 'hc1', 'hc2', 'hc3'):
+            return _meat_robust(Zu)
+        elif self.vce_type == 'cluster':
+            return _meat_cluster(Zu, self.clusters)
+        elif self.vce_type == 'shac':
+            return _meat_shac(Zu, *self._shac_args())
+        elif self.vce_type in ('hac', 'driscoll-kraay'):
+            return _meat_hac(Zu, *self._hac_args())
+        else:
+            raise ValueError
+
     def _prep_inference_mats(self):
         """
         In 2SLS, true X is used to calculate residuals, Xhat used in sandwich
@@ -505,19 +1466,76 @@ class IVReg(RegBase):
         return N, K
 
 
-def fitguts(y, x):
-    """ Checks dimensions, inverts, returns beta estimate and (X'X)^-1 """
+def fitguts(y, x, weights=None):
+    """
+    Checks dimensions, inverts, returns beta estimate and (X'X)^-1. Row
+    `weights` are only supported for `Design` regressors.
+    """
     # Y should be 1D
     assert y.ndim == 1
     # X should be 2D
     assert x.ndim == 2
 
-    xpx_inv = la.inv(np.dot(x.T, x))
-    xpy = np.dot(x.T, y)
+    if isinstance(x, Design):
+        if weights is None:
+            xpx_inv = la.inv(x.gram())
+            xpy = x.tdot(y)
+        else:
+            xpx_inv = la.inv(x.gram(weights))
+            xpy = x.tdot(weights * np.asarray(y))
+    else:
+        xpx_inv = la.inv(np.dot(x.T, x))
+        xpy = np.dot(x.T, y)
     beta = pd.Series(np.dot(xpx_inv, xpy).squeeze(), index=x.columns)
 
     return beta, xpx_inv
 
+def _xdot(x, beta):
+    """ `x*beta` for DataFrame or `Design` regressors `x`. """
+    if isinstance(x, Design):
+        return x.dot(beta)
+    return np.dot(x, beta)
+
+def fit_iv(y, Xhat, X, vce_type, k_own=0):
+    """
+    Just-identified IV using constructed instruments `Xhat`. Returns beta and
+    the bread for the sandwich estimator; with `vce_type=None` this is the
+    full homoskedastic sandwich `A Xhat'Xhat A'`, `A = (Xhat'X)^-1`. The
+    moments of the first `k_own` instruments only involve the first `k_own`
+    regressors (UJIVE), so the rest of their rows of `Xhat'X` are zero.
+    """
+    XhatX = np.asarray(np.dot(Xhat.T, X), dtype=np.float64)
+    XhatX[:k_own, k_own:] = 0
+    xpx_inv = la.inv(XhatX)
+    beta = pd.Series(xpx_inv.dot(np.dot(Xhat.T, y)), index=X.columns)
+    if vce_type is None:
+        xpx_inv = xpx_inv.dot(np.dot(Xhat.T, Xhat)).dot(xpx_inv.T)
+    return beta, xpx_inv
+
+def _loo_fitted(x, Z):
+    """ Leave-one-out fitted values from regressing `x` on `Z`. """
+    ZZ_inv = la.inv(Z.T.dot(Z))
+    fitted = Z.dot(ZZ_inv.dot(Z.T.dot(x)))
+    h = _get_h(Z, ZZ_inv)[:, np.newaxis]
+    return (fitted - h * x) / (1 - h)
+
+def _col(a, like):
+    """ Reshape 1D `a` to broadcast against the rows of `like`. """
+    return a if like.ndim == 1 else a[:, np.newaxis]
+
+def _is_nested(inner, outer):
+    """ Check if each group in codes `inner` is inside one `outer` group. """
+    order = np.argsort(inner, kind='mergesort')
+    inner_sorted = inner[order]
+    outer_sorted = outer[order]
+    same_inner = inner_sorted[1:] == inner_sorted[:-1]
+    return not np.any(same_inner & (outer_sorted[1:] != outer_sorted[:-1]))
+
+def _gmm_beta(ZX, Zy, W):
+    """ GMM estimate from moments `Z'X`, `Z'y` and weight matrix `W`. """
+    WZX = W.dot(ZX)
+    return la.solve(ZX.T.dot(WZX), WZX.T.dot(Zy))
+
 
 # Results class
 class Results(object):
@@ -544,6 +1562,16 @@ class Results(object):
         sst (float): Total sum of squares.
         yhat (array): Fit values (:math:`X\\hat{\\beta}`)
         resid (array): Regression residuals (:math:`\\hat{\\varepsilon}`)
+        float32_diag (dict): Only if ``dtype='float32'``. Precision
+            diagnostics: ``cond``, the condition number of the scaled
+            :math:`X'X`; ``downcast_err``, the largest relative rounding
+            error from casting the regressors to float32 (0 if they were
+            already float32); ``refine_step``, the relative size of the
+            iterative refinement step; and ``err_bound``, a rough first-order
+            bound on the relative error in ``beta`` compared to float64
+            regressors (``cond`` times the larger of ``downcast_err`` and
+            float32 unit roundoff). Values well below the precision needed
+            (e.g., 1e-4) mean float32 is safe.
         sample (array): Boolean array the same length of DataFrame passed to
             original regression function. Row is `True` is the observation is
             included in the regression, `False` otherwise. Regression function
@@ -628,6 +1656,41 @@ class Results(object):
                 1 - (self.ssr/(self.N - self.K))/(self.sst/(self.N - 1)))
             return self._r2_a
 
+    def fixed_effects(self, tol=1e-10, maxiter=None):
+        """Estimates of the fixed effects absorbed with ``a_name`` (requires
+        ``save_fe=True`` when estimating).
+
+        With one fixed effect, these are group means of
+        :math:`y - X\\hat\\beta`. With several, they are found by LSQR on
+        the sparse matrix of group dummies and normalized so that each fixed
+        effect after the first has mean zero over the sample (the first
+        absorbs the constant). Fixed effects are not separately identified
+        across disconnected groups; there, LSQR picks the minimum-norm
+        solution.
+
+        Keyword Args:
+            tol (float): Defaults to 1e-10. LSQR tolerance (several fixed
+                effects only).
+            maxiter (int): Maximum LSQR iterations (several fixed effects
+                only).
+
+        Returns:
+            Series: Fixed effect for each group, indexed by group, if
+            ``a_name`` was a single name. Otherwise, a dict of such Series
+            keyed by fixed-effect name.
+        """
+        fe = getattr(self, '_fe', None)
+        if fe is None:
+            raise ValueError("No fixed effects saved; estimate with `a_name` "
+                             "and `save_fe=True`")
+        alphas = recover_fixed_effects(fe['codes_list'], fe['target'],
+                                       weights=fe['weights'], tol=tol,
+                                       maxiter=maxiter)
+        out = {name: pd.Series(alpha, index=pd.Index(level, name=name))
+               for name, level, alpha in zip(fe['names'], fe['levels'],
+                                             alphas)}
+        return out[fe['names'][0]] if fe['single'] else out
+
     def Ftest(self, col_names, equal=False):
         """F test using regression results.
 
@@ -662,6 +1725,66 @@ class Results(object):
 
         return f_test(V, R, beta, r, self.df_r)
 
+    def Ftest_batch(self, col_groups, equal=False):
+        """F tests of many groups of regressors at once.
+
+        Args:
+            col_groups (list or dict): Groups of regressor names, each
+                tested like ``col_names`` in
+                :py:meth:`~econtools.metrics.core.Results.Ftest`. A dict
+                labels each group by its key.
+
+        Keyword Args:
+            equal (bool): Defaults to False. If True, test if all
+                coefficients in each group are equal. If False, test if each
+                group is jointly significant.
+
+        Returns:
+            DataFrame: Columns ``F`` and ``pF``, one row per group (indexed by
+            the keys of ``col_groups`` if it's a dict).
+        """
+        if isinstance(col_groups, dict):
+            labels, groups = list(col_groups.keys()), col_groups.values()
+        else:
+            labels, groups = None, col_groups
+        K = len(self.beta)
+        position = dict(zip(self.beta.index, range(K)))
+        R = []
+        for cols in groups:
+            idx = np.array([position[col] for col in force_list(cols)])
+            if equal:
+                R_group = np.zeros((len(idx) - 1, K))
+                R_group[np.arange(len(idx) - 1), idx[:-1]] = 1
+                R_group[np.arange(len(idx) - 1), idx[1:]] = -1
+            else:
+                R_group = np.zeros((len(idx), K))
+                R_group[np.arange(len(idx)), idx] = 1
+            R.append(R_group)
+        F, pF = f_test_batch(self.vce.values, R, self.beta.values,
+                             df_d=self.df_r)
+        return pd.DataFrame({'F': F, 'pF': pF}, index=labels)
+
+    def Ftest_nl(self, func, r=None, jac=None):
+        """F test of nonlinear restrictions by the delta method.
+
+        Args:
+            func (function): Takes the coefficients (a Series like ``beta``)
+                and returns the value(s) of the restrictions. The null is
+                ``func(beta) == r``.
+
+        Keyword Args:
+            r (array): Null values. Defaults to zeros.
+            jac (function): Returns the Jacobian of ``func`` (restrictions
+                by coefficients). Defaults to central finite differences.
+
+        Returns:
+            tuple: A tuple containing:
+                - **F** (float): F-stat.
+                - **pF** (float): p-score for ``F``.
+        """
+        return f_test_nl(self.vce.values, func, self.beta, self.df_r, r=r,
+                         jac=jac)
+
     @property
     def F(self):
         """F-stat for 'are all *slope* coefficients zero?'"""
@@ -701,14 +1824,128 @@ def f_test(V, R, beta, r, df_d):
     if Rbr.ndim == 1:
         Rbr = Rbr.reshape(-1, 1)
 
-    middle = la.inv(R.dot(V).dot(R.T))
+    RVR = np.atleast_2d(R.dot(V).dot(R.T))
     df_n = matrix_rank(R)
     # Can't just squeeze, or we get a 0-d array
-    F = (Rbr.T.dot(middle).dot(Rbr)/df_n).flatten()[0]
+    F = (Rbr.T.dot(la.solve(RVR, Rbr))/df_n).flatten()[0]
     pF = 1 - stats.f.cdf(F, df_n, df_d)
     return F, pF
 
 
+def f_test_batch(V, R, beta, r=None, df_d=None):
+    """Many F tests against a single factorization of ``V``.
+
+    Args:
+        V (array): K-by-K variance-covariance matrix.
+        R (list or array): Test matrices. A list of q-by-K arrays (``q`` may
+            differ across tests), an n-by-q-by-K array, or an n-by-K array
+            of linear combinations, each its own test of one restriction.
+        beta (array): Length-K vector of coefficient estimates.
+
+    Keyword Args:
+        r (list or array): Null values for each test, matching ``R``.
+            Defaults to zeros.
+        df_d (int): Denominator degrees of freedom.
+
+    Returns:
+        tuple: A tuple containing:
+            - **F** (array): F-stat of each test.
+            - **pF** (array): p-score of each ``F``.
+
+    Notes:
+        With :math:`V = LL'` found once, each test's
+        :math:`RVR' = (RL)(RL)'`. Tests with the same number of restrictions
+        are stacked and solved together, without inverting
+        :math:`RVR'`.
+    """
+    beta = np.asarray(beta, dtype=np.float64)
+    if isinstance(R, np.ndarray) and R.ndim == 2:
+        R = R[:, np.newaxis, :]
+    R = [np.atleast_2d(np.asarray(R_i, dtype=np.float64)) for R_i in R]
+    if r is None:
+        r = [np.zeros(len(R_i)) for R_i in R]
+    else:
+        r = [np.atleast_1d(np.asarray(r_i, dtype=np.float64)) for r_i in r]
+    L = _psd_factor(V)
+    n_restrict = np.array([len(R_i) for R_i in R])
+    F = np.empty(len(R))
+    df_n = np.empty(len(R), dtype=np.int64)
+    for q in np.unique(n_restrict):
+        tests = np.flatnonzero(n_restrict == q)
+        R_q = np.stack([R[i] for i in tests])
+        Rbr = R_q.dot(beta) - np.stack([r[i] for i in tests])
+        F[tests], df_n[tests] = _wald_stack(R_q.dot(L), Rbr,
+                                            matrix_rank(R_q))
+    pF = stats.f.sf(F, df_n, df_d)
+    return F, pF
+
+
+def f_test_nl(V, func, beta, df_d, r=None, jac=None, eps=1e-6):
+    """F test of nonlinear restrictions ``func(beta) == r`` by the delta
+    method.
+
+    Args:
+        V (array): K-by-K variance-covariance matrix.
+        func (function): Takes ``beta`` and returns the value(s) of the
+            restrictions.
+        beta (array or Series): Length-K vector of coefficient estimates.
+            Passed to ``func`` (and ``jac``) as is.
+        df_d (int): Denominator degrees of freedom.
+
+    Keyword Args:
+        r (array): Null values. Defaults to zeros.
+        jac (function): Returns the q-by-K Jacobian of ``func``. Defaults to
+            central finite differences with relative step ``eps``.
+
+    Returns:
+        tuple: A tuple containing:
+            - **F** (float): F-stat.
+            - **pF** (float): p-score for ``F``.
+    """
+    g = np.atleast_1d(np.asarray(func(beta), dtype=np.float64))
+    if r is not None:
+        g = g - np.atleast_1d(r)
+    if jac is None:
+        J = _jacobian(func, beta, eps)
+    else:
+        J = np.atleast_2d(np.asarray(jac(beta), dtype=np.float64))
+    F, df_n = _wald_stack(J.dot(_psd_factor(V))[np.newaxis], g[np.newaxis],
+                          np.array([matrix_rank(J)]))
+    return F[0], stats.f.sf(F[0], df_n[0], df_d)
+
+
+def _psd_factor(V):
+    """ `L` with `V = LL'` for a symmetric positive semi-definite `V`. """
+    eigval, eigvec = la.eigh(np.asarray(V, dtype=np.float64))
+    return eigvec * np.sqrt(np.clip(eigval, 0, None))
+
+
+def _wald_stack(RL, Rbr, df_n):
+    """
+    F-stats for a stack of tests: `RL` is n-by-q-by-K (`R` times the factor
+    of `V`), `Rbr` is n-by-q, and `df_n` is each test's rank.
+    """
+    RVR = np.matmul(RL, RL.transpose(0, 2, 1))
+    middle = la.solve(RVR, Rbr[..., np.newaxis])[..., 0]
+    return np.einsum('ij,ij->i', Rbr, middle) / df_n, df_n
+
+
+def _jacobian(func, beta, eps):
+    """ Central-difference Jacobian of `func` at `beta`. """
+    b = np.asarray(beta, dtype=np.float64)
+    steps = eps * np.maximum(np.abs(b), 1)
+    columns = []
+    for j, step in enumerate(steps):
+        shift = np.zeros(len(b))
+        shift[j] = step
+        up, down = b + shift, b - shift
+        if isinstance(beta, pd.Series):
+            up, down = (pd.Series(v, index=beta.index) for v in (up, down))
+        columns.append((np.atleast_1d(func(up)) -
+                        np.atleast_1d(func(down))) / (2 * step))
+    return np.column_stack(columns)
+
+
 # VCE estimators
 def vce_homosk(xpx_inv, resid):
     """ Standard OLS VCE with spherical errors. """
@@ -718,14 +1955,28 @@ def vce_homosk(xpx_inv, resid):
 
 
 def vce_robust(xpx_inv, resid, x):
+    if isinstance(x, Design):
+        B = x.gram(np.asarray(resid) ** 2)
+        return sandwich(xpx_inv, B, xpx_inv.T)
+
     xu = x.mul(resid, axis=0).values
 
-    B = xu.T.dot(xu)
+    B = _meat_robust(xu)
     vce = sandwich(xpx_inv, B, xpx_inv.T)
     return vce
 
 
 def vce_hc23(xpx_inv, resid, x, hctype='hc2'):
+    if isinstance(x, Design):
+        h = x.leverage(xpx_inv)
+        if hctype == 'hc2':
+            B = x.gram(np.asarray(resid) ** 2 / (1 - h))
+        elif hctype == 'hc3':
+            B = x.gram(np.asarray(resid) ** 2 / (1 - h) ** 2)
+        else:
+            raise ValueError
+        return sandwich(xpx_inv, B, xpx_inv.T)
+
     xu = x.mul(resid, axis=0).values
     h = _get_h(x, xpx_inv)[:, np.newaxis]
     if hctype == 'hc2':
@@ -735,52 +1986,251 @@ def vce_hc23(xpx_inv, resid, x, hctype='hc2'):
     else:
         raise ValueError
 
-    B = xu.T.dot(xu)
+    B = _meat_robust(xu)
     vce = sandwich(xpx_inv, B, xpx_inv.T)
     return vce
 
-def _get_h(x, xpx_inv):
+def _get_h(x, xpx_inv, chunk_size=2**16):
+    """ Leverage `x_i (X'X)^-1 x_i'` of each row, in vectorized chunks. """
+    x = np.asarray(x)
     n = x.shape[0]
-    h = np.zeros(n)
-    for i in range(n):
-        x_row = x.iloc[i, :]
-        h[i] = x_row.dot(xpx_inv).dot(x_row)
+    h = np.empty(n)
+    for start in range(0, n, chunk_size):
+        x_chunk = x[start:start + chunk_size]
+        h[start:start + chunk_size] = np.einsum(
+            'ij,ij->i', x_chunk.dot(xpx_inv), x_chunk)
     return h
 
 
 def vce_cluster(xpx_inv, resid, x, cluster):
+    cluster = _as_clusters(cluster)
+    if isinstance(x, Design):
+        B = x.cluster_meat(resid, cluster.codes)
+        return sandwich(xpx_inv, B, xpx_inv.T)
+
     raw_xu = x.mul(resid, axis=0).values
 
-    int_cluster = pd.factorize(cluster)[0]
-    xu = np.array([np.bincount(int_cluster, weights=raw_xu[:, col])
-                   for col in range(raw_xu.shape[1])]).T
+    B = _meat_cluster(raw_xu, cluster)
+    vce = sandwich(xpx_inv, B, xpx_inv.T)
+    return vce
+
+
+def vce_shac(xpx_inv, resid, x, shac_x, shac_y, shac_kern, shac_band,
+             shac_time=None, shac_lag=None, shac_metric='euclidean',
+             shac_n_jobs=1):
+    xu = x.mul(resid, axis=0).values
 
-    B = xu.T.dot(xu)
+    B = _meat_shac(xu, shac_x, shac_y, shac_kern, shac_band, shac_time,
+                   shac_lag, shac_metric, shac_n_jobs)
     vce = sandwich(xpx_inv, B, xpx_inv.T)
     return vce
 
 
-def vce_shac(xpx_inv, resid, x, shac_x, shac_y, shac_kern, shac_band):
+def vce_hac(xpx_inv, resid, x, time, panel, lags, kern, aggregate=False):
     xu = x.mul(resid, axis=0).values
-    Wxu = _shac_weights(xu, shac_x, shac_y, shac_kern, shac_band)
 
-    B = xu.T.dot(Wxu)
+    B = _meat_hac(xu, time, panel, lags, kern, aggregate)
     vce = sandwich(xpx_inv, B, xpx_inv.T)
     return vce
 
-def _shac_weights(xu, lon, lat, kernel, band):
-    N, K = xu.shape
-    Wxu = np.zeros((N, K))
 
-    lon_arr = lon.squeeze().values.astype(float)
-    lat_arr = lat.squeeze().values.astype(float)
+# Meat of sandwich estimators, shared by VCE and GMM weight matrices
+def _meat_robust(xu):
+    return xu.T.dot(xu)
+
+def _meat_cluster(raw_xu, cluster):
+    return _as_clusters(cluster).meat(raw_xu)
+
+def _meat_shac(xu, shac_x, shac_y, shac_kern, shac_band, shac_time=None,
+               shac_lag=None, shac_metric='euclidean', shac_n_jobs=1):
+    if shac_time is not None:
+        return _meat_shac_panel(xu, shac_x, shac_y, shac_kern, shac_band,
+                                shac_time, shac_lag, shac_metric)
+    elif shac_metric != 'euclidean':
+        # A cross section is a panel with one period
+        return _meat_shac_panel(xu, shac_x, shac_y, shac_kern, shac_band,
+                                np.zeros(xu.shape[0]), 0, shac_metric)
+    return _meat_shac_dense(xu, shac_x, shac_y, shac_kern, shac_band,
+                            shac_n_jobs)
+
+def _meat_shac_panel(xu, lon, lat, kernel, band, time, lag=None,
+                     metric='euclidean'):
+    """
+    Space-time Conley meat, with weight `k_s(d_ij) * k_t(|t_i - t_j|)` for
+    spatial kernel `k_s` and Bartlett kernel `k_t` over `lag` periods.
+    Scores are summed within (location, period) cells and the sparse
+    neighbor matrix of unique locations is built once, so the cost scales
+    with locations x neighbors x periods rather than (N x T)^2.
+    """
+    coords = np.column_stack((np.asarray(lon, dtype=np.float64).ravel(),
+                              np.asarray(lat, dtype=np.float64).ravel()))
+    loc_coords, loc = np.unique(coords, axis=0, return_inverse=True)
+    loc = loc.ravel()
+    t = np.asarray(time, dtype=np.float64).ravel()
+    if not np.all(t == np.round(t)):
+        raise ValueError("SHAC `time` must be integer-valued")
+    periods, t_codes = np.unique(t.astype(np.int64), return_inverse=True)
+    if lag is None:
+        lag = int(np.floor(4 * (len(periods) / 100) ** (2 / 9)))
+    time_kern = _hac_kernels('bartlett', lag)
+
+    L = loc_coords.shape[0]
+    W = _shac_neighbors(loc_coords, kernel, band, metric)
+    cells, cell_codes = np.unique(t_codes * L + loc, return_inverse=True)
+    scores = group_sums(cell_codes, xu, len(cells))
+    cell_t = cells // L
+    cell_loc = cells % L
+    bounds = np.searchsorted(cell_t, np.arange(len(periods) + 1))
+
+    meat = np.zeros((xu.shape[1], xu.shape[1]))
+    recent = []     # (period, W-weighted scores) within `lag` periods
+    for p in range(len(periods)):
+        locs = cell_loc[bounds[p]:bounds[p + 1]]
+        s = scores[bounds[p]:bounds[p + 1]]
+        Ws = np.asarray(W[:, locs].dot(s))
+        meat += s.T.dot(Ws[locs])
+        recent = [(q, Ws_q) for q, Ws_q in recent
+                  if periods[p] - periods[q] <= lag]
+        for q, Ws_q in recent:
+            gamma = s.T.dot(Ws_q[locs])
+            meat += time_kern(periods[p] - periods[q]) * (gamma + gamma.T)
+        recent.append((p, Ws))
+    return meat
+
+def _shac_neighbors(coords, kernel, band, metric='euclidean'):
+    """
+    Sparse (CSC) kernel weights between points within `band`. With
+    `metric='haversine'`, `coords` are (longitude, latitude) in degrees and
+    `band` is great-circle distance in km; neighbors are found with a KD-tree
+    of 3-D unit vectors, where chord length is monotone in arc length.
+    """
+    if metric == 'euclidean':
+        tree = cKDTree(coords)
+        dist = tree.sparse_distance_matrix(tree, band,
+                                           output_type='coo_matrix')
+    elif metric == 'haversine':
+        tree = cKDTree(_unit_vectors(coords[:, 0], coords[:, 1]))
+        angle = min(band / EARTH_RADIUS_KM, np.pi)
+        dist = tree.sparse_distance_matrix(tree, 2 * np.sin(angle / 2),
+                                           output_type='coo_matrix')
+        dist.data = 2 * EARTH_RADIUS_KM * np.arcsin(
+            np.minimum(dist.data / 2, 1))
+    else:
+        raise ValueError("SHAC metric '{}' not supported".format(metric))
+    off_diag = (dist.row != dist.col) & (dist.data <= band)
+    w = _shac_kernels(kernel, band)(dist.data[off_diag]).astype(np.float64)
+    W = sp.coo_matrix((w, (dist.row[off_diag], dist.col[off_diag])),
+                      shape=dist.shape)
+    # Each point's own weight, which may or may not be stored in `dist`
+    return (W + sp.identity(coords.shape[0])).tocsc()
+
+def _meat_shac_dense(xu, lon, lat, kernel, band, n_jobs=1, block=1024):
+    """
+    All-pairs SHAC meat, tiled into `block` x `block` tiles of observations.
+    Each tile's kernel weights multiply the scores as one matrix product, only
+    tiles on or above the diagonal are evaluated (the kernel is symmetric),
+    and tiles run on `n_jobs` threads (-1 for all cores), since NumPy releases
+    the GIL. Each thread adds its tiles to its own K-by-K sum as it goes.
+    """
+    lon_arr = np.asarray(lon, dtype=np.float64).ravel()
+    lat_arr = np.asarray(lat, dtype=np.float64).ravel()
     kern_func = _shac_kernels(kernel, band)
-    for i in range(N):
-        dist = np.sqrt((lon_arr[i] - lon_arr)**2 + (lat_arr[i] - lat_arr)**2)
-        w_i = kern_func(dist).astype(np.float64)
-        Wxu[i, :] = w_i.dot(xu)
+    starts = range(0, xu.shape[0], block)
+    n_tiles = len(starts) * (len(starts) + 1) // 2
+
+    def tile_meat(i, j):
+        rows, cols = slice(i, i + block), slice(j, j + block)
+        dist = np.sqrt((lon_arr[rows, np.newaxis] - lon_arr[cols])**2 +
+                       (lat_arr[rows, np.newaxis] - lat_arr[cols])**2)
+        gamma = xu[rows].T.dot(kern_func(dist).astype(np.float64)).dot(
+            xu[cols])
+        return gamma if i == j else gamma + gamma.T
+
+    def thread_meat(first, step=1):
+        """ Sum of every `step`-th tile starting with tile `first`. """
+        meat = np.zeros((xu.shape[1], xu.shape[1]))
+        tiles = ((i, j) for i in starts for j in starts if j >= i)
+        for i, j in islice(tiles, first, None, step):
+            meat += tile_meat(i, j)
+        return meat
+
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs > 1 and n_tiles > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            return sum(pool.map(partial(thread_meat, step=n_jobs),
+                                range(n_jobs)))
+    return thread_meat(0)
+
+def _meat_hac(xu, time, panel=None, lags=None, kern='bartlett',
+              aggregate=False):
+    """
+    Newey-West meat, `sum_l w_l (G_l + G_l')`, where `G_l` sums the
+    cross products of scores `l` periods apart (within `panel` units, if
+    any). If `aggregate` (Driscoll-Kraay), scores are first summed within
+    periods with `bincount`. Lagged pairs are matched by searching sorted
+    (unit, time) keys, so the cost is linear in rows (up to the sort).
+    """
+    t = np.asarray(time, dtype=np.float64)
+    if not np.all(t == np.round(t)):
+        raise ValueError("HAC `time` must be integer-valued")
+    t = t.astype(np.int64)
+    periods, t_codes = np.unique(t, return_inverse=True)
+    if lags is None:
+        lags = int(np.floor(4 * (len(periods) / 100) ** (2 / 9)))
+
+    if aggregate or panel is None:
+        keys = periods
+        scores = group_sums(t_codes, xu, len(periods))
+        if not aggregate and len(periods) < len(t):
+            raise ValueError("Repeated `time` values; pass `panel` or use "
+                             "'driscoll-kraay'")
+    else:
+        # Keys for units are far enough apart that lags stay within units
+        unit = pd.factorize(np.asarray(panel))[0].astype(np.int64)
+        span = periods[-1] - periods[0] + lags + 1
+        keys = unit * span + (t - periods[0] + lags)
+        scores = xu
+
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    if np.any(np.diff(sorted_keys) == 0):
+        raise ValueError("Repeated `time` values within `panel` units")
+
+    kern_func = _hac_kernels(kern, lags)
+    meat = scores.T.dot(scores)
+    for lag in range(1, lags + 1):
+        pos = np.minimum(np.searchsorted(sorted_keys, keys - lag),
+                         len(keys) - 1)
+        match = sorted_keys[pos] == keys - lag
+        gamma = scores[match].T.dot(scores[order[pos[match]]])
+        meat += kern_func(lag) * (gamma + gamma.T)
+    return meat
+
+def _hac_kernels(kernel, lags):
+
+    def bartlett(lag):
+        return 1 - lag / (lags + 1)
+
+    def parzen(lag):
+        z = lag / (lags + 1)
+        if z <= .5:
+            return 1 - 6 * z ** 2 + 6 * z ** 3
+        return 2 * (1 - z) ** 3
+
+    if kernel == 'bartlett':
+        return bartlett
+    elif kernel == 'parzen':
+        return parzen
+    else:
+        raise ValueError("HAC kernel '{}' not supported".format(kernel))
 
-    return Wxu
+def _unit_vectors(lon, lat):
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    return np.column_stack((np.cos(lat) * np.cos(lon),
+                            np.cos(lat) * np.sin(lon),
+                            np.sin(lat)))
 
 def _shac_kernels(kernel, band):
 
@@ -814,7 +2264,7 @@ def df_hc23(n, k):
 
 
 def df_cluster(n, k, cluster_id):
-    g = len(pd.value_counts(cluster_id))
+    g = _as_clusters(cluster_id).n_clusters
     df = g - 1
     vce_correct = ((n - 1) / (n - k)) * (g / (g - 1))
     return df, vce_correct, g
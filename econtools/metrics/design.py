@@ -0,0 +1,319 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+
+from econtools.metrics.regutil import group_sums
+
+
+class Design(object):
+    """
+    Base for regressor matrices that stand in for the regressor DataFrame
+    inside the regression core. Subclasses supply `multiply`, `dot`, `tdot`,
+    `gram`, `cluster_meat`, `leverage`, and `toarray`.
+    """
+
+    ndim = 2
+    empty = False
+
+    def to_frame(self):
+        return pd.DataFrame(self.toarray(), columns=self.columns)
+
+    def mul(self, v, axis=0):
+        """ Scale rows by `v`, returned as a dense DataFrame. """
+        return self.multiply(v, axis=axis).to_frame()
+
+
+class SparseDesign(Design):
+    """Regressor matrix with a dense block and a ``scipy.sparse`` block.
+
+    Stands in for the regressor DataFrame inside the regression core when
+    some regressors are sparse. Only K-by-K cross products are ever made
+    dense.
+
+    Args:
+        dense (array): N-by-Kd array of dense regressors (Kd may be 0).
+        sparse (sparse matrix): N-by-Ks sparse regressors.
+        columns (list): Kd + Ks regressor names, dense block first.
+
+    Keyword Args:
+        order (array): Positions (in block order) of the columns in the order
+            they are presented to the user, e.g. the original order of the
+            regressor DataFrame. Vectors and matrices passed to and returned
+            by all methods are in this order. Default is block order.
+    """
+
+    def __init__(self, dense, sparse, columns, order=None):
+        self.sparse = sp.csc_matrix(sparse, dtype=np.float64)
+        N = self.sparse.shape[0]
+        if dense is None:
+            dense = np.zeros((N, 0))
+        self.dense = np.asarray(dense, dtype=np.float64).reshape(N, -1)
+        self.shape = (N, self.dense.shape[1] + self.sparse.shape[1])
+        self.index = pd.RangeIndex(N)
+        if len(columns) != self.shape[1]:
+            raise ValueError("Wrong number of column names")
+        if order is None:
+            order = np.arange(self.shape[1])
+        self._order = np.asarray(order)
+        self._block_columns = pd.Index(columns)
+        self.columns = self._block_columns[self._order]
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Split DataFrame `df` into dense and sparse blocks. Returns `df`
+        unchanged if it has no sparse columns.
+        """
+        is_sparse = [isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes]
+        if not any(is_sparse):
+            return df
+        sparse_cols = [c for c, s in zip(df.columns, is_sparse) if s]
+        dense_cols = [c for c, s in zip(df.columns, is_sparse) if not s]
+        sparse = df[sparse_cols].astype(
+            pd.SparseDtype(np.float64, 0.)).sparse.to_coo()
+        # Position in block order of each original column
+        is_sparse = np.array(is_sparse)
+        kd = len(dense_cols)
+        order = np.empty(len(is_sparse), dtype=int)
+        order[~is_sparse] = np.arange(kd)
+        order[is_sparse] = kd + np.arange(len(sparse_cols))
+        return cls(df[dense_cols].values, sparse, dense_cols + sparse_cols,
+                   order=order)
+
+    @property
+    def _kd(self):
+        return self.dense.shape[1]
+
+    def _to_block(self, v):
+        """ Re-order vector `v` from presentation order to block order """
+        block = np.empty_like(v)
+        block[self._order] = v
+        return block
+
+    def _from_block_square(self, A):
+        return A[np.ix_(self._order, self._order)]
+
+    def toarray(self):
+        return np.hstack((self.dense, self.sparse.toarray()))[:, self._order]
+
+    def dot(self, beta):
+        """ `X*beta` """
+        beta = self._to_block(np.asarray(beta, dtype=np.float64))
+        return self.dense.dot(beta[:self._kd]) + self.sparse.dot(
+            beta[self._kd:])
+
+    def tdot(self, v):
+        """ `X'v` for a vector or matrix `v` """
+        v = np.asarray(v)
+        block = np.concatenate((self.dense.T.dot(v), self.sparse.T.dot(v)))
+        return block[self._order]
+
+    def multiply(self, v, axis=0):
+        """ Scale rows by `v` """
+        if axis != 0:
+            raise ValueError
+        v = np.asarray(v, dtype=np.float64)
+        return SparseDesign(self.dense * v[:, np.newaxis],
+                            sp.diags(v).dot(self.sparse),
+                            self._block_columns, order=self._order)
+
+    def gram(self, weights=None):
+        """ `X'WX` for diagonal weights `weights` (dense K-by-K) """
+        if weights is None:
+            right = self
+        else:
+            right = self.multiply(weights)
+        G = _block_gram(self.dense, self.sparse, right.dense, right.sparse)
+        return self._from_block_square(G)
+
+    def group_scores(self, codes, resid):
+        """
+        Sum rows of `X*resid` within integer groups `codes`. Returns dense
+        and sparse blocks.
+        """
+        resid = np.asarray(resid, dtype=np.float64)
+        n_groups = codes.max() + 1
+        dense = group_sums(codes, self.dense * resid[:, np.newaxis],
+                           n_groups)
+        N = self.shape[0]
+        incidence = sp.csr_matrix((resid, (codes, np.arange(N))),
+                                  shape=(n_groups, N))
+        sparse = incidence.dot(self.sparse)
+        return dense, sparse
+
+    def cluster_meat(self, resid, codes):
+        dense, sparse = self.group_scores(codes, resid)
+        return self._from_block_square(
+            _block_gram(dense, sparse, dense, sparse))
+
+    def leverage(self, xpx_inv, chunk_size=2**16):
+        """ `x_i (X'X)^-1 x_i'` for each row, in chunks """
+        N = self.shape[0]
+        h = np.empty(N)
+        # Re-order `xpx_inv` to block order
+        block_inv = np.empty_like(xpx_inv)
+        block_inv[np.ix_(self._order, self._order)] = xpx_inv
+        xpx_inv = block_inv
+        sparse = self.sparse.tocsr()
+        for start in range(0, N, chunk_size):
+            stop = min(start + chunk_size, N)
+            x_chunk = np.hstack((self.dense[start:stop],
+                                 sparse[start:stop].toarray()))
+            h[start:stop] = np.einsum('ij,ij->i', x_chunk.dot(xpx_inv),
+                                      x_chunk)
+        return h
+
+
+class Float32Design(Design):
+    """Dense regressor matrix stored in single precision.
+
+    Row-level data and products (e.g., rows scaled by weights) are kept in
+    float32. Every reduction over rows (cross products, score sums,
+    leverage, fitted values) upcasts one block of rows at a time and
+    accumulates in float64, so only K-by-K matrices and length-N vectors are
+    ever double precision.
+
+    Args:
+        values (array): N-by-K regressors.
+        columns (list): Regressor names.
+
+    Keyword Args:
+        chunk_size (int): Rows per block.
+    """
+
+    def __init__(self, values, columns, chunk_size=2**16):
+        self.values = np.asarray(values, dtype=np.float32)
+        self.columns = pd.Index(columns)
+        self.shape = self.values.shape
+        self.index = pd.RangeIndex(self.shape[0])
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_frame(cls, df, chunk_size=2**16):
+        return cls(df.values.astype(np.float32, copy=False), df.columns,
+                   chunk_size=chunk_size)
+
+    def _blocks(self):
+        """ Row slices with their rows upcast to float64 """
+        N = self.shape[0]
+        for start in range(0, N, self.chunk_size):
+            rows = slice(start, min(start + self.chunk_size, N))
+            yield rows, self.values[rows].astype(np.float64)
+
+    def toarray(self):
+        return self.values.astype(np.float64)
+
+    def dot(self, beta):
+        """ `X*beta` """
+        beta = np.asarray(beta, dtype=np.float64)
+        out = np.empty(self.shape[0])
+        for rows, x in self._blocks():
+            out[rows] = x.dot(beta)
+        return out
+
+    def tdot(self, v):
+        """ `X'v` for a vector or matrix `v` """
+        v = np.asarray(v, dtype=np.float64)
+        out = np.zeros((self.shape[1],) + v.shape[1:])
+        for rows, x in self._blocks():
+            out += x.T.dot(v[rows])
+        return out
+
+    def multiply(self, v, axis=0):
+        """ Scale rows by `v` """
+        if axis != 0:
+            raise ValueError
+        v = np.asarray(v, dtype=np.float64)
+        scaled = np.empty(self.shape, dtype=np.float32)
+        for rows, x in self._blocks():
+            scaled[rows] = x * v[rows, np.newaxis]
+        return Float32Design(scaled, self.columns, chunk_size=self.chunk_size)
+
+    def gram(self, weights=None):
+        """ `X'WX` for diagonal weights `weights` """
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+        out = np.zeros((self.shape[1], self.shape[1]))
+        for rows, x in self._blocks():
+            if weights is None:
+                out += x.T.dot(x)
+            else:
+                out += (x * weights[rows, np.newaxis]).T.dot(x)
+        return out
+
+    def cluster_meat(self, resid, codes):
+        resid = np.asarray(resid, dtype=np.float64)
+        n_groups = codes.max() + 1
+        scores = np.zeros((n_groups, self.shape[1]))
+        for rows, x in self._blocks():
+            scores += group_sums(codes[rows], x * resid[rows, np.newaxis],
+                                 n_groups)
+        return scores.T.dot(scores)
+
+    def leverage(self, xpx_inv, chunk_size=None):
+        """ `x_i (X'X)^-1 x_i'` for each row """
+        h = np.empty(self.shape[0])
+        for rows, x in self._blocks():
+            h[rows] = np.einsum('ij,ij->i', x.dot(xpx_inv), x)
+        return h
+
+
+def downcast_error(df):
+    """
+    Largest relative rounding error (per column, relative to the column's
+    largest absolute value) from casting DataFrame `df` to float32.
+    """
+    err = 0.
+    for __, col in df.items():
+        if col.dtype == np.float32:
+            continue
+        v = np.asarray(col, dtype=np.float64)
+        scale = np.max(np.abs(v)) if v.size else 0.
+        if scale > 0:
+            rounded = v.astype(np.float32).astype(np.float64)
+            err = max(err, np.max(np.abs(v - rounded)) / scale)
+    return err
+
+
+def _block_gram(dense_l, sparse_l, dense_r, sparse_r):
+    """ `[D_l, S_l]'[D_r, S_r]` with only the result made dense """
+    dd = dense_l.T.dot(dense_r)
+    ds = np.asarray(sparse_r.T.dot(dense_l)).T
+    sd = np.asarray(sparse_l.T.dot(dense_r))
+    ss = sparse_l.T.dot(sparse_r).toarray()
+    return np.block([[dd, ds], [sd, ss]])
+
+
+def is_sparse_frame(df):
+    """ Check if DataFrame `df` has any sparse columns. """
+    return isinstance(df, pd.DataFrame) and any(
+        isinstance(dtype, pd.SparseDtype) for dtype in df.dtypes)
+
+
+def as_float(df, keep_sparse=False, dtype=np.float64):
+    """
+    Cast Series/DataFrame `df` to floats of type `dtype`. Sparse columns stay
+    sparse (float64 with fill value 0) if `keep_sparse`, otherwise they are
+    made dense.
+    """
+    if not is_sparse_frame(df):
+        return df.astype(dtype, copy=False)
+    elif not keep_sparse:
+        return densify(df).astype(dtype, copy=False)
+    dtypes = {
+        col: (pd.SparseDtype(np.float64, 0.)
+              if isinstance(col_dtype, pd.SparseDtype) else dtype)
+        for col, col_dtype in df.dtypes.items()
+    }
+    return df.astype(dtypes)
+
+
+def densify(df):
+    """ Convert any sparse columns of DataFrame `df` to dense float64. """
+    if not is_sparse_frame(df):
+        return df
+    return pd.DataFrame(
+        {col: np.asarray(df[col], dtype=np.float64) for col in df.columns},
+        index=df.index, columns=df.columns)
@@ -0,0 +1,368 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from econtools.metrics.core import Results, _add_inference, _wrapSigma
+from econtools.metrics.regutil import group_sums
+
+
+def att_gt(df, y_name, unit_name, time_name, cohort_name,
+           control_group='nevertreated', base_period='varying',
+           cluster=None,
+           ):
+    """Group-time average treatment effects with staggered adoption.
+
+    Estimates Callaway and Sant'Anna's (2021) :math:`ATT(g, t)`, the effect
+    in period :math:`t` on units first treated in period :math:`g`, without
+    covariates, for every cohort and period at once.
+
+    Args:
+        df (DataFrame): Panel in long form.
+        y_name (str): Column name in ``df`` of the outcome.
+        unit_name (str): Column name in ``df`` of the unit ID.
+        time_name (str): Column name in ``df`` of the (numeric) period.
+        cohort_name (str): Column name in ``df`` of the period each unit is
+            first treated. Units never treated have 0, ``inf``, or a missing
+            value; units first treated after the last period are treated as
+            never treated, and units treated in the first period are dropped.
+
+    Keyword Args:
+        control_group (str): ``'nevertreated'`` (default) or
+            ``'notyettreated'``, which adds units not yet treated in the
+            period of interest and the base period.
+        base_period (str): ``'varying'`` (default) compares pre-treatment
+            periods to the period before, and ``'universal'`` compares all
+            periods to the one before treatment.
+        cluster (str): Column name in ``df`` of clusters of units. Defaults
+            to the units themselves.
+
+    Returns:
+        An :py:class:`~econtools.metrics.did.ATTResults` object with
+        ``beta`` (the :math:`ATT(g, t)`), ``vce``, and the usual inference
+        stats, indexed by ``(cohort, period)``, plus ``N`` (units), ``g``
+        (clusters, if ``cluster``), ``n_dropped`` (units dropped for
+        missing periods or being treated in the first period), and
+        ``aggregate`` for event-study, calendar, cohort, and overall
+        effects.
+
+    Notes:
+        The panel must be balanced; units missing an outcome in any period
+        are dropped. The data are reshaped once to units by periods, and a
+        single pass finds each cohort's mean outcome in every period and the
+        within-cohort covariances of outcomes across periods (or, with
+        ``cluster``, their sums within each cluster and cohort). Every
+        :math:`ATT(g, t)` is a contrast of cohort means, and its influence
+        function is a contrast of within-cohort deviations, so the VCE of all
+        cells (and of any weighted average of them) is found from these
+        moments without another pass. As in the analytical standard errors
+        of Callaway and Sant'Anna, the VCE is the sum of squared influence
+        functions (within clusters, if any) over :math:`N^2`. t-stats and F
+        tests use :math:`N - 1` (or clusters minus one) degrees of freedom.
+    """
+
+    DiDWorker = GroupTimeATT(
+        df, y_name, unit_name, time_name, cohort_name,
+        control_group=control_group, base_period=base_period,
+        cluster=cluster,
+    )
+
+    results = DiDWorker.main()
+    return results
+
+
+class ATTResults(Results):
+    """Results of :py:func:`~econtools.metrics.did.att_gt`.
+
+    Attributes:
+        event_time (Series): Period minus cohort of each :math:`ATT(g, t)`.
+        **Other attributes are as in
+            :py:class:`~econtools.metrics.core.Results`.
+    """
+
+    def aggregate(self, kind='dynamic'):
+        """Weighted averages of the group-time effects.
+
+        Args:
+            kind (str): Defaults to ``'dynamic'``. One of
+                - ``'dynamic'``: by event time (period minus cohort),
+                  including pre-treatment periods, weighting cohorts by
+                  size.
+                - ``'calendar'``: by period, over treated cohorts, weighting
+                  cohorts by size.
+                - ``'group'``: by cohort, the mean over its post-treatment
+                  periods.
+                - ``'simple'``: overall, the mean over post-treatment cells
+                  weighting cohorts by size.
+
+        Returns:
+            A :py:class:`~econtools.metrics.core.Results` object with
+            ``beta``, ``vce``, and the usual inference stats. Its VCE
+            accounts for cohort sizes being estimated.
+        """
+        return self._moments.aggregate(kind)
+
+
+class GroupTimeATT(object):
+    """ Worker for `att_gt`. """
+
+    def __init__(self, df, y_name, unit_name, time_name, cohort_name,
+                 control_group='nevertreated', base_period='varying',
+                 cluster=None):
+        if control_group not in ('nevertreated', 'notyettreated'):
+            raise ValueError("`control_group` must be 'nevertreated' or "
+                             "'notyettreated'")
+        if base_period not in ('varying', 'universal'):
+            raise ValueError("`base_period` must be 'varying' or "
+                             "'universal'")
+        self.df = df
+        self.y_name = y_name
+        self.unit_name = unit_name
+        self.time_name = time_name
+        self.cohort_name = cohort_name
+        self.control_group = control_group
+        self.base_period = base_period
+        self.cluster = cluster
+
+    def main(self):
+        self.set_panel()
+        self.set_moments()
+        self.set_cells()
+        return self._moments.cell_results()
+
+    def set_panel(self):
+        """ Outcomes as a units-by-periods array and each unit's cohort. """
+        names = [self.y_name, self.unit_name, self.time_name]
+        sample = self.df[names].notnull().all(axis=1).values
+        units, unit_ids = pd.factorize(self.df[self.unit_name].values[sample])
+        times = self.df[self.time_name].values[sample]
+        self.periods = np.unique(times)
+        t_codes = np.searchsorted(self.periods, times)
+        N, T = len(unit_ids), len(self.periods)
+
+        Y = np.full((N, T), np.nan)
+        Y[units, t_codes] = self.df[self.y_name].values[sample]
+        if np.bincount(units * T + t_codes, minlength=N * T).max() > 1:
+            raise ValueError("Units have more than one row in a period")
+
+        cohort = self.df[self.cohort_name].values[sample].astype(np.float64)
+        cohort[np.isnan(cohort) | (cohort == 0) |
+               (cohort > self.periods[-1])] = np.inf
+        unit_cohort = np.full(N, np.nan)
+        unit_cohort[units] = cohort
+        if np.any(unit_cohort[units] != cohort):
+            raise ValueError("Cohort must be constant within units")
+
+        # Balanced panel, without units treated before the first comparison
+        keep = ~np.isnan(Y).any(axis=1) & (unit_cohort > self.periods[0])
+        self.n_dropped = int(N - keep.sum())
+        self.Y = Y[keep]
+        self.unit_cohort = unit_cohort[keep]
+        if self.cluster is not None:
+            cluster = np.empty(N, dtype=object)
+            cluster_id = self.df[self.cluster].values[sample]
+            cluster[units] = cluster_id
+            if pd.isnull(cluster_id).any():
+                raise ValueError("Cluster is missing")
+            if np.any(cluster[units] != cluster_id):
+                raise ValueError("Units must be nested within clusters")
+            self.cluster_id = cluster[keep]
+        else:
+            self.cluster_id = None
+
+    def set_moments(self):
+        # Treated cohorts, then never treated (last)
+        self.cohorts = np.unique(self.unit_cohort[
+            np.isfinite(self.unit_cohort)])
+        codes = np.searchsorted(self.cohorts, self.unit_cohort)
+        if (self.periods.dtype.kind in 'iu' and
+                np.all(self.cohorts == np.round(self.cohorts))):
+            # Label cohorts like periods
+            self.cohorts = self.cohorts.astype(self.periods.dtype)
+        self._moments = _CohortMoments(self.Y, codes, len(self.cohorts) + 1,
+                                       self.cluster_id)
+        self._moments.n_dropped = self.n_dropped
+
+    def set_cells(self):
+        """
+        Contrast of periods and weight on each cohort of each ATT(g, t).
+        """
+        T, H = len(self.periods), len(self.cohorts)
+        never = H
+        counts = self._moments.counts
+        if counts[never] == 0 and self.control_group == 'nevertreated':
+            raise ValueError("No never-treated units")
+        labels, rows = [], []
+        for h, g in enumerate(self.cohorts):
+            g_base = np.searchsorted(self.periods, g) - 1
+            for t in range(T):
+                if self.periods[t] >= g or self.base_period == 'universal':
+                    base = g_base
+                else:
+                    base = t - 1
+                if base < 0 or t == base:
+                    continue
+                control = np.zeros(H + 1, dtype=bool)
+                control[never] = True
+                if self.control_group == 'notyettreated':
+                    control[:H] = (self.cohorts >
+                                   self.periods[max(t, base)])
+                    control[h] = False
+                if counts[control].sum() == 0:
+                    continue
+                labels.append((g, self.periods[t]))
+                rows.append((h, t, base, control))
+
+        A = len(rows)
+        if A == 0:
+            raise ValueError("No group-time cells to estimate")
+        C = np.zeros((A, T))
+        W = np.zeros((A, H + 1))
+        cell_cohort = np.zeros(A, dtype=np.int64)
+        for a, (h, t, base, control) in enumerate(rows):
+            C[a, t], C[a, base] = 1, -1
+            W[a, h] = 1
+            W[a, control] = -counts[control] / counts[control].sum()
+            cell_cohort[a] = h
+        index = pd.MultiIndex.from_tuples(
+            labels, names=[self.cohort_name, self.time_name])
+        self._moments.set_cells(C, W, cell_cohort, index)
+
+
+class _CohortMoments(object):
+    """
+    Cohort means and within-cohort covariances of outcomes, from which
+    group-time effects, their weighted averages, and their VCEs are found.
+
+    Each estimate is :math:`\\sum_h W_h \\bar Y_h' c_h` for cohort weights
+    :math:`W_h` (summing to zero) and period contrasts :math:`c_h`. The
+    influence function of unit :math:`i` in cohort :math:`h` is then
+    :math:`\\alpha_h' \\tilde Y_i + \\beta_h`, with :math:`\\tilde Y_i`
+    demeaned within cohort, so its square sums to
+    :math:`\\alpha_h' S_h \\alpha_h + N_h \\beta_h^2` over the cohort.
+    """
+
+    def __init__(self, Y, codes, n_cohorts, cluster_id=None):
+        N, T = Y.shape
+        self.N = N
+        self.counts = np.bincount(codes, minlength=n_cohorts).astype(float)
+        sums = group_sums(codes, Y, n_cohorts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = sums / self.counts[:, np.newaxis]
+        self.means[self.counts == 0] = 0
+        dev = Y - self.means[codes]
+        order = np.argsort(codes, kind='mergesort')
+        bounds = np.concatenate(([0], np.cumsum(self.counts).astype(int)))
+        self.S = np.empty((n_cohorts, T, T))
+        for h in range(n_cohorts):
+            rows = dev[order[bounds[h]:bounds[h + 1]]]
+            self.S[h] = rows.T.dot(rows)
+        if cluster_id is None:
+            self.n_clusters = None
+        else:
+            # Sums of deviations and counts within cluster-cohort cells
+            c_codes, uniques = pd.factorize(cluster_id)
+            self.n_clusters = len(uniques)
+            cells = c_codes * n_cohorts + codes
+            n_cells = self.n_clusters * n_cohorts
+            self.cluster_dev = group_sums(cells, dev, n_cells).reshape(
+                self.n_clusters, n_cohorts, T)
+            self.cluster_counts = np.bincount(
+                cells, minlength=n_cells).reshape(self.n_clusters, n_cohorts)
+
+    def set_cells(self, C, W, cell_cohort, index):
+        self.C, self.W = C, W
+        self.cell_cohort = cell_cohort
+        self.index = index
+        # Influence function weights: N / N_g for the treated cohort and
+        # -N / N_control for controls
+        self.Wn = W * (self.N / np.where(self.counts > 0, self.counts, 1))
+        cohort_contrast = C.dot(self.means.T)          # Cells by cohorts
+        self.att = (W * cohort_contrast).sum(axis=1)
+        # Controls deviate from the mean of all controls
+        ctrl_mean = (cohort_contrast[np.arange(len(C)), cell_cohort] -
+                     self.att)
+        center = np.where(W > 0, cohort_contrast, ctrl_mean[:, np.newaxis])
+        self.B = self.Wn * (cohort_contrast - center)
+
+    def cell_results(self):
+        A = len(self.att)
+        L = np.eye(A)
+        results = self._results(L, np.zeros((A, len(self.counts))),
+                                pd.Series(self.att, index=self.index))
+        out = ATTResults(**results.__dict__)
+        out._moments = self
+        out._add_stat('event_time', pd.Series(
+            self.index.get_level_values(1) - self.index.get_level_values(0),
+            index=self.index))
+        return out
+
+    def aggregate(self, kind):
+        p = self.counts / self.N
+        g_values = self.index.get_level_values(0).values
+        t_values = self.index.get_level_values(1).values
+        event = t_values - g_values
+        post = event >= 0
+        if kind == 'dynamic':
+            keys, sets = _sets(event, np.ones(len(event), bool))
+        elif kind == 'calendar':
+            keys, sets = _sets(t_values, post)
+        elif kind == 'group':
+            keys, sets = _sets(g_values, post)
+        elif kind == 'simple':
+            keys, sets = ['ATT'], [post]
+        else:
+            raise ValueError("Aggregation '{}' is not supported".format(kind))
+        if not any(s.any() for s in sets):
+            raise ValueError("No cells to aggregate")
+
+        A, H1 = len(self.att), len(self.counts)
+        L = np.zeros((len(keys), A))
+        extra = np.zeros((len(keys), H1))
+        onehot = np.zeros((A, H1))
+        onehot[np.arange(A), self.cell_cohort] = 1
+        pa = p[self.cell_cohort]
+        for m, cells in enumerate(sets):
+            if kind == 'group':
+                L[m, cells] = 1 / cells.sum()
+                continue
+            total = pa[cells].sum()
+            L[m, cells] = pa[cells] / total
+            theta = L[m].dot(self.att)
+            # Influence of the estimated cohort shares on the weights
+            extra[m] = ((self.att[cells] - theta)[:, np.newaxis] *
+                        (onehot[cells] - pa[cells, np.newaxis])).sum(
+                            axis=0) / total
+        beta = pd.Series(L.dot(self.att), index=pd.Index(keys))
+        return self._results(L, extra, beta)
+
+    def _results(self, L, extra, beta):
+        """ Results for estimates `L` times the cells. """
+        # alpha: estimates-by-cohorts-by-periods, beta: estimates-by-cohorts
+        alpha = np.einsum('ma,ah,at->mht', L, self.Wn, self.C)
+        const = L.dot(self.B) + extra
+        if self.n_clusters is None:
+            meat = np.einsum('mht,hts,khs->mk', alpha, self.S, alpha)
+            meat += (const * self.counts).dot(const.T)
+            g = None
+        else:
+            scores = (np.einsum('cht,mht->cm', self.cluster_dev, alpha) +
+                      self.cluster_counts.dot(const.T))
+            meat = scores.T.dot(scores)
+            g = self.n_clusters
+        vce = meat / self.N ** 2
+        vce = _wrapSigma((vce + vce.T) / 2, beta.index)
+
+        df = (self.N if g is None else g) - 1
+        results = Results(beta=beta, vce=vce, N=self.N, K=len(beta),
+                          df_t=df, _df_r=df, n_dropped=self.n_dropped)
+        if g is not None:
+            results._add_stat('g', g)
+        _add_inference(results)
+        return results
+
+
+def _sets(values, cells):
+    """ Unique `values` among `cells` and a flag of cells for each. """
+    keys = np.unique(values[cells])
+    return list(keys), [cells & (values == key) for key in keys]
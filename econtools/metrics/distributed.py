@@ -0,0 +1,471 @@
+from __future__ import division
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+import pandas as pd
+import numpy as np
+import numpy.linalg as la
+
+from econtools.util import force_list
+from econtools.metrics.core import (RegBase, Results, sandwich,
+                                    _set_vce_type, _wrapSigma,
+                                    _cross_moments, _merge_cross)
+from econtools.metrics.columns import ColumnSource, BlockClusters
+
+
+def distreg(shards, y_name, x_name,
+            a_name=None, nosingles=True,
+            vce_type=None, cluster=None,
+            addcons=None, nocons=False,
+            executor=None, block_size=2**20,
+            ):
+    """OLS regression on data split into shards, estimated by map-reduce.
+
+    Each shard is read by a worker, which returns cross products, group sums,
+    or cluster score sums; the coordinator adds them up. Results are the same
+    as :py:func:`~econtools.metrics.reg` on all the shards stacked, up to
+    floating-point summation order.
+
+    Args:
+        shards (list): Pieces of the data, each a DataFrame, column data
+            accepted by :py:func:`~econtools.metrics.reg` (e.g., a dict of
+            memmaps or an Arrow table), or a function with no arguments that
+            returns one, e.g., ``functools.partial(pq.read_table, path)``.
+            Functions are called by the worker, so data on a remote host is
+            never sent over the network.
+        y_name (str): Column name of the dependent variable.
+        x_name (str or list): Column name(s) of the regressors.
+
+    Keyword Args:
+        a_name (str): Column name of a fixed effect to absorb. Groups may
+            span shards.
+        executor: Where the shards are read, a
+            :py:class:`~econtools.metrics.distributed.LocalExecutor`
+            (default),
+            :py:class:`~econtools.metrics.distributed.ProcessExecutor`, or
+            :py:class:`~econtools.metrics.distributed.SocketExecutor`.
+        block_size (int): Defaults to ``2**20``. Rows a worker reads at a
+            time.
+        **Other keyword args are as in :py:func:`~econtools.metrics.reg`:
+            ``nosingles``, ``vce_type`` (``None``, ``'robust'``/``'hc1'``,
+            or ``'cluster'``), ``cluster``, ``addcons``, and ``nocons``.
+
+    Returns:
+        A :py:class:`~econtools.metrics.core.Results` object without
+        ``yhat``, ``resid``, or ``sample``, which stay with the shards.
+
+    Notes:
+        Each pass over the shards is one round of tasks: group counts and
+        sums for ``a_name`` (if used), then cross products of the demeaned
+        data, then, for robust or clustered VCEs, the meat or the score sums
+        of each cluster, given the coefficients. Clusters may span shards.
+    """
+
+    DistWorker = DistRegression(
+        shards, y_name, x_name, executor=executor, block_size=block_size,
+        a_name=a_name, nosingles=nosingles, vce_type=vce_type,
+        cluster=cluster, addcons=addcons, nocons=nocons,
+    )
+
+    results = DistWorker.main()
+    return results
+
+
+class DistRegression(RegBase):
+    """ Coordinator of `distreg`: maps tasks over shards, reduces results. """
+
+    def __init__(self, shards, y_name, x_name, executor=None,
+                 block_size=2**20, **kwargs):
+        self.shards = list(shards)
+        self.y_name = y_name
+        self.x_name = force_list(x_name)
+        self.executor = LocalExecutor() if executor is None else executor
+        self.__dict__.update(kwargs)
+        self.singleton_rounds = []
+
+        if not self.shards:
+            raise ValueError("No shards")
+        if isinstance(self.a_name, (list, tuple)):
+            if len(self.a_name) > 1:
+                raise ValueError("Only one `a_name` is supported")
+            self.a_name = self.a_name[0] if self.a_name else None
+        self.vce_type = _set_vce_type(self.vce_type, self.cluster, None)
+        if self.vce_type not in (None, 'robust', 'hc1', 'cluster'):
+            raise ValueError("VCE type '{}' not supported for shards".format(
+                self.vce_type))
+        if int(block_size) < 1:
+            raise ValueError("`block_size` must be positive")
+        # A constant has no effect with fixed effects, as in `reg`
+        addcons = bool(self.addcons) and self.a_name is None
+        self.x_cols = self.x_name + (['_cons'] if addcons else [])
+        self.spec = {'y_name': self.y_name, 'x_name': self.x_name,
+                     'a_name': self.a_name, 'cluster': self.cluster,
+                     'addcons': addcons, 'block_size': int(block_size)}
+
+    def main(self):
+        self.estimate()
+        self.get_vce()
+        self.set_dof()
+        self.inference()
+
+        return self.results
+
+    def _map(self, func, *args):
+        return self.executor.map(func, [(shard, self.spec) + args
+                                        for shard in self.shards])
+
+    def _group_means(self):
+        """ Means of `y` and `x` within fixed-effect groups, over shards. """
+        groups = BlockClusters(len(self.x_cols) + 2)
+        pairs = []
+        for keys, sums, shard_pairs in self._map(_shard_groups):
+            groups.add(keys, sums)
+            pairs.append(shard_pairs)
+        keys, sums = groups.totals()
+        counts = sums[:, 0]
+        keep = counts > 1 if self.nosingles else np.ones(len(keys), bool)
+        # Singleton groups are one row each
+        n_single = len(keys) - keep.sum()
+        if n_single:
+            self.singleton_rounds = [int(n_single)]
+        self.means = (keys[keep], sums[keep, 1:] / counts[keep, np.newaxis])
+
+        self._fe_dof = int(keep.sum())
+        if self.cluster is not None:
+            pairs = pd.concat(pairs).drop_duplicates()
+            pairs = pairs[pairs['a'].isin(self.means[0])]
+            if not pairs['a'].duplicated().any():
+                # Nested within clusters
+                self._fe_dof = 0
+
+    def estimate(self):
+        self.means = None
+        self._fe_dof = 0
+        if self.a_name is not None:
+            self._group_means()
+
+        K = len(self.x_cols)
+        moments = (0, np.zeros(K + 1), np.zeros((K + 1, K + 1)))
+        y_stats = (0, 0., 0.)
+        for part in self._map(_shard_moments, self.means):
+            moments = _merge_cross(moments, part['moments'])
+            y_stats = _merge_moments(y_stats, part['y_stats'])
+        self._n_rows = y_stats[0]
+        if self._n_rows == 0:
+            raise ValueError("No observations in the sample")
+
+        n, mean, dev_cross = moments
+        cross = dev_cross + n * np.outer(mean, mean)
+        xpx_inv = la.inv(cross[:K, :K])
+        beta = pd.Series(xpx_inv.dot(cross[:K, K]), index=self.x_cols)
+        self.results = Results(beta=beta, xpx_inv=xpx_inv)
+        # SSR from centered moments, as in `BlockRegression`
+        coef = np.append(-beta.values, 1)
+        self.results._ssr = (coef.dot(dev_cross).dot(coef) +
+                             n * mean.dot(coef) ** 2)
+        self.results._sst = y_stats[2]
+
+    def get_vce(self):
+        """ VCE, with one more round over the shards if not homoskedastic. """
+        xpx_inv = self.results.xpx_inv
+        beta = self.results.beta.values
+        self.clusters = None
+        if self.vce_type is None:
+            vce = self.results.ssr / self._n_rows * xpx_inv
+        else:
+            parts = self._map(_shard_scores, self.means, beta)
+            if self.vce_type == 'cluster':
+                self.clusters = BlockClusters(len(beta))
+                for keys, sums in parts:
+                    self.clusters.add(keys, sums)
+                meat = self.clusters.meat()
+            else:
+                meat = sum(parts)
+            vce = sandwich(xpx_inv, meat, xpx_inv.T)
+
+        vce = _wrapSigma((vce + vce.T) / 2, self.results.beta.index)
+        self.results._add_stat('vce', vce)
+        self.results._add_stat('singletons', self.singleton_rounds)
+
+    def _set_NK(self):
+        self.results._nocons = self.a_name is not None or self.nocons
+        return self._n_rows, len(self.x_cols) + self._fe_dof
+
+
+# Tasks, run by workers on one shard each
+def _shard_groups(shard, spec):
+    """ Row counts and sums of `y` and `x` within fixed-effect groups. """
+    groups = BlockClusters(len(spec['x_name']) + 2)
+    pairs = []
+    for y, x, fe, cl in _shard_blocks(shard, spec):
+        groups.add(fe, np.column_stack((np.ones(len(y)), y, x)))
+        if cl is not None:
+            pairs.append(pd.DataFrame({'a': fe, 'c': cl}).drop_duplicates())
+    keys, sums = groups.totals()
+    pairs = pd.concat(pairs).drop_duplicates() if pairs else None
+    return keys, sums, pairs
+
+
+def _shard_moments(shard, spec, means):
+    """
+    Means and centered cross products of the (demeaned) sample, and moments
+    of raw `y`.
+    """
+    K = len(spec['x_name']) + spec['addcons']
+    out = {'moments': (0, np.zeros(K + 1), np.zeros((K + 1, K + 1))),
+           'y_stats': (0, 0., 0.)}
+    for y, x, y_raw, __ in _sample_blocks(shard, spec, means):
+        out['moments'] = _merge_cross(
+            out['moments'], _cross_moments(np.column_stack((x, y))))
+        y_mean = y_raw.mean()
+        out['y_stats'] = _merge_moments(
+            out['y_stats'],
+            (len(y_raw), y_mean, ((y_raw - y_mean) ** 2).sum()))
+    return out
+
+
+def _shard_scores(shard, spec, means, beta):
+    """ Robust meat, or cluster IDs and score sums. """
+    meat = np.zeros((len(beta), len(beta)))
+    clusters = BlockClusters(len(beta)) if spec['cluster'] else None
+    for y, x, __, cl in _sample_blocks(shard, spec, means):
+        xu = x * (y - x.dot(beta))[:, np.newaxis]
+        if clusters is None:
+            meat += xu.T.dot(xu)
+        else:
+            clusters.add(cl, xu)
+    return meat if clusters is None else clusters.totals()
+
+
+def _shard_blocks(shard, spec):
+    """
+    `y`, `x`, fixed-effect IDs, and cluster IDs of the rows of `shard` with
+    no missing values, one block at a time.
+    """
+    if callable(shard):
+        shard = shard()
+    names = [spec['y_name']] + spec['x_name']
+    ids = [name for name in (spec['a_name'], spec['cluster'])
+           if name is not None]
+    if isinstance(shard, pd.DataFrame):
+        shard = {name: shard[name].values for name in names + ids}
+    source = ColumnSource(shard)
+    source.check(names + ids)
+    for start in range(0, source.n_rows, spec['block_size']):
+        stop = min(start + spec['block_size'], source.n_rows)
+        cols = [source.floats(name, start, stop) for name in names]
+        cols += [source.values(name, start, stop) for name in ids]
+        valid = np.logical_and.reduce([v for __, v in cols])
+        if not valid.any():
+            continue
+        values = [v[valid] for v, __ in cols]
+        y, x = values[0], values[1:len(names)]
+        if spec['addcons']:
+            x.append(np.ones(len(y)))
+        id_values = values[len(names):]
+        fe = id_values.pop(0) if spec['a_name'] is not None else None
+        cl = id_values[0] if spec['cluster'] is not None else None
+        yield y, np.column_stack(x), fe, cl
+
+
+def _sample_blocks(shard, spec, means):
+    """
+    Blocks of `_shard_blocks` demeaned with the group `means`, dropping rows
+    in groups without means (singletons). Also yields raw `y`.
+    """
+    blocks = _shard_blocks(shard, spec)
+    if means is None:
+        for y, x, __, cl in blocks:
+            yield y, x, y, cl
+        return
+    index, group_means = pd.Index(means[0]), means[1]
+    for y, x, fe, cl in blocks:
+        codes = index.get_indexer(fe)
+        keep = codes >= 0
+        row_means = group_means[codes[keep]]
+        y_raw = y[keep]
+        yield (y_raw - row_means[:, 0], x[keep] - row_means[:, 1:], y_raw,
+               None if cl is None else cl[keep])
+
+
+def _merge_moments(a, b):
+    """ Combine (count, mean, sum of squared deviations) of two samples. """
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n == 0:
+        return a
+    delta = mean_b - mean_a
+    return (n, mean_a + delta * n_b / n,
+            m2_a + m2_b + delta ** 2 * n_a * n_b / n)
+
+
+# Executors
+class Executor(object):
+    """
+    Runs a function on a list of argument tuples, returning the results in
+    order. Executors can be used as context managers, which call `close`.
+    """
+
+    def map(self, func, tasks):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalExecutor(Executor):
+    """ Run tasks one at a time in this process. """
+
+    def map(self, func, tasks):
+        return [func(*task) for task in tasks]
+
+
+class ProcessExecutor(Executor):
+    """Run tasks in a pool of processes on this host.
+
+    Args:
+        n_jobs (int): Defaults to -1 (all cores). Number of processes. The
+            pool is started on first use and kept until ``close``.
+    """
+
+    def __init__(self, n_jobs=-1):
+        self.n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+        self._pool = None
+
+    def map(self, func, tasks):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_jobs)
+        return list(self._pool.map(func, *zip(*tasks)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+class SocketExecutor(Executor):
+    """Run tasks on worker processes that listen on TCP sockets.
+
+    Workers are started with :py:func:`~econtools.metrics.distributed.serve`
+    on any host (or ``python -m econtools.metrics.distributed HOST PORT``
+    with the key in the ``ECONTOOLS_AUTHKEY`` environment variable), or on
+    this host with ``SocketExecutor.local``. Tasks are split across workers
+    round-robin and each worker runs its share in order.
+
+    Args:
+        addresses (list): ``(host, port)`` of each worker.
+        authkey (bytes): Secret shared with the workers. Connections are
+            authenticated with it before any data is unpickled; use a
+            private network, since messages are not encrypted.
+    """
+
+    def __init__(self, addresses, authkey):
+        self.addresses = [tuple(address) for address in addresses]
+        if not self.addresses:
+            raise ValueError("No worker addresses")
+        self.authkey = authkey
+        self._procs = []
+
+    @classmethod
+    def local(cls, n_workers, authkey=None):
+        """ Start `n_workers` worker processes on this host. """
+        authkey = os.urandom(32) if authkey is None else authkey
+        addresses, procs = [], []
+        for __ in range(n_workers):
+            parent, child = Pipe()
+            proc = Process(target=serve, args=(('localhost', 0), authkey),
+                           kwargs={'_ready': child}, daemon=True)
+            proc.start()
+            addresses.append(parent.recv())
+            procs.append(proc)
+        executor = cls(addresses, authkey)
+        executor._procs = procs
+        return executor
+
+    def map(self, func, tasks):
+        n_workers = len(self.addresses)
+        shares = [list(range(i, len(tasks), n_workers))
+                  for i in range(n_workers)]
+
+        def run(worker):
+            address, share = self.addresses[worker], shares[worker]
+            if not share:
+                return []
+            conn = Client(address, authkey=self.authkey)
+            try:
+                out = []
+                for i in share:
+                    conn.send((func, tasks[i]))
+                    ok, value = conn.recv()
+                    if not ok:
+                        raise value
+                    out.append(value)
+                return out
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            parts = list(pool.map(run, range(n_workers)))
+        results = [None] * len(tasks)
+        for share, part in zip(shares, parts):
+            for i, value in zip(share, part):
+                results[i] = value
+        return results
+
+    def close(self):
+        """ Stop workers started by `local`. """
+        for address, proc in zip(self.addresses, self._procs):
+            if proc.is_alive():
+                with Client(address, authkey=self.authkey) as conn:
+                    conn.send(None)
+            proc.join()
+        self._procs = []
+
+
+def serve(address, authkey, _ready=None):
+    """Run a worker for a :py:class:`SocketExecutor` until it is stopped.
+
+    Args:
+        address (tuple): ``(host, port)`` to listen on. Port 0 picks a free
+            port.
+        authkey (bytes): Secret shared with the executor.
+    """
+    with Listener(address, authkey=authkey) as listener:
+        if _ready is not None:
+            _ready.send(listener.address)
+            _ready.close()
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                continue
+            with conn:
+                while True:
+                    try:
+                        message = conn.recv()
+                    except EOFError:
+                        break
+                    if message is None:
+                        return
+                    func, task = message
+                    try:
+                        result = (True, func(*task))
+                    except Exception as e:
+                        result = (False, e)
+                    conn.send(result)
+
+
+if __name__ == '__main__':
+    import sys
+    host, port = sys.argv[1], int(sys.argv[2])
+    serve((host, port), os.environ['ECONTOOLS_AUTHKEY'].encode())
@@ -0,0 +1,244 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+import scipy.linalg as la
+import scipy.sparse as sp
+import scipy.stats as stats
+
+from econtools.util import force_list
+from econtools.metrics.core import Regression
+from econtools.metrics.regutil import demean_multi
+
+
+def eventstudy(df, y_name, unit_name, time_name, event_name,
+               leads=5, lags=5, omit=-1, bin_endpoints=True, by_cohort=False,
+               x_name=None, nosingles=True,
+               vce_type=None, cluster=None,
+               awt_name=None, save_fe=False,
+               ):
+    """Event-study regression with unit and time fixed effects.
+
+    Regresses ``y_name`` on indicators for time relative to each unit's event
+    (plus any controls), absorbing unit and period fixed effects.
+
+    Args:
+        df (DataFrame): Panel in long form.
+        y_name (str): Column name in ``df`` of the outcome.
+        unit_name (str): Column name in ``df`` of the unit ID.
+        time_name (str): Column name in ``df`` of the (integer) period.
+        event_name (str): Column name in ``df`` of the period of each unit's
+            event, missing for units never treated, which have no
+            indicators.
+
+    Keyword Args:
+        leads (int): Defaults to 5. Periods before the event with their own
+            indicators.
+        lags (int): Defaults to 5. Periods after the event (the event period
+            is 0) with their own indicators.
+        omit (int or list): Defaults to -1. Relative period(s) left out as
+            the reference.
+        bin_endpoints (bool): Defaults to True. Periods more than ``leads``
+            before or ``lags`` after the event are grouped with the
+            endpoints. If False, those observations are dropped.
+        by_cohort (bool): Defaults to False. If True, estimate separate
+            indicators for each cohort (value of ``event_name``), as in Sun
+            and Abraham (2021), and average them over cohorts for the
+            coefficient path, weighting by each cohort's observations in
+            that relative period (weights are treated as fixed).
+        x_name (str or list): Column name(s) in ``df`` of control variables.
+        **Other keyword args are as in :py:func:`~econtools.metrics.reg`:
+            ``nosingles``, ``vce_type``, ``cluster``, ``awt_name``, and
+            ``save_fe``.
+
+    Returns:
+        A :py:class:`~econtools.metrics.core.Results` object with extra
+        attributes:
+            - ``path`` (*DataFrame*): Coefficient, standard error, t-stat,
+              p-value, and confidence interval for each relative period,
+              including the omitted ones (with coefficient 0).
+            - ``path_vce`` (*DataFrame*): VCE of the estimated path.
+            - ``pretrend`` (*DataFrame*): F-stats and p-values of the joint
+              tests that the indicators for the ``n_leads`` pre-event
+              periods closest to the event are zero, for each ``n_leads``,
+              computed together with
+              :py:meth:`~econtools.metrics.core.Results.Ftest_batch`.
+
+    Notes:
+        Indicators are built from relative-period (and cohort) codes as one
+        sparse block, not as dense dummy columns, and demeaned within the
+        fixed effects a few columns at a time, so the demeaned design is the
+        only dense copy.
+    """
+
+    EventWorker = EventStudy(
+        df, y_name, force_list(x_name or []),
+        unit_name=unit_name, time_name=time_name, event_name=event_name,
+        leads=leads, lags=lags, omit=force_list(omit),
+        bin_endpoints=bin_endpoints, by_cohort=by_cohort,
+        a_name=[unit_name, time_name], nosingles=nosingles,
+        vce_type=vce_type, cluster=cluster, shac=None,
+        addcons=None, nocons=False, awt_name=awt_name, save_fe=save_fe,
+    )
+
+    results = EventWorker.main()
+    return results
+
+
+class EventStudy(Regression):
+
+    def __init__(self, *args, **kwargs):
+        super(EventStudy, self).__init__(*args, **kwargs)
+        if self.leads < 0 or self.lags < 0:
+            raise ValueError("`leads` and `lags` must be nonnegative")
+        time = self.df[self.time_name].values.astype(np.float64)
+        event = self.df[self.event_name].values.astype(np.float64)
+        self.rel_time = time - event
+        known = ~np.isnan(self.rel_time)
+        if np.any(self.rel_time[known] != np.round(self.rel_time[known])):
+            raise ValueError("Periods and events must be integers")
+
+    def main(self):
+        results = super(EventStudy, self).main()
+        self._set_path()
+        self._set_pretrend()
+        return results
+
+    def _drop_singletons(self):
+        if not self.bin_endpoints:
+            rel = self.rel_time
+            with np.errstate(invalid='ignore'):
+                outside = (rel < -self.leads) | (rel > self.lags)
+            self.sample = self.sample & ~outside
+        super(EventStudy, self)._drop_singletons()
+
+    def _demean_sample(self):
+        super(EventStudy, self)._demean_sample()
+        block = self._event_block()
+        controls = self.x
+        # Demean the indicators a few columns at a time into one array, so
+        # only the demeaned design is ever dense
+        codes_list = [pd.factorize(col)[0] for __, col in self.A.items()]
+        fwt = None if self.FWT is None else self.FWT.values
+        n, n_event = block.shape
+        x = np.empty((n, n_event + controls.shape[1]), order='F')
+        step = max(1, 2**24 // max(n, 1))
+        for start in range(0, n_event, step):
+            cols = slice(start, min(start + step, n_event))
+            x[:, cols] = demean_multi(codes_list, block[:, cols].toarray(),
+                                      weights=fwt)
+        x[:, n_event:] = controls.values
+        self.x = pd.DataFrame(x, index=self.y.index,
+                              columns=self.event_cols + list(controls.columns))
+        self.event_block = block
+
+    def _fe_target(self):
+        beta = self.results.beta
+        target = self.y_raw.values - self.event_block.dot(
+            beta[self.event_cols].values)
+        controls = beta.index[len(self.event_cols):]
+        if len(controls):
+            target -= self.x_raw['x'][controls].values.dot(
+                beta[controls].values)
+        return target
+
+    def _event_block(self):
+        """ Sparse indicators of relative period (and cohort) in sample. """
+        rows = self.sample.values
+        rel = np.clip(self.rel_time[rows], -self.leads, self.lags)
+        has = ~np.isnan(rel) & ~np.isin(rel, self.omit)
+        rel = rel[has].astype(np.int64)
+        if self.by_cohort:
+            cohort = self.df[self.event_name].values[rows][has]
+            levels, codes = np.unique(np.column_stack((cohort, rel)),
+                                      axis=0, return_inverse=True)
+            self.col_cohort = levels[:, 0]
+            self.col_rel = levels[:, 1].astype(np.int64)
+            labels = ['{}.{}#{}.rel_time'.format(_label(g), self.event_name,
+                                                 e)
+                      for g, e in zip(self.col_cohort, self.col_rel)]
+        else:
+            self.col_rel, codes = np.unique(rel, return_inverse=True)
+            labels = ['{}.rel_time'.format(e) for e in self.col_rel]
+        codes = codes.ravel()
+        n = int(rows.sum())
+        block = sp.csc_matrix(
+            (np.ones(len(codes)), (np.flatnonzero(has), codes)),
+            shape=(n, len(labels)))
+        self.event_cols = labels
+        self.col_count = np.diff(block.indptr)
+        return block
+
+    def _set_path(self):
+        """ Coefficient path over relative periods and its VCE. """
+        periods = np.unique(self.col_rel)
+        L = np.zeros((len(periods), len(self.event_cols)))
+        for i, e in enumerate(periods):
+            cols = self.col_rel == e
+            # Cohorts weighted by their observations in relative period `e`
+            L[i, cols] = self.col_count[cols] / self.col_count[cols].sum()
+        beta = self.results.beta[self.event_cols].values
+        V = self.results.vce.loc[self.event_cols, self.event_cols].values
+        coeff = L.dot(beta)
+        path_vce = L.dot(V).dot(L.T)
+        se = np.sqrt(np.diagonal(path_vce))
+
+        t_df = self.results.df_t
+        crit_value = stats.t.ppf(.975, t_df)
+        path = pd.DataFrame({'coeff': coeff, 'se': se}, index=periods)
+        path['t'] = coeff / se
+        path['p>t'] = stats.t.cdf(-np.abs(path['t']), t_df) * 2
+        path['CI_low'] = coeff - crit_value * se
+        path['CI_high'] = coeff + crit_value * se
+        omitted = [e for e in self.omit if -self.leads <= e <= self.lags]
+        ref = pd.DataFrame({'coeff': 0., 'se': 0., 't': np.nan,
+                            'p>t': np.nan, 'CI_low': 0., 'CI_high': 0.},
+                           index=omitted)
+        path = pd.concat((path, ref)).sort_index()
+        path.index.name = 'rel_time'
+        self.results._add_stat('path', path)
+        self.results._add_stat('path_vce', pd.DataFrame(
+            path_vce, index=periods, columns=periods))
+
+    def _set_pretrend(self):
+        """
+        Joint tests of the leads closest to the event. The groups are nested,
+        so with the leads' VCE ordered by distance from the event,
+        ``V = LL'``, the Wald stat for the first ``k`` columns is the sum of
+        the first ``k`` squares of ``L^-1 b``, all from one factorization.
+        """
+        leads = sorted((e for e in np.unique(self.col_rel) if e < 0),
+                       reverse=True)
+        # Lead columns, nearest to the event first
+        cols = [col for e in leads
+                for col, e_col in zip(self.event_cols, self.col_rel)
+                if e_col == e]
+        groups = {}
+        for k in range(1, len(leads) + 1):
+            groups[k] = cols[:np.isin(self.col_rel, leads[:k]).sum()]
+        if not groups:
+            pretrend = pd.DataFrame(columns=['F', 'pF'])
+        else:
+            try:
+                L = la.cholesky(self.results.vce.loc[cols, cols].values,
+                                lower=True)
+            except la.LinAlgError:
+                # Singular VCE, so test ranks must be found one by one
+                pretrend = self.results.Ftest_batch(groups)
+            else:
+                z = la.solve_triangular(
+                    L, self.results.beta[cols].values, lower=True)
+                df_n = np.array([len(groups[k]) for k in groups])
+                F = np.cumsum(z ** 2)[df_n - 1] / df_n
+                pretrend = pd.DataFrame(
+                    {'F': F, 'pF': stats.f.sf(F, df_n, self.results.df_r)},
+                    index=list(groups))
+        pretrend.index.name = 'n_leads'
+        self.results._add_stat('pretrend', pretrend)
+
+
+def _label(value):
+    """ Cohort label, without a trailing '.0' for whole numbers. """
+    if float(value).is_integer():
+        return str(int(value))
+    return str(value)
@@ -0,0 +1,242 @@
+from __future__ import division
+
+import re
+from functools import lru_cache
+from itertools import combinations
+
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+
+
+_COMPONENT = re.compile(r'^(c|i|ibn|ib(-?\d+(?:\.\d+)?|\(first\)|\(last\)|'
+                        r'\(freq\)))\.(.+)$')
+
+
+def is_factor_term(name, columns=()):
+    """
+    Check if `name` uses factor-variable syntax (e.g., ``i.state``). Names in
+    `columns` (existing columns) are never factor terms.
+    """
+    if not isinstance(name, str) or name in columns:
+        return False
+    return all(_COMPONENT.match(part) for part in re.split('##?', name))
+
+
+def has_factor_terms(names, columns=()):
+    return any(is_factor_term(name, columns) for name in names)
+
+
+def factor_sources(names, columns=()):
+    """
+    Columns needed to build the regressors in `names`, in order. Results are
+    cached by `names` and `columns`.
+    """
+    return list(_factor_sources(tuple(names), tuple(columns)))
+
+
+@lru_cache(maxsize=256)
+def _factor_sources(names, columns):
+    sources = []
+    for name in names:
+        if is_factor_term(name, columns):
+            new = [var for term in _parse_term(name)
+                   for __, var, __ in term]
+        else:
+            new = [name]
+        for var in new:
+            if var not in sources:
+                sources.append(var)
+    return tuple(sources)
+
+
+def expand_factors(df, names):
+    """
+    Expand factor-variable syntax into regressors.
+
+    Factor variables follow Stata's conventions: ``i.var`` is a set of
+    indicators for the levels of ``var``; ``c.var`` is a continuous variable;
+    ``a#b`` interacts ``a`` and ``b``; ``a##b`` is shorthand for ``a b a#b``.
+    The base level of a factor is the lowest level by default; ``ib#.var``
+    sets it to level ``#`` (or ``ib(first).``, ``ib(last).``,
+    ``ib(freq).``) and ``ibn.var`` omits no base level. Names without factor
+    syntax or that are columns of `df` are passed through. Terms repeated by
+    ``##`` expansions are only included once.
+
+    Indicator blocks are built directly from the factor codes as sparse
+    columns, so no dense dummies are made. Levels are those observed in `df`.
+    Cells of an interaction are omitted when they are spanned by lower-order
+    terms in `names`: a cell is dropped if one of its factors is at its base
+    level and the term without that factor is also in the model (the
+    constant counts as always being in the model). A pure factor
+    interaction without any such terms drops its all-base cell.
+
+    Args:
+        df (DataFrame): Data with the source columns of `names`.
+        names (list): Variable names, possibly with factor-variable syntax.
+
+    Returns:
+        DataFrame: Expanded regressors with Stata-style labels (e.g.,
+        ``2010.year``, ``3.state#c.treat``). Indicator columns have a
+        ``SparseDtype``.
+    """
+    terms = []
+    seen = set()
+    for name in names:
+        if is_factor_term(name, df.columns):
+            new_terms = _parse_term(name)
+        else:
+            new_terms = [name]
+        for term in new_terms:
+            # Terms repeated by `##` expansions are only included once
+            key = (frozenset([('c', term)]) if isinstance(term, str)
+                   else _term_key(term))
+            if key not in seen:
+                seen.add(key)
+                terms.append(term)
+    in_model = seen | set([frozenset()])
+
+    levels = {}
+    pieces = []
+    for term in terms:
+        if isinstance(term, str):
+            pieces.append(df[[term]])
+            continue
+        for kind, var, base in term:
+            if kind == 'i' and var not in levels:
+                levels[var] = _factorize(df[var])
+        pieces.append(_expand_term(df, term, levels, in_model))
+
+    expanded = pd.concat(pieces, axis=1)
+    if expanded.columns.duplicated().any():
+        dups = expanded.columns[expanded.columns.duplicated()].tolist()
+        raise ValueError("Duplicate regressors: {}".format(dups))
+    return expanded
+
+
+@lru_cache(maxsize=1024)
+def _parse_term(name):
+    """ Parse a term into a tuple of terms, each a tuple of components. """
+    groups = []
+    for group in name.split('##'):
+        components = []
+        for part in group.split('#'):
+            match = _COMPONENT.match(part)
+            prefix, base, var = match.group(1), match.group(2), match.group(3)
+            if prefix == 'c':
+                components.append(('c', var, None))
+            elif prefix == 'ibn':
+                components.append(('i', var, 'none'))
+            elif base is None:
+                components.append(('i', var, '(first)'))
+            else:
+                components.append(('i', var, base))
+        groups.append(components)
+
+    terms = []
+    for size in range(1, len(groups) + 1):
+        for combo in combinations(groups, size):
+            terms.append(tuple(comp for group in combo for comp in group))
+    return tuple(terms)
+
+
+def _term_key(term):
+    return frozenset((kind, var) for kind, var, __ in term)
+
+
+def _factorize(col):
+    """ Codes and labels of the sorted, observed levels of `col`. """
+    codes, uniques = pd.factorize(col, sort=True)
+    observed = np.unique(codes)
+    if len(observed) < len(uniques):
+        remap = np.zeros(len(uniques), dtype=np.int64)
+        remap[observed] = np.arange(len(observed))
+        codes, uniques = remap[codes], uniques[observed]
+    labels = [_level_label(val) for val in uniques]
+    return codes, labels
+
+
+def _level_label(val):
+    if isinstance(val, (float, np.floating)) and float(val).is_integer():
+        return str(int(val))
+    return str(val)
+
+
+def _base_code(codes, labels, base, var):
+    if base == 'none':
+        return None
+    elif base == '(first)':
+        return 0
+    elif base == '(last)':
+        return len(labels) - 1
+    elif base == '(freq)':
+        return np.bincount(codes).argmax()
+    base_label = _level_label(float(base))
+    if base_label not in labels:
+        raise ValueError("Base level {} not in `{}`".format(base, var))
+    return labels.index(base_label)
+
+
+def _expand_term(df, term, levels, in_model):
+    N = df.shape[0]
+    key = _term_key(term)
+    value = np.ones(N)
+    for kind, var, __ in term:
+        if kind == 'c':
+            value = value * df[var].values.astype(np.float64)
+
+    factors = [comp for comp in term if comp[0] == 'i']
+    if not factors:
+        label = '#'.join('c.' + var for __, var, __ in term)
+        if len(term) == 1:
+            label = term[0][1]
+        return pd.DataFrame({label: value}, index=df.index)
+
+    # Combined cell codes of the factors, in mixed radix
+    cell = np.zeros(N, dtype=np.int64)
+    keep = np.ones(N, dtype=bool)
+    omit_any = False
+    for kind, var, base in factors:
+        codes, labels = levels[var]
+        cell = cell * len(labels) + codes
+        base_code = _base_code(codes, labels, base, var)
+        margin_in_model = (key - set([(kind, var)])) in in_model
+        if base_code is not None and margin_in_model:
+            keep &= codes != base_code
+            omit_any = True
+    if not omit_any and len(factors) == len(term) and len(factors) > 1:
+        all_base = np.ones(N, dtype=bool)
+        for kind, var, base in factors:
+            codes, labels = levels[var]
+            base_code = _base_code(codes, labels, base, var)
+            all_base &= (base_code is not None) & (codes == base_code)
+        keep &= ~all_base
+
+    cells, col_idx = np.unique(cell[keep], return_inverse=True)
+    row_idx = np.arange(N)[keep]
+    block = sp.csc_matrix((value[keep], (row_idx, col_idx)),
+                          shape=(N, len(cells)))
+
+    # Labels, e.g. `3.state#c.treat`
+    digits = []
+    rest = cells
+    for kind, var, __ in factors[::-1]:
+        n_levels = len(levels[var][1])
+        digits.append(rest % n_levels)
+        rest = rest // n_levels
+    digits = digits[::-1]
+    columns = []
+    for j in range(len(cells)):
+        parts = []
+        factor_num = 0
+        for kind, var, __ in term:
+            if kind == 'c':
+                parts.append('c.' + var)
+            else:
+                level = levels[var][1][digits[factor_num][j]]
+                parts.append('{}.{}'.format(level, var))
+                factor_num += 1
+        columns.append('#'.join(parts))
+
+    return pd.DataFrame.sparse.from_spmatrix(block, index=df.index,
+                                             columns=columns)
@@ -0,0 +1,110 @@
+from __future__ import division
+
+import re
+from functools import lru_cache
+
+
+class DesignPlan(object):
+    """
+    Compiled formula: variable names for each role in :py:func:`reg` and
+    :py:func:`ivreg`.
+
+    Attributes:
+        y_name (str): Dependent variable.
+        x_name (list): Exogenous regressors.
+        a_name (str or list): Fixed effects to absorb (None if none).
+        endog (list): Endogenous regressors.
+        instruments (list): Excluded instruments.
+        addcons (bool): True if the formula adds a constant with ``1``.
+    """
+
+    def __init__(self, y_name, x_name, a_name, endog, instruments, addcons):
+        self.y_name = y_name
+        self.x_name = x_name
+        self.a_name = a_name
+        self.endog = endog
+        self.instruments = instruments
+        self.addcons = addcons
+
+    @property
+    def is_iv(self):
+        return bool(self.endog)
+
+
+def is_formula(y_name):
+    return isinstance(y_name, str) and '~' in y_name
+
+
+@lru_cache(maxsize=256)
+def compile_formula(formula):
+    """
+    Compile formula `formula` into a :py:class:`DesignPlan`. Plans are cached,
+    so repeated calls with the same formula skip parsing. (Resolving factor
+    variables against the columns of the data is cached separately; see
+    :py:func:`~econtools.metrics.factor.factor_sources`.)
+
+    Formulas have the form ``'y ~ x1 + x2 | fe1 + fe2 | (x3 ~ z1 + z2)'``,
+    where the fixed-effects and IV parts are optional and may be in either
+    order. Regressors and instruments may use factor-variable syntax (e.g.,
+    ``i.state``, ``i.year#c.treat``). A ``1`` in the regressors adds a
+    constant and ``0`` is ignored.
+    """
+    parts = _split_top_level(formula, '|')
+    lhs, __, rhs = parts[0].partition('~')
+    y_name = lhs.strip()
+    if not y_name or '~' in rhs:
+        raise ValueError("Bad formula: '{}'".format(formula))
+    x_name, addcons = _parse_sum(rhs)
+
+    a_name = None
+    endog, instruments = [], []
+    for part in parts[1:]:
+        part = part.strip()
+        if '~' in part:
+            if endog:
+                raise ValueError("Formula has more than one IV part")
+            part = _strip_parens(part)
+            left, __, right = part.partition('~')
+            endog = _parse_sum(left)[0]
+            instruments = _parse_sum(right)[0]
+            if not endog:
+                raise ValueError("IV part of formula has no endogenous "
+                                 "variables: '{}'".format(formula))
+        else:
+            if a_name is not None:
+                raise ValueError("Formula has more than one fixed-effects "
+                                 "part")
+            fes = _parse_sum(part)[0]
+            a_name = fes[0] if len(fes) == 1 else fes
+
+    return DesignPlan(y_name, x_name, a_name, endog, instruments, addcons)
+
+
+def _parse_sum(expr):
+    """ Terms of `a + b + c`, dropping (and flagging) constant terms. """
+    terms = [term.strip() for term in _split_top_level(expr, '+')]
+    addcons = '1' in terms
+    terms = [term for term in terms if term and term not in ('0', '1')]
+    return terms, addcons
+
+
+def _split_top_level(expr, sep):
+    """ Split `expr` on `sep` outside of parentheses. """
+    parts = []
+    depth = 0
+    last = 0
+    for i, char in enumerate(expr):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == sep and depth == 0:
+            parts.append(expr[last:i])
+            last = i + 1
+    parts.append(expr[last:])
+    return parts
+
+
+def _strip_parens(expr):
+    match = re.match(r'^\((.*)\)$', expr.strip(), flags=re.DOTALL)
+    return match.group(1) if match else expr
@@ -0,0 +1,154 @@
+from __future__ import division
+
+import hashlib
+
+import pandas as pd
+import numpy as np
+import numpy.linalg as la
+
+from econtools.util import force_list
+
+
+class PartialCache(object):
+    """
+    Cache of partialled-out control variables, shared by calls to
+    :py:func:`~econtools.metrics.reg` that use the same data, sample, fixed
+    effects, and weights but different other regressors (e.g., a
+    specification search over treatment variables).
+
+    Args:
+        controls (str or list): Column name(s) of the control variables, a
+            subset of the regressors ``x_name`` of each regression. A
+            constant added with ``addcons`` is also treated as a control.
+
+    Example:
+        >>> cache = PartialCache(controls)
+        >>> for treat in treatments:
+        ...     results = reg(df, 'y', [treat] + controls, a_name='fe',
+        ...                   cluster='state', cache=cache)
+
+    Notes:
+        Each sample (the data ``df``, the rows used after dropping missing
+        values and singletons, ``a_name``, and the weights) gets its own
+        entry with:
+
+            - the control variables already demeaned within fixed effects
+              (demeaning is done column by column, so cached columns are the
+              same as in a full refit), and
+            - the cross products of the (weighted) controls and their
+              inverse.
+
+        Cached values are also keyed by a hash of the data they were
+        computed from, so a control column that is modified is recomputed.
+        The other regressors and the dependent variable are demeaned anew
+        in each call. A new specification finds its coefficients by
+        Frisch-Waugh-Lovell with the cached inverse, which only needs a
+        system the size of the new regressors. Residuals and VCEs are then
+        the same as a full refit.
+
+        The cache keeps a reference to ``df`` and is cleared if it is used
+        with a different DataFrame.
+    """
+
+    def __init__(self, controls):
+        self.controls = force_list(controls) + ['_cons']
+        self._df = None
+        self._entries = dict()
+
+    def clear(self):
+        """ Drop all cached samples. """
+        self._df = None
+        self._entries = dict()
+
+    def entry(self, df, sample, a_name, fwt_name, awt_name):
+        """ Cached data for one sample (created if new). """
+        if self._df is not df:
+            self.clear()
+            self._df = df
+        sample = np.asarray(sample, dtype=bool)
+        key = (len(sample), hashlib.sha1(np.packbits(sample)).hexdigest(),
+               tuple(force_list(a_name or [])), fwt_name, awt_name)
+        if key not in self._entries:
+            self._entries[key] = _SampleCache(self.controls)
+        return self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _SampleCache(object):
+    """ Demeaned columns and control cross products for one sample. """
+
+    def __init__(self, controls):
+        self.controls = controls
+        self.demeaned = dict()  # (Control, hash of column) -> demeaned
+        self.grams = dict()     # (Controls, hash of C) -> (C'C)^-1
+        self.cross = dict()     # (Gram key, hash of y) -> C'y
+
+    def demean(self, df, demean):
+        """
+        Demean `df` with function `demean`. Control columns are looked up by
+        name and content; all other columns are always demeaned.
+        """
+        if df is None or df.empty:
+            return df
+        frame = df.to_frame() if df.ndim == 1 else df
+        keys = {col: (col, _digest(frame[col].values))
+                for col in frame.columns if col in self.controls}
+        new = [col for col in frame.columns
+               if col not in keys or keys[col] not in self.demeaned]
+        if new:
+            demeaned = demean(frame[new])
+            for col in new:
+                if col in keys:
+                    self.demeaned[keys[col]] = demeaned[col]
+        columns = [self.demeaned[keys[col]] if col not in new
+                   else demeaned[col] for col in frame.columns]
+        if df.ndim == 1:
+            return columns[0]
+        return pd.concat(columns, axis=1)
+
+    def fit(self, y, x):
+        """
+        OLS of `y` on DataFrame `x` (both already demeaned and weighted) by
+        Frisch-Waugh-Lovell on the cached controls. Returns the same beta
+        and (X'X)^-1 as `fitguts`.
+        """
+        is_control = np.array([col in self.controls for col in x.columns])
+        control_cols = tuple(x.columns[is_control])
+        C = x.loc[:, is_control].values
+        T = x.loc[:, ~is_control].values
+        y = np.ascontiguousarray(y, dtype=np.float64)
+
+        gram_key = (control_cols, _digest(C))
+        if gram_key not in self.grams:
+            self.grams[gram_key] = la.inv(C.T.dot(C))
+        G = self.grams[gram_key]
+        y_key = (gram_key, _digest(y))
+        if y_key not in self.cross:
+            self.cross[y_key] = C.T.dot(y)
+        Cy = self.cross[y_key]
+
+        # Residual-maker for the controls applied to the new columns
+        TC = T.T.dot(C)
+        TCG = TC.dot(G)
+        S_inv = la.inv(T.T.dot(T) - TCG.dot(TC.T))
+        beta_t = S_inv.dot(T.T.dot(y) - TCG.dot(Cy))
+        beta_c = G.dot(Cy - TC.T.dot(beta_t))
+
+        K = x.shape[1]
+        t_idx, c_idx = np.flatnonzero(~is_control), np.flatnonzero(is_control)
+        beta = np.empty(K)
+        beta[t_idx], beta[c_idx] = beta_t, beta_c
+        xpx_inv = np.empty((K, K))
+        off_diag = -S_inv.dot(TCG)
+        xpx_inv[np.ix_(t_idx, t_idx)] = S_inv
+        xpx_inv[np.ix_(t_idx, c_idx)] = off_diag
+        xpx_inv[np.ix_(c_idx, t_idx)] = off_diag.T
+        xpx_inv[np.ix_(c_idx, c_idx)] = G + TCG.T.dot(S_inv).dot(TCG)
+        return pd.Series(beta, index=x.columns), xpx_inv
+
+
+def _digest(values):
+    """ Hash of the contents of array `values`. """
+    return hashlib.sha1(np.ascontiguousarray(values)).hexdigest()
@@ -0,0 +1,245 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+from scipy.special import gammaln
+
+from econtools.metrics.core import (RegBase, Results, fitguts, vce_robust,
+                                    vce_cluster, vce_shac, vce_hac,
+                                    _wrapSigma, _from_formula)
+from econtools.metrics.formula import is_formula
+from econtools.metrics.regutil import demean_multi, ClusterStructure
+
+
+def ppml(df, y_name, x_name=None,
+         a_name=None, nosingles=True,
+         vce_type=None, cluster=None, shac=None, hac=None,
+         addcons=None, nocons=False,
+         tol=1e-8, maxiter=100, save_fe=False,
+         ):
+    """Poisson pseudo-maximum likelihood (PPML) with absorbed fixed effects.
+
+    Args:
+        df (DataFrame): Data with any relevant variables.
+        y_name (str): Column name in ``df`` of the (nonnegative) dependent
+                variable, or a formula like ``'y ~ x1 + x2 | fe1 + fe2'``.
+        x_name (str or list): Column name(s) in ``df`` of the regressors
+                (None if ``y_name`` is a formula).
+
+    Keyword Args:
+        vce_type (str): Defaults to ``'robust'``. May also be ``'cluster'``,
+            ``'shac'``, ``'hac'``, or ``'driscoll-kraay'``, with the same
+            keyword args as :py:func:`~econtools.metrics.reg`. VCE types
+            ``'hc2'`` and ``'hc3'`` are not supported.
+        a_name (str or list): Column name(s) in ``df`` of fixed effects to
+            absorb.
+        tol (float): Defaults to 1e-8. Convergence tolerance on the relative
+            change in deviance between iterations.
+        maxiter (int): Defaults to 100. Maximum number of iterations.
+        **All other keyword args in :py:func:`~econtools.metrics.reg` may
+            also be used.
+
+    Returns:
+        A :py:class:`~econtools.metrics.core.Results` object with extra
+        attributes ``deviance``, ``ll`` (log likelihood), ``iterations``,
+        ``separated`` (number of observations dropped because their
+        conditional mean is zero), and ``omitted`` (regressors dropped after
+        removing separated observations). ``yhat`` is the fitted mean
+        :math:`\\exp(X\\hat\\beta + \\hat\\alpha)` and ``resid`` is ``y`` minus
+        ``yhat``.
+
+    Notes:
+        Estimated by iteratively reweighted least squares. Each iteration
+        demeans the working dependent variable and the regressors within
+        fixed effects (weighted by the current fitted means), starting the
+        alternating projections from the previous iteration's demeaned
+        values, and then runs weighted least squares on the demeaned data.
+
+        Before estimating, observations are dropped until none are
+        separated: fixed-effect groups where ``y`` is always zero, and
+        observations where a regressor that is zero whenever ``y`` is
+        positive is nonzero, if it has the same sign at all those
+        observations. Singleton groups are dropped along the way if
+        ``nosingles``.
+    """
+
+    if is_formula(y_name):
+        if x_name is not None:
+            raise ValueError("`x_name` must be None when using a formula")
+        plan, a_name, addcons = _from_formula(y_name, a_name, addcons,
+                                              iv=False)
+        y_name, x_name = plan.y_name, list(plan.x_name)
+    elif x_name is None:
+        raise ValueError("`x_name` is required without a formula")
+
+    PPMLWorker = PPML(
+        df, y_name, x_name,
+        a_name=a_name, nosingles=nosingles, addcons=addcons, nocons=nocons,
+        vce_type=vce_type, cluster=cluster, shac=shac, hac=hac,
+        awt_name=None, tol=tol, maxiter=maxiter, save_fe=save_fe,
+    )
+    results = PPMLWorker.main()
+    return results
+
+
+class PPML(RegBase):
+
+    def __init__(self, *args, **kwargs):
+        super(PPML, self).__init__(*args, **kwargs)
+        if self.vce_type is None:
+            self.vce_type = 'robust'
+        elif self.vce_type in ('hc2', 'hc3'):
+            raise ValueError(
+                "VCE type '{}' not supported for PPML".format(self.vce_type))
+
+    def set_sample(self):
+        super(PPML, self).set_sample()
+        if (self.y < 0).any():
+            raise ValueError("PPML requires a nonnegative dependent variable")
+        self._drop_separated()
+        if not (self.y > 0).any():
+            raise ValueError("Dependent variable is always zero")
+        if self.x.empty:
+            raise ValueError("PPML requires at least one regressor")
+
+    def _demean_sample(self):
+        # Fixed effects are absorbed within each IRLS iteration instead
+        self.y_raw = self.y
+
+    def _fe_codes(self):
+        if self.A is None:
+            return []
+        A = self.A.to_frame() if isinstance(self.A, pd.Series) else self.A
+        return [pd.factorize(col)[0] for __, col in A.items()]
+
+    def _drop_separated(self):
+        """
+        Drop separated observations and singletons until there are none,
+        then drop regressors that are all zero.
+        """
+        y = self.y.values
+        x = self.x.values
+        codes_list = self._fe_codes()
+        keep = np.ones(len(y), dtype=bool)
+        while True:
+            drop = np.zeros(len(y), dtype=bool)
+            for codes in codes_list:
+                codes = np.where(keep, codes, -1)
+                kept = codes >= 0
+                y_sum = np.bincount(codes[kept], weights=y[kept])
+                size = np.bincount(codes[kept])
+                bad = (y_sum == 0)
+                if self.nosingles:
+                    bad |= size == 1
+                drop[kept] |= bad[codes[kept]]
+            # A regressor that is zero whenever `y` is positive separates
+            # the observations where it is nonzero only if it has one sign
+            # there (Santos Silva and Tenreyro, 2010)
+            positive = keep & (y > 0)
+            zero = keep & (y == 0)
+            one_sign = ~((x[zero] > 0).any(axis=0) & (x[zero] < 0).any(axis=0))
+            separating = ~(x[positive] != 0).any(axis=0) & one_sign
+            drop |= keep & (x[:, separating] != 0).any(axis=1)
+            if not drop.any():
+                break
+            keep &= ~drop
+
+        omitted = [col for col in self.x.columns
+                   if not (self.x[col].values[keep] != 0).any()]
+        self.results_extra = {'separated': int((~keep).sum()),
+                              'omitted': omitted}
+        if keep.all() and not omitted:
+            return
+        for label in self.sample_store_labels:
+            value = self.__dict__[label]
+            if value is not None:
+                self.__dict__[label] = value.loc[keep].reset_index(drop=True)
+        self.y_raw = self.y
+        self.x = self.x.drop(omitted, axis=1)
+        rows = np.flatnonzero(self.sample.values)
+        self.sample = self.sample.copy()
+        self.sample.iloc[rows[~keep]] = False
+        if self.cluster_id is not None:
+            self.clusters = ClusterStructure(self.cluster_id)
+
+    def estimate(self):
+        y = self.y.values.astype(np.float64)
+        x = self.x.values.astype(np.float64)
+        codes_list = self._fe_codes()
+
+        mu = (y + y.mean()) / 2
+        eta = np.log(mu)
+        deviance = np.inf
+        x_tilde = z_tilde = z_last = None
+        for iteration in range(1, self.maxiter + 1):
+            z = eta + (y - mu) / mu
+            if codes_list:
+                # Warm start: last solution differs from `x` (and from `z`,
+                # plus its change) by a function of the fixed effects
+                x_tilde = demean_multi(codes_list, x, weights=mu,
+                                       start=x_tilde)
+                z_start = None if z_tilde is None else z_tilde + z - z_last
+                z_tilde = demean_multi(codes_list, z, weights=mu,
+                                       start=z_start)
+            else:
+                x_tilde, z_tilde = x, z
+            z_last = z
+            row_wt = np.sqrt(mu)
+            beta, xpx_inv = fitguts(
+                z_tilde * row_wt,
+                pd.DataFrame(x_tilde * row_wt[:, np.newaxis],
+                             columns=self.x.columns))
+            eta = z - (z_tilde - x_tilde.dot(beta.values))
+            mu = np.exp(eta)
+            if not np.all(np.isfinite(mu)):
+                raise ValueError("PPML diverged; check for separation")
+            last_deviance = deviance
+            deviance = _poisson_deviance(y, mu)
+            scale = max(min(deviance, last_deviance), .1)
+            if abs(deviance - last_deviance) <= self.tol * scale:
+                break
+        else:
+            raise ValueError("PPML did not converge in {} iterations".format(
+                self.maxiter))
+
+        self.mu = mu
+        self.x_tilde = pd.DataFrame(x_tilde, columns=self.x.columns)
+        self.results = Results(beta=beta, xpx_inv=xpx_inv)
+        self.results._add_stat('deviance', deviance)
+        self.results._add_stat(
+            'll', np.sum(y * eta - mu - gammaln(y + 1)))
+        self.results._add_stat('iterations', iteration)
+        for name, stat in self.results_extra.items():
+            self.results._add_stat(name, stat)
+        self._set_sst(self.y)
+
+    def _fe_target(self):
+        # The linear index fits exactly: `log(mu) = X*beta + alpha`
+        return np.log(self.mu) - self.x.values.dot(self.results.beta.values)
+
+    def get_vce(self):
+        x = self.x_tilde
+        resid = self.y - self.mu
+        xpx_inv = self.results.xpx_inv
+        if self.vce_type in ('robust', 'hc1'):
+            vce = vce_robust(xpx_inv, resid, x)
+        elif self.vce_type == 'cluster':
+            vce = vce_cluster(xpx_inv, resid, x, self.clusters)
+        elif self.vce_type == 'shac':
+            vce = vce_shac(xpx_inv, resid, x, *self._shac_args())
+        elif self.vce_type in ('hac', 'driscoll-kraay'):
+            vce = vce_hac(xpx_inv, resid, x, *self._hac_args())
+        else:
+            raise ValueError
+
+        vce = _wrapSigma((vce + vce.T) / 2, x.columns)
+        self.results._add_stat('vce', vce)
+        self.results._add_stat('yhat', pd.Series(self.mu, name=self.y.name))
+        self.results._add_stat('resid', resid)
+        self.results._add_stat('sample', self.sample)
+        self.results._add_stat('singletons', self.singleton_rounds)
+
+
+def _poisson_deviance(y, mu):
+    pos = y > 0
+    return 2 * (np.sum(y[pos] * np.log(y[pos] / mu[pos])) - np.sum(y - mu))
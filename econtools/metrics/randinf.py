@@ -0,0 +1,192 @@
+from __future__ import division
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import numpy as np
+import numpy.linalg as la
+
+from econtools.util import force_list
+from econtools.metrics.core import Regression
+from econtools.metrics.regutil import demean_multi
+from econtools.metrics.factor import is_factor_term
+
+
+def randinf(df, y_name, treat_name, x_name=None,
+            reps=1000, strata=None, seed=None, n_jobs=1, batch=100,
+            a_name=None, nosingles=True,
+            vce_type=None, cluster=None,
+            addcons=None, nocons=False,
+            ):
+    """Randomization inference (Fisher exact test) for a treatment effect.
+
+    Args:
+        df (DataFrame): Data with any relevant variables.
+        y_name (str): Column name in ``df`` of the dependent variable.
+        treat_name (str): Column name in ``df`` of the treatment variable.
+        x_name (str or list): Column name(s) in ``df`` of control variables.
+
+    Keyword Args:
+        reps (int): Defaults to 1000. Number of permutations of the
+            treatment.
+        strata (str): Column name in ``df`` of randomization strata.
+            Treatment is only permuted within strata.
+        seed (int): Seed for :py:class:`numpy.random.SeedSequence`. Results
+            are reproducible for a given ``seed`` and ``batch``, whatever the
+            value of ``n_jobs``.
+        n_jobs (int): Defaults to 1. Number of processes to spread batches of
+            permutations over (-1 for all cores).
+        batch (int): Defaults to 100. Permutations per batch. Each batch is
+            an N-by-``batch`` array of treatment vectors.
+        cluster (str): Column name in ``df`` of the units of randomization.
+            Treatment (and ``strata``) must be constant within clusters, and
+            whole clusters are permuted. Also used to cluster the standard
+            errors of the observed regression.
+        **All other keyword args in :py:func:`~econtools.metrics.reg` may
+            also be used.
+
+    Returns:
+        The :py:class:`~econtools.metrics.core.Results` object of the
+        observed regression with extra attributes:
+            - ``ri_null`` (*array*): Coefficient on ``treat_name`` for each
+              permutation, i.e., its randomization distribution under the
+              sharp null of no effect.
+            - ``ri_p`` (*float*): Two-sided randomization p-value, the share
+              of permutations with a coefficient at least as large in
+              absolute value as the observed one.
+
+    Notes:
+        By Frisch-Waugh-Lovell, the treatment coefficient is
+        :math:`\\tilde t'\\tilde y / \\tilde t'\\tilde t`, where tildes
+        denote residuals from the fixed effects and controls. ``y`` is
+        residualized once; each batch of permuted treatments is demeaned
+        within fixed effects and projected off an orthonormal basis of the
+        controls, also found once.
+    """
+
+    RandInfWorker = RandInf(
+        df, y_name, [treat_name] + force_list(x_name or []),
+        treat_name=treat_name, reps=reps, strata=strata, seed=seed,
+        n_jobs=n_jobs, batch=batch,
+        a_name=a_name, nosingles=nosingles, addcons=addcons, nocons=nocons,
+        vce_type=vce_type, cluster=cluster,
+        awt_name=None, shac=None,
+    )
+
+    results = RandInfWorker.main()
+    return results
+
+
+class RandInf(Regression):
+
+    sparse_x = False
+
+    def __init__(self, *args, **kwargs):
+        super(RandInf, self).__init__(*args, **kwargs)
+        if is_factor_term(self.treat_name, self.df.columns):
+            raise ValueError("`treat_name` must be a column of `df`")
+        # Keep the raw treatment and strata for the sample
+        self.sample_cols_labels += ('treat_name', 'strata')
+        self.sample_store_labels += ('treat', 'strata_id')
+
+    def main(self):
+        results = super(RandInf, self).main()
+        self.partialled = self._partial_out()
+        units, t_unit, strata_unit = self._randomization_units()
+        null = self._null_distribution(units, t_unit, strata_unit)
+        beta = results.beta[self.treat_name]
+        self.results._add_stat('ri_null', null)
+        self.results._add_stat('ri_p', np.mean(
+            np.abs(null) >= np.abs(beta) * (1 - 1e-10)))
+        return results
+
+    def _partial_out(self):
+        """ Residualize `y` and find a basis for the controls, once. """
+        controls = self.x.drop(self.treat_name, axis=1).values
+        if controls.shape[1]:
+            U, s, __ = la.svd(controls, full_matrices=False)
+            basis = U[:, s > s.max() * max(controls.shape) * 1e-15]
+        else:
+            basis = None
+        if self.A is None:
+            codes_list = None
+        else:
+            A = self.A.to_frame() if isinstance(self.A, pd.Series) else self.A
+            codes_list = [pd.factorize(col)[0] for __, col in A.items()]
+        partialled = _Partialled(codes_list, basis)
+        partialled.y_tilde = partialled.residualize(self.y.values)
+        return partialled
+
+    def _randomization_units(self):
+        """ Unit codes and each unit's treatment and stratum. """
+        treat = self.treat.values.astype(np.float64)
+        if self.clusters is None:
+            units = np.arange(len(treat))
+        else:
+            units = self.clusters.codes
+        first = np.unique(units, return_index=True)[1]
+        t_unit = treat[first]
+        if np.any(t_unit[units] != treat):
+            raise ValueError("Treatment must be constant within clusters")
+        if self.strata_id is None:
+            strata_unit = np.zeros(len(first), dtype=np.int64)
+        else:
+            strata_codes = pd.factorize(self.strata_id)[0]
+            strata_unit = strata_codes[first]
+            if np.any(strata_unit[units] != strata_codes):
+                raise ValueError("Strata must be constant within clusters")
+        return units, t_unit, strata_unit
+
+    def _null_distribution(self, units, t_unit, strata_unit):
+        sizes = [min(self.batch, self.reps - start)
+                 for start in range(0, self.reps, self.batch)]
+        seeds = np.random.SeedSequence(self.seed).spawn(len(sizes))
+        args = [(self.partialled, units, t_unit, strata_unit, seed, size)
+                for seed, size in zip(seeds, sizes)]
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs == -1 else self.n_jobs
+        if n_jobs > 1 and len(args) > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                parts = list(pool.map(_null_batch, args))
+        else:
+            parts = [_null_batch(arg) for arg in args]
+        return np.concatenate(parts)
+
+
+class _Partialled(object):
+    """ Fixed-effect codes and control basis for Frisch-Waugh residuals. """
+
+    def __init__(self, codes_list, basis):
+        self.codes_list = codes_list
+        self.basis = basis
+        self.y_tilde = None
+
+    def residualize(self, v):
+        if self.codes_list is not None:
+            v = demean_multi(self.codes_list, v)
+        if self.basis is not None:
+            v = v - self.basis.dot(self.basis.T.dot(v))
+        return v
+
+    def betas(self, t):
+        """ Treatment coefficient for each column of `t`. """
+        t_tilde = self.residualize(t)
+        return t.T.dot(self.y_tilde) / np.einsum('ij,ij->j', t_tilde, t_tilde)
+
+
+def _null_batch(args):
+    """ Coefficients for one batch of permutations (run in a worker). """
+    partialled, units, t_unit, strata_unit, seed, size = args
+    rng = np.random.default_rng(seed)
+    t_perm = _permute_within(t_unit, strata_unit, rng, size)
+    return partialled.betas(t_perm[:, units].T)
+
+
+def _permute_within(t_unit, strata_unit, rng, size):
+    """ `size` permutations (rows) of `t_unit` within integer strata. """
+    # Sorting stratum + uniform noise shuffles units within strata
+    base = np.argsort(strata_unit, kind='mergesort')
+    order = np.argsort(strata_unit + rng.random((size, len(t_unit))), axis=1)
+    t_perm = np.empty((size, len(t_unit)))
+    t_perm[:, base] = t_unit[order]
+    return t_perm
@@ -1,5 +1,7 @@
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import lsqr
 
 from econtools.util import force_list, force_iterable, force_df
 
@@ -53,30 +55,288 @@ def _demean_guts(A, args):      #noqa
             yield demeaned
 
 
+def group_sums(codes, v, n_groups=None):
+    """Sum the columns of array `v` within integer groups `codes`."""
+    if n_groups is None:
+        n_groups = codes.max() + 1
+    if v.ndim == 1:
+        return np.bincount(codes, weights=v, minlength=n_groups)
+    sums = np.empty((n_groups, v.shape[1]))
+    for col in range(v.shape[1]):
+        sums[:, col] = np.bincount(codes, weights=v[:, col],
+                                   minlength=n_groups)
+    return sums
+
+
+class ClusterStructure(object):
+    """
+    Cluster codes, counts, and sort order, built once per sample and shared
+    by the cluster VCE, its DoF correction, and fixed-effect nesting checks.
+
+    Args:
+        cluster_id (Series): Cluster of each observation.
+
+    Attributes:
+        name (str): Name of ``cluster_id``.
+        codes (array): Integer cluster codes, ``0`` to ``n_clusters - 1``.
+        counts (array): Observations in each cluster.
+        order (array): Stable sort of observations by cluster.
+        n_clusters (int): Number of clusters.
+    """
+
+    def __init__(self, cluster_id):
+        self.name = getattr(cluster_id, 'name', None)
+        self.codes = pd.factorize(np.asarray(cluster_id).ravel())[0]
+        self.counts = np.bincount(self.codes)
+        self.n_clusters = len(self.counts)
+        self.order = np.argsort(self.codes, kind='mergesort')
+        self._starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+
+    def sums(self, v):
+        """ Sum the rows of array `v` within clusters in one segment-sum. """
+        return np.add.reduceat(v[self.order], self._starts, axis=0)
+
+    def meat(self, xu):
+        """ Cluster-robust meat, `sum_g (sum_i xu_i)'(sum_i xu_i)`. """
+        scores = self.sums(xu)
+        return scores.T.dot(scores)
+
+    def nests(self, A):
+        """ True if each group in Series `A` is within a single cluster. """
+        if self.name is not None and self.name == getattr(A, 'name', None):
+            return True
+        a_codes = pd.factorize(np.asarray(A).ravel())[0]
+        pairs = np.unique(a_codes.astype(np.int64) * self.n_clusters +
+                          self.codes)
+        return np.bincount(pairs // self.n_clusters).max() == 1
+
+
+def demean_codes(codes, v, weights=None):
+    """Subtract (weighted) group means of array `v` within groups `codes`."""
+    if weights is None:
+        counts = np.bincount(codes).astype(np.float64)
+        sums = group_sums(codes, v, len(counts))
+    else:
+        counts = np.bincount(codes, weights=weights)
+        wv = v * (weights if v.ndim == 1 else weights[:, np.newaxis])
+        sums = group_sums(codes, wv, len(counts))
+    if v.ndim == 1:
+        return v - (sums / counts)[codes]
+    return v - (sums / counts[:, np.newaxis])[codes]
+
+
+def demean_multi(codes_list, v, weights=None, tol=1e-10, maxiter=10000,
+                 start=None):
+    """
+    Residualize array `v` on several sets of group dummies by alternating
+    projections (method of alternating projections, MAP).
+
+    Args:
+        codes_list (list): Integer group codes, one array per dimension.
+        v (array): 1D or 2D array to demean.
+
+    Keyword Args:
+        weights (array): Observation weights for weighted means.
+        tol (float): Convergence tolerance on the largest change in any
+            element, relative to the scale of its column of `v`. Columns
+            stop iterating once they converge, so each column's result does
+            not depend on the other columns.
+        maxiter (int): Maximum number of sweeps through all dimensions.
+        start (array): Optional starting value (e.g. a previous solution for
+            nearby data) that differs from `v` only by a function of the
+            group dummies.
+
+    Returns:
+        Demeaned array, same shape as `v`.
+    """
+    resid = v if start is None else start
+    if len(codes_list) == 1:
+        return demean_codes(codes_list[0], resid, weights=weights)
+    if v.ndim == 1:
+        return demean_multi(codes_list, v[:, np.newaxis], weights=weights,
+                            tol=tol, maxiter=maxiter,
+                            start=resid[:, np.newaxis])[:, 0]
+    scale = np.maximum(np.max(np.abs(v), axis=0) if v.size else 0, 1.)
+    resid = np.array(resid, dtype=np.float64)
+    active = np.arange(v.shape[1])
+    for __ in range(maxiter):
+        last = resid[:, active]
+        new = last
+        for codes in codes_list:
+            new = demean_codes(codes, new, weights=weights)
+        resid[:, active] = new
+        change = np.max(np.abs(new - last), axis=0) if len(new) else 0
+        active = active[change > tol * scale[active]]
+        if not len(active):
+            return resid
+    raise ValueError("Demeaning did not converge")
+
+
+def recover_fixed_effects(codes_list, target, weights=None, tol=1e-10,
+                          maxiter=None):
+    """
+    Least-squares fixed effects from `target` (`y - X*beta` before
+    demeaning). One set of groups uses (weighted) group means; several use
+    LSQR on the sparse dummy matrix, after which each set but the first is
+    shifted to mean zero and the shift added to the first. Memory is linear
+    in observations and groups.
+
+    Returns:
+        List of arrays, the fixed effect of each group code in `codes_list`.
+    """
+    w = np.ones(len(target)) if weights is None else np.asarray(
+        weights, dtype=np.float64)
+    if len(codes_list) == 1:
+        codes = codes_list[0]
+        return [np.bincount(codes, weights=w * target) /
+                np.bincount(codes, weights=w)]
+
+    sizes = [codes.max() + 1 for codes in codes_list]
+    offsets = np.cumsum([0] + sizes[:-1])
+    sqrt_w = np.sqrt(w)
+    rows = np.tile(np.arange(len(target)), len(codes_list))
+    cols = np.concatenate([codes + offset
+                           for codes, offset in zip(codes_list, offsets)])
+    D = sp.csr_matrix((np.tile(sqrt_w, len(codes_list)), (rows, cols)),
+                      shape=(len(target), sum(sizes)))
+    solution = lsqr(D, sqrt_w * target, atol=tol, btol=tol,
+                    iter_lim=maxiter)[0]
+    alphas = [solution[offset:offset + size]
+              for offset, size in zip(offsets, sizes)]
+    # Normalize: FEs after the first have mean zero over observations
+    for codes, alpha in zip(codes_list[1:], alphas[1:]):
+        shift = np.average(alpha[codes], weights=w)
+        alpha -= shift
+        alphas[0] += shift
+    return alphas
+
+
 def unpack_shac_args(argdict):
     if argdict is None:
-        return None, None, None, None
+        return None, None, None, None, None, None, None, None
 
     # Check if extra args passed (Do NOT alter `argdict` with `pop`!)
-    extra_args = set(argdict.keys()).difference(set(('x', 'y', 'band', 'kern')))
+    valid_args = set(('x', 'y', 'band', 'kern', 'time', 'lag', 'metric',
+                      'n_jobs'))
+    extra_args = set(argdict.keys()).difference(valid_args)
     if extra_args:
         err_str = 'Extra `shac` args: {}'
         raise ValueError(err_str.format(tuple(extra_args)))
+    if 'lag' in argdict and 'time' not in argdict:
+        raise ValueError("`shac` arg 'lag' requires 'time'")
 
     shac_x = argdict['x']
     shac_y = argdict['y']
     shac_band = argdict['band']
     shac_kern = argdict['kern']
+    shac_time = argdict.get('time', None)
+    shac_lag = argdict.get('lag', None)
+    shac_metric = argdict.get('metric', 'euclidean')
+    if shac_metric not in ('euclidean', 'haversine'):
+        raise ValueError("`shac` metric must be 'euclidean' or 'haversine'")
+
+    shac_n_jobs = argdict.get('n_jobs', 1)
+
+    return (shac_x, shac_y, shac_band, shac_kern, shac_time, shac_lag,
+            shac_metric, shac_n_jobs)
+
+
+def unpack_hac_args(argdict):
+    if argdict is None:
+        return None, None, None, None
+
+    extra_args = set(argdict.keys()).difference(
+        set(('time', 'panel', 'lags', 'kern')))
+    if extra_args:
+        err_str = 'Extra `hac` args: {}'
+        raise ValueError(err_str.format(tuple(extra_args)))
+
+    hac_time = argdict['time']
+    hac_panel = argdict.get('panel', None)
+    hac_lags = argdict.get('lags', None)
+    hac_kern = argdict.get('kern', 'bartlett')
 
-    return shac_x, shac_y, shac_band, shac_kern
+    return hac_time, hac_panel, hac_lags, hac_kern
 
 
-def flag_nonsingletons(df, avar, sample):
-    """Boolean flag for 'not from a singleton `avar` group."""
-    counts = df[sample].groupby(avar).size()
-    big_counts = df[[avar]].join(counts.to_frame('_T'), on=avar).fillna(0)
-    non_single = big_counts['_T'] > 1
-    return non_single
+_LO_SIZE = 2 ** 26
+
+
+def prune_singletons(codes_list):
+    """
+    Iteratively drop observations in singleton groups of any of the integer
+    group codes in `codes_list` until none are left, since dropping a
+    singleton in one dimension can create new singletons in another.
+
+    Each group keeps its count and the sum of its rows' indices (in two
+    float parts, exact for groups of up to 2**27 rows), so a group with one
+    row left gives that row directly. Only the first round touches every
+    row; later rounds only touch the groups of dropped rows.
+
+    Returns:
+        tuple: A tuple containing:
+            - **keep** (*array*): Boolean flag for rows that are kept.
+            - **rounds** (*list*): Rows dropped in each round.
+    """
+    n = len(codes_list[0]) if codes_list else 0
+    keep = np.ones(n, dtype=bool)
+    if not n:
+        return keep, []
+    counts, lo_sums, hi_sums = [], [], []
+    for codes in codes_list:
+        size = codes.max() + 1
+        count = lo_sum = hi_sum = 0
+        # Rows in a chunk share the high part of their index
+        for start in range(0, n, _LO_SIZE):
+            chunk = codes[start:start + _LO_SIZE]
+            chunk_count = np.bincount(chunk, minlength=size)
+            count = count + chunk_count
+            lo_sum = lo_sum + np.bincount(
+                chunk, weights=np.arange(len(chunk), dtype=np.float64),
+                minlength=size)
+            hi_sum = hi_sum + (start // _LO_SIZE) * chunk_count
+        counts.append(count)
+        lo_sums.append(lo_sum)
+        hi_sums.append(np.asarray(hi_sum, dtype=np.float64))
+
+    groups = [np.flatnonzero(count == 1) for count in counts]
+    rounds = []
+    while True:
+        dropped = []
+        for g, lo_sum, hi_sum in zip(groups, lo_sums, hi_sums):
+            # A row can be the last in its groups of several dimensions
+            single = _group_row(lo_sum[g], hi_sum[g])
+            single = single[keep[single]]
+            keep[single] = False
+            dropped.append(single)
+        single = np.concatenate(dropped)
+        if not len(single):
+            return keep, rounds
+        rounds.append(len(single))
+        groups = []
+        for codes, count, lo_sum, hi_sum in zip(codes_list, counts, lo_sums,
+                                                hi_sums):
+            touched = codes[single]
+            _subtract_at(count, touched, 1)
+            _subtract_at(lo_sum, touched, single % _LO_SIZE)
+            _subtract_at(hi_sum, touched, single // _LO_SIZE)
+            groups.append(np.unique(touched[count[touched] == 1]))
+
+
+def _group_row(lo_sum, hi_sum):
+    """ Row index from its parts (for groups with one row left) """
+    return (np.rint(hi_sum).astype(np.int64) * _LO_SIZE +
+            np.rint(lo_sum).astype(np.int64))
+
+
+def _subtract_at(totals, codes, values):
+    """ `totals[codes] -= values`, with repeated `codes` """
+    if 16 * len(codes) > len(totals):
+        weights = None if np.isscalar(values) else values.astype(np.float64)
+        totals -= np.bincount(codes, weights=weights,
+                              minlength=len(totals)).astype(totals.dtype)
+    else:
+        np.subtract.at(totals, codes, values)
 
 
 def winsorize(df, by, p=(.01, .99)):
@@ -0,0 +1,100 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+
+
+def discrete_data(N=3000):
+    np.random.seed(8642)
+    df = pd.DataFrame({
+        'treat': np.random.randint(0, 2, N).astype(float),
+        'period': np.random.randint(0, 4, N).astype(float),
+        'state': np.random.randint(0, 20, N),
+        'region': np.random.randint(0, 5, N),
+        'fw': np.random.randint(1, 4, N),
+    })
+    df['treat_post'] = df['treat'] * (df['period'] > 1)
+    df['y'] = (1 + df['treat'] + .3*df['period'] + .5*df['treat_post'] +
+               .05*df['state'] + np.random.normal(size=N))
+    df['lat'] = (df['state'] % 5).astype(float)
+    df['lon'] = (df['state'] // 5).astype(float)
+    return df
+
+
+class CollapseCompare(object):
+
+    vce_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        df = discrete_data()
+        x = ['treat', 'period', 'treat_post']
+        args = dict(addcons=True, **cls.vce_args)
+        cls.expected = reg(df, 'y', x, **args)
+        cls.result = reg(df, 'y', x, collapse=True, **args)
+        # Frequency weights are the same as expanding the data
+        expanded = df.loc[df.index.repeat(df['fw'])].reset_index(drop=True)
+        cls.expected_fw = reg(expanded, 'y', x, **args)
+        cls.result_fw = reg(df, 'y', x, fwt_name='fw', **args)
+        cls.result_fw_collapse = reg(df, 'y', x, fwt_name='fw',
+                                     collapse=True, **args)
+
+    def _compare(self, result, expected):
+        assert_array_almost_equal(result.beta, expected.beta)
+        assert_array_almost_equal(result.vce.values / expected.vce.values,
+                                  np.ones(expected.vce.shape))
+        assert_array_almost_equal(result.r2, expected.r2)
+        assert result.N == expected.N
+
+    def test_collapse(self):
+        assert len(self.result.resid) < self.result.N
+        self._compare(self.result, self.expected)
+
+    def test_fweights(self):
+        self._compare(self.result_fw, self.expected_fw)
+
+    def test_fweights_collapse(self):
+        self._compare(self.result_fw_collapse, self.expected_fw)
+
+
+class TestCollapse_std(CollapseCompare):
+    vce_args = {}
+
+
+class TestCollapse_robust(CollapseCompare):
+    vce_args = {'vce_type': 'robust'}
+
+
+class TestCollapse_hc3(CollapseCompare):
+    vce_args = {'vce_type': 'hc3'}
+
+
+class TestCollapse_cluster(CollapseCompare):
+    vce_args = {'cluster': 'state'}
+
+
+class TestCollapse_areg(CollapseCompare):
+    vce_args = {'a_name': 'region'}
+
+
+class TestCollapse_shac(CollapseCompare):
+    vce_args = {'shac': dict(x='lon', y='lat', kern='tria', band=2.)}
+
+
+def test_weight_conflict():
+    df = discrete_data(10)
+    try:
+        reg(df, 'y', 'treat', awt_name='fw', fwt_name='fw')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
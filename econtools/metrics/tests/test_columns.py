@@ -0,0 +1,181 @@
+from __future__ import division
+
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.columns import ColumnSource
+
+
+def column_data(N=3000):
+    np.random.seed(24680)
+    df = pd.DataFrame(np.random.normal(size=(N, 3)), columns=['a', 'b', 'c'])
+    df['y'] = 1 + df['a'] + 2 * df['b'] + np.random.normal(size=N)
+    df['clust'] = np.random.randint(0, 50, N)
+    df['aw'] = np.random.uniform(.5, 2, N)
+    df['fw'] = np.random.randint(1, 4, N).astype(float)
+    df.loc[::37, 'b'] = np.nan
+    df.loc[::51, 'y'] = np.nan
+    return df
+
+
+class ColumnCompare(object):
+
+    reg_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = column_data()
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.expected = reg(cls.df, 'y', ['a', 'b', 'c'], addcons=True,
+                           **cls.reg_args)
+        cls.results = [reg(data, 'y', ['a', 'b', 'c'], addcons=True,
+                           block_size=700, **cls.reg_args)
+                       for data in cls.sources()]
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    @classmethod
+    def sources(cls):
+        names = list(cls.df.columns)
+        path = os.path.join(cls.tmpdir, 'data.npy')
+        mm = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                       shape=cls.df.shape)
+        mm[:] = cls.df.values
+        mm.flush()
+        mm = np.load(path, mmap_mode='r')
+        yield {name: mm[:, j] for j, name in enumerate(names)}
+        yield cls.df.to_records(index=False)
+
+    def test_beta(self):
+        for result in self.results:
+            assert_array_almost_equal(result.beta, self.expected.beta)
+
+    def test_vce(self):
+        for result in self.results:
+            assert_array_almost_equal(result.vce, self.expected.vce)
+            assert_array_almost_equal(result.se, self.expected.se)
+
+    def test_stats(self):
+        for result in self.results:
+            assert result.N == self.expected.N
+            assert result.df_t == self.expected.df_t
+            assert_array_almost_equal(result.r2, self.expected.r2)
+            assert_array_almost_equal(result.F, self.expected.F)
+            assert (result.sample == self.expected.sample).all()
+
+
+class TestColumns_std(ColumnCompare):
+    reg_args = {}
+
+
+class TestColumns_robust(ColumnCompare):
+    reg_args = {'vce_type': 'robust'}
+
+
+class TestColumns_cluster_awt(ColumnCompare):
+    reg_args = {'cluster': 'clust', 'awt_name': 'aw'}
+
+
+class TestColumns_cluster_fwt(ColumnCompare):
+    reg_args = {'cluster': 'clust', 'fwt_name': 'fw'}
+
+
+class TestColumns_robust_fwt(ColumnCompare):
+    reg_args = {'vce_type': 'robust', 'fwt_name': 'fw'}
+
+
+class TestColumnsArrow(ColumnCompare):
+
+    reg_args = {'cluster': 'clust'}
+
+    @classmethod
+    def setup_class(cls):
+        import pytest
+        cls.pa = pytest.importorskip('pyarrow')
+        super(TestColumnsArrow, cls).setup_class()
+
+    @classmethod
+    def sources(cls):
+        df = cls.df.copy()
+        df['clust'] = 'c' + df['clust'].astype(str)
+        table = cls.pa.Table.from_pandas(df, preserve_index=False)
+        # Chunks that don't line up with the blocks; NaNs are nulls
+        table = cls.pa.concat_tables([table.slice(0, 1000),
+                                      table.slice(1000)])
+        assert table.column('b').null_count > 0
+        yield table
+        yield table.combine_chunks().to_batches()[0]
+
+    def test_validity(self):
+        table = self.pa.table({'v': [1., None, 3., None, 5.]})
+        values, valid = ColumnSource(table.slice(1)).values('v', 0, 4)
+        assert list(valid) == [False, True, False, True]
+
+
+class TestColumnsLargeMean(object):
+
+    @classmethod
+    def setup_class(cls):
+        df = column_data()
+        df['y'] += 100
+        cls.df = df.dropna()
+        cls.data = {name: cls.df[name].values for name in cls.df.columns}
+
+    def test_ssr(self):
+        # y'y - b'X'y loses about 4 digits of the SSR when mean(y) is 100
+        for args in ({}, {'awt_name': 'aw'}, {'fwt_name': 'fw'}):
+            expected = reg(self.df, 'y', ['a', 'b', 'c'], addcons=True,
+                           **args)
+            result = reg(self.data, 'y', ['a', 'b', 'c'], addcons=True,
+                         block_size=700, **args)
+            np.testing.assert_allclose(result.ssr, expected.ssr, rtol=1e-13)
+            np.testing.assert_allclose(result.r2, expected.r2, rtol=1e-13)
+
+
+class TestColumnErrors(object):
+
+    @classmethod
+    def setup_class(cls):
+        df = column_data()
+        cls.data = {name: df[name].values for name in df.columns}
+
+    def test_unsupported(self):
+        for kwargs in ({'a_name': 'clust'}, {'vce_type': 'hc2'},
+                       {'collapse': True}, {'dtype': 'float32'}):
+            try:
+                reg(self.data, 'y', ['a', 'b'], **kwargs)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(kwargs)
+
+    def test_missing_column(self):
+        try:
+            reg(self.data, 'y', ['a', 'd'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+    def test_lengths(self):
+        data = dict(self.data, a=self.data['a'][:-1])
+        try:
+            reg(data, 'y', ['a', 'b'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,212 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.did import att_gt
+
+
+def staggered_data(n_units=500, periods=range(2001, 2009)):
+    np.random.seed(8642)
+    cohort = np.random.choice([0, 2003, 2004, 2006, 2010], n_units)
+    unit = np.repeat(np.arange(n_units), len(periods))
+    year = np.tile(np.array(periods), n_units)
+    first = cohort[unit]
+    effect = np.where((first > 0) & (year >= first), .5 * (year - first + 1),
+                      0)
+    df = pd.DataFrame({'id': unit, 'year': year, 'first': first,
+                       'clust': unit // 7})
+    df['y'] = (np.random.normal(size=n_units)[unit] + .1 * (year - 2000) +
+               effect + np.random.normal(size=len(df)))
+    # An unbalanced unit and a unit treated in the first period
+    df = df.drop(df.index[(df['id'] == 3) & (df['year'] == 2005)])
+    df.loc[df['id'] == 4, 'first'] = 2001
+    return df
+
+
+def cell_setup(df, g, t, control_group, base_period):
+    """ Wide outcomes, base period, and treated and control flags. """
+    wide = df.pivot(index='id', columns='year', values='y').dropna()
+    first = df.groupby('id')['first'].first().loc[wide.index]
+    first = first.where(first <= wide.columns[-1], 0)
+    keep = (first == 0) | (first > wide.columns[0])
+    wide, first = wide[keep], first[keep]
+    years = list(wide.columns)
+    t_pos, g_base = years.index(t), years.index(g) - 1
+    if t >= g or base_period == 'universal':
+        base = g_base
+    else:
+        base = t_pos - 1
+    control = first == 0
+    if control_group == 'notyettreated':
+        control |= (first > years[max(t_pos, base)]) & (first != g)
+    return wide[t] - wide[years[base]], first == g, control, first
+
+
+class CellCompare(object):
+    """ Each ATT(g, t) is a 2x2 regression on the treated and controls. """
+
+    att_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = staggered_data()
+        cls.results = att_gt(cls.df, 'y', 'id', 'year', 'first',
+                             **cls.att_args)
+
+    def test_cells(self):
+        cluster = self.att_args.get('cluster')
+        clust = self.df.groupby('id')['clust'].first()
+        for g, t in self.results.beta.index:
+            dy, treated, control, __ = cell_setup(
+                self.df, g, t, self.att_args.get('control_group',
+                                                 'nevertreated'),
+                self.att_args.get('base_period', 'varying'))
+            sub = pd.DataFrame({'dy': dy, 'D': treated.astype(float),
+                                'clust': clust.loc[dy.index]})[
+                                    treated | control]
+            if cluster is None:
+                expected = reg(sub, 'dy', 'D', addcons=True,
+                               vce_type='robust')
+                correct = expected.N / (expected.N - 2)
+            else:
+                expected = reg(sub, 'dy', 'D', addcons=True, cluster=cluster)
+                correct = ((expected.N - 1) / (expected.N - 2) *
+                           expected.g / (expected.g - 1))
+            assert_array_almost_equal(self.results.beta[(g, t)],
+                                      expected.beta['D'])
+            # Without small-sample corrections
+            assert_array_almost_equal(self.results.se[(g, t)] ** 2,
+                                      expected.se['D'] ** 2 / correct)
+
+    def test_sample(self):
+        assert self.results.n_dropped == 2
+        assert self.results.N == 498
+
+
+class TestCells_never(CellCompare):
+    att_args = {}
+
+
+class TestCells_notyet_universal(CellCompare):
+    att_args = {'control_group': 'notyettreated',
+                'base_period': 'universal'}
+
+
+class TestCells_notyet_cluster(CellCompare):
+    att_args = {'control_group': 'notyettreated', 'cluster': 'clust'}
+
+
+class TestAggregate(object):
+    """ Aggregates against influence functions built unit by unit. """
+
+    cluster = None
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = staggered_data()
+        cls.results = att_gt(cls.df, 'y', 'id', 'year', 'first',
+                             control_group='notyettreated',
+                             cluster=cls.cluster)
+        cells = cls.results.beta.index
+        cls.inf = {}
+        for g, t in cells:
+            dy, treated, control, first = cell_setup(
+                cls.df, g, t, 'notyettreated', 'varying')
+            N = len(dy)
+            cls.inf[(g, t)] = (
+                treated * (dy - dy[treated].mean()) * N / treated.sum() -
+                control * (dy - dy[control].mean()) * N / control.sum())
+        cls.first = first
+        cls.N = N
+
+    def brute(self, cells, weighted=True):
+        att = self.results.beta[cells].values
+        p = np.array([(self.first == g).mean() for g, __ in cells])
+        w = p / p.sum() if weighted else np.ones(len(p)) / len(p)
+        theta = w.dot(att)
+        inf = sum(w_a * self.inf[cell] for w_a, cell in zip(w, cells))
+        if weighted:
+            # Influence of the estimated cohort shares
+            for a, (g, __) in enumerate(cells):
+                inf += (att[a] - theta) * ((self.first == g) - p[a]) / p.sum()
+        if self.cluster is not None:
+            clust = self.df.groupby('id')['clust'].first().loc[inf.index]
+            inf = inf.groupby(clust).sum()
+        return theta, np.sqrt(inf.dot(inf)) / self.N
+
+    def check(self, kind, key_func, post_only=True, weighted=True):
+        agg = self.results.aggregate(kind)
+        cells = self.results.beta.index
+        for key in agg.beta.index:
+            subset = [c for c in cells if key_func(c) == key and
+                      (not post_only or c[1] >= c[0])]
+            theta, se = self.brute(subset, weighted=weighted)
+            assert_array_almost_equal(agg.beta[key], theta)
+            assert_array_almost_equal(agg.se[key], se)
+
+    def test_dynamic(self):
+        self.check('dynamic', lambda c: c[1] - c[0], post_only=False)
+
+    def test_calendar(self):
+        self.check('calendar', lambda c: c[1])
+
+    def test_group(self):
+        self.check('group', lambda c: c[0], weighted=False)
+
+    def test_simple(self):
+        self.check('simple', lambda c: 'ATT')
+
+    def test_ftest(self):
+        # Pre-trends are jointly zero (the effects start at treatment)
+        agg = self.results.aggregate('dynamic')
+        pre = [e for e in agg.beta.index if e < 0]
+        F, pF = agg.Ftest(pre)
+        assert pF > .01
+
+
+class TestAggregate_cluster(TestAggregate):
+    cluster = 'clust'
+
+
+class TestErrors(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = staggered_data()
+
+    def test_args(self):
+        for kwargs in ({'control_group': 'all'}, {'base_period': 'first'}):
+            try:
+                att_gt(self.df, 'y', 'id', 'year', 'first', **kwargs)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(kwargs)
+
+    def test_cohort_varies(self):
+        df = self.df.copy()
+        df.loc[df.index[0], 'first'] = 2004
+        try:
+            att_gt(df, 'y', 'id', 'year', 'first')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+    def test_aggregate_kind(self):
+        results = att_gt(self.df, 'y', 'id', 'year', 'first')
+        try:
+            results.aggregate('cohort')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
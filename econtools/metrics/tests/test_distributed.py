@@ -0,0 +1,137 @@
+from __future__ import division
+
+from functools import partial
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.distributed import (distreg, LocalExecutor,
+                                           ProcessExecutor, SocketExecutor)
+
+
+def shard_data(N=2400):
+    np.random.seed(13579)
+    df = pd.DataFrame(np.random.normal(size=(N, 3)), columns=['a', 'b', 'c'])
+    df['fe'] = np.random.randint(0, 150, N)
+    df['state'] = df['fe'] // 10
+    df['clust'] = np.random.randint(0, 40, N)
+    df['y'] = df['a'] + 2 * df['b'] + .01 * df['fe'] + np.random.normal(size=N)
+    df.loc[::37, 'b'] = np.nan
+    # A singleton group
+    df.loc[5, 'fe'] = 999
+    return df
+
+
+def shards_of(df, cuts=(0, 500, 1700)):
+    """ Row ranges of `df`; groups and clusters span shards. """
+    cuts = list(cuts) + [len(df)]
+    return [df.iloc[start:stop] for start, stop in zip(cuts[:-1], cuts[1:])]
+
+
+def _load_shard(df, start, stop):
+    return {name: df[name].values[start:stop] for name in df.columns}
+
+
+class DistCompare(object):
+
+    reg_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = shard_data()
+        cls.expected = reg(cls.df, 'y', ['a', 'b', 'c'], **cls.reg_args)
+        cls.results = distreg(shards_of(cls.df), 'y', ['a', 'b', 'c'],
+                              block_size=300, **cls.reg_args)
+
+    def test_beta(self):
+        assert_array_almost_equal(self.results.beta, self.expected.beta)
+
+    def test_vce(self):
+        assert_array_almost_equal(self.results.vce, self.expected.vce)
+
+    def test_stats(self):
+        for stat in ('N', 'K', 'df_t', 'singletons'):
+            assert getattr(self.results, stat) == getattr(self.expected, stat)
+        assert_array_almost_equal(self.results.r2, self.expected.r2)
+        assert_array_almost_equal(self.results.F, self.expected.F)
+
+
+class TestDist_std(DistCompare):
+    reg_args = {'addcons': True}
+
+
+class TestDist_robust(DistCompare):
+    reg_args = {'addcons': True, 'vce_type': 'robust'}
+
+
+class TestDist_cluster(DistCompare):
+    reg_args = {'addcons': True, 'cluster': 'clust'}
+
+
+class TestDist_fe_cluster(DistCompare):
+    reg_args = {'a_name': 'fe', 'cluster': 'clust'}
+
+
+class TestDist_fe_nested(DistCompare):
+    reg_args = {'a_name': 'fe', 'cluster': 'state'}
+
+
+class TestDist_fe_singles(DistCompare):
+    reg_args = {'a_name': 'fe', 'vce_type': 'robust', 'nosingles': False}
+
+
+class TestDistLargeMean(object):
+
+    def test_ssr(self):
+        # y'y - b'X'y loses about 4 digits of the SSR when mean(y) is 100
+        df = shard_data()
+        df['y'] += 100
+        expected = reg(df, 'y', ['a', 'b', 'c'], addcons=True)
+        result = distreg(shards_of(df), 'y', ['a', 'b', 'c'], addcons=True,
+                         block_size=300)
+        np.testing.assert_allclose(result.ssr, expected.ssr, rtol=1e-13)
+        np.testing.assert_allclose(result.r2, expected.r2, rtol=1e-13)
+
+
+class TestExecutors(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = shard_data()
+        cls.expected = reg(cls.df, 'y', ['a', 'b'], a_name='fe',
+                           cluster='clust')
+        cls.shards = [partial(_load_shard, cls.df, start, start + 800)
+                      for start in range(0, len(cls.df), 800)]
+
+    def check(self, executor):
+        results = distreg(self.shards, 'y', ['a', 'b'], a_name='fe',
+                          cluster='clust', executor=executor)
+        assert_array_almost_equal(results.beta, self.expected.beta)
+        assert_array_almost_equal(results.vce, self.expected.vce)
+        assert results.g == self.expected.g
+
+    def test_local(self):
+        self.check(LocalExecutor())
+
+    def test_processes(self):
+        with ProcessExecutor(n_jobs=2) as executor:
+            self.check(executor)
+
+    def test_sockets(self):
+        with SocketExecutor.local(2) as executor:
+            self.check(executor)
+            # Worker errors are raised by the coordinator
+            try:
+                distreg(self.shards, 'y', ['a', 'd'], executor=executor)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,214 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.eventstudy import eventstudy
+
+
+def event_data(n_units=300, periods=range(2000, 2014)):
+    np.random.seed(2468)
+    event = np.random.choice([np.nan, 2003, 2006, 2009], n_units)
+    unit = np.repeat(np.arange(n_units), len(periods))
+    year = np.tile(np.array(periods), n_units)
+    df = pd.DataFrame({'id': unit, 'year': year, 'event': event[unit],
+                       'clust': unit // 10})
+    rel = (df['year'] - df['event']).values
+    effect = np.where(rel >= 0, .4 * (rel + 1), 0)
+    df['x1'] = np.random.normal(size=len(df))
+    df['wt'] = np.random.uniform(1, 3, n_units)[unit]
+    df['y'] = (np.random.normal(size=n_units)[unit] + .1 * (year - 2000) +
+               effect + .5 * df['x1'] + np.random.normal(size=len(df)))
+    return df
+
+
+def dummies(df, leads, lags, omit, bin_endpoints=True, cohort=False):
+    """ Dense relative-time (and cohort) dummies, built by hand. """
+    df = df.copy()
+    rel = df['year'] - df['event']
+    if bin_endpoints:
+        rel = rel.clip(-leads, lags)
+    else:
+        df = df[~((rel < -leads) | (rel > lags))]
+        rel = rel.loc[df.index]
+    cols, cells = [], []
+    cohorts = sorted(df['event'].dropna().unique()) if cohort else [None]
+    for g in cohorts:
+        for e in range(-leads, lags + 1):
+            if e in omit:
+                continue
+            col = 'd{}_{}'.format(g, e)
+            in_cell = rel == e
+            if g is not None:
+                in_cell &= df['event'] == g
+            if in_cell.any():
+                df[col] = in_cell.astype(float)
+                cols.append(col)
+                cells.append((g, e))
+    return df, cols, cells
+
+
+class EventCompare(object):
+    """ Pooled event study against a hand-built dummy regression. """
+
+    es_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = event_data()
+        args = dict(leads=3, lags=4, omit=[-1])
+        args.update(cls.es_args)
+        cls.results = eventstudy(cls.df, 'y', 'id', 'year', 'event',
+                                 x_name='x1', **args)
+        wide, cols, __ = dummies(cls.df, args['leads'], args['lags'],
+                                 args['omit'],
+                                 args.get('bin_endpoints', True))
+        reg_args = {key: args[key] for key in ('cluster', 'awt_name',
+                                               'vce_type') if key in args}
+        cls.expected = reg(wide, 'y', cols + ['x1'], a_name=['id', 'year'],
+                           **reg_args)
+        cls.wide, cls.cols = wide, cols
+
+    def test_beta(self):
+        assert_array_almost_equal(self.results.beta.values,
+                                  self.expected.beta.values)
+
+    def test_vce(self):
+        assert_array_almost_equal(self.results.vce.values,
+                                  self.expected.vce.values)
+
+    def test_stats(self):
+        for stat in ('N', 'K', 'df_t'):
+            assert getattr(self.results, stat) == getattr(self.expected, stat)
+
+    def test_path(self):
+        path = self.results.path
+        est = path.drop(-1)
+        assert_array_almost_equal(est['coeff'],
+                                  self.expected.beta[self.cols])
+        assert_array_almost_equal(est['se'], self.expected.se[self.cols])
+        assert_array_almost_equal(est['CI_low'],
+                                  self.expected.ci_lo[self.cols])
+        assert list(path.index) == list(range(-3, 5))
+        assert path.loc[-1, 'coeff'] == 0
+
+    def test_fixed_effects(self):
+        args = {key: self.es_args[key] for key in ('cluster', 'awt_name',
+                                                   'vce_type', 'bin_endpoints')
+                if key in self.es_args}
+        result = eventstudy(self.df, 'y', 'id', 'year', 'event', leads=3,
+                            lags=4, x_name='x1', save_fe=True, **args)
+        expected = reg(self.wide, 'y', self.cols + ['x1'],
+                       a_name=['id', 'year'], save_fe=True,
+                       **{key: args[key] for key in args
+                          if key != 'bin_endpoints'})
+        fe, fe_expected = result.fixed_effects(), expected.fixed_effects()
+        for name in ('id', 'year'):
+            assert_array_almost_equal(fe[name], fe_expected[name])
+
+    def test_pretrend(self):
+        pretrend = self.results.pretrend
+        assert list(pretrend.index) == [1, 2]
+        F, pF = self.expected.Ftest(['dNone_-2'])
+        assert_array_almost_equal(pretrend.loc[1].values, [F, pF])
+        F, pF = self.expected.Ftest(['dNone_-2', 'dNone_-3'])
+        assert_array_almost_equal(pretrend.loc[2].values, [F, pF])
+        assert pF > .01
+
+
+class TestEvent_std(EventCompare):
+    es_args = {}
+
+
+class TestEvent_cluster(EventCompare):
+    es_args = {'cluster': 'clust'}
+
+
+class TestEvent_awt(EventCompare):
+    es_args = {'awt_name': 'wt', 'vce_type': 'robust'}
+
+
+class TestEvent_nobin(EventCompare):
+    es_args = {'bin_endpoints': False, 'cluster': 'clust'}
+
+    def test_sample(self):
+        rel = self.df['year'] - self.df['event']
+        assert self.results.N == ((rel >= -3) & (rel <= 4) |
+                                  rel.isnull()).sum()
+
+
+class TestEvent_cohort(object):
+    """ Cohort-specific paths averaged by cohort share (Sun and Abraham). """
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = event_data()
+        cls.results = eventstudy(cls.df, 'y', 'id', 'year', 'event',
+                                 leads=3, lags=4, by_cohort=True,
+                                 cluster='clust')
+        wide, cols, cells = dummies(cls.df, 3, 4, [-1], cohort=True)
+        cls.expected = reg(wide, 'y', cols, a_name=['id', 'year'],
+                           cluster='clust')
+        cls.wide, cls.cols, cls.cells = wide, cols, cells
+
+    def test_beta(self):
+        assert_array_almost_equal(self.results.beta.values,
+                                  self.expected.beta.values)
+        assert self.results.beta.index[0] == '2003.event#-3.rel_time'
+
+    def test_path(self):
+        for e in range(-3, 5):
+            if e == -1:
+                continue
+            cols = [col for col, (g, e_a) in zip(self.cols, self.cells)
+                    if e_a == e]
+            w = self.wide[cols].sum().values
+            w = w / w.sum()
+            beta = self.expected.beta[cols].values
+            V = self.expected.vce.loc[cols, cols].values
+            assert_array_almost_equal(self.results.path.loc[e, 'coeff'],
+                                      w.dot(beta))
+            assert_array_almost_equal(self.results.path.loc[e, 'se'],
+                                      np.sqrt(w.dot(V).dot(w)))
+            assert_array_almost_equal(self.results.path_vce.loc[e, e],
+                                      w.dot(V).dot(w))
+
+    def test_pretrend(self):
+        # All cohorts' leads are tested jointly
+        cols = [col for col, (g, e) in zip(self.cols, self.cells) if e < -1]
+        F, pF = self.expected.Ftest(cols)
+        assert_array_almost_equal(self.results.pretrend.loc[2].values,
+                                  [F, pF])
+
+
+class TestErrors(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = event_data(n_units=40)
+
+    def test_window(self):
+        try:
+            eventstudy(self.df, 'y', 'id', 'year', 'event', leads=-1)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+    def test_integer_periods(self):
+        df = self.df.copy()
+        df['event'] += .5
+        try:
+            eventstudy(df, 'y', 'id', 'year', 'event')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
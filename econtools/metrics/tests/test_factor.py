@@ -0,0 +1,152 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg, ivreg
+from econtools.metrics.factor import (expand_factors, factor_sources,
+                                      is_factor_term)
+
+
+def factor_data(N=1500):
+    np.random.seed(97531)
+    df = pd.DataFrame({
+        'state': np.random.randint(1, 7, N),
+        'year': np.random.randint(2008, 2012, N).astype(float),
+        'group': np.random.choice(['a', 'b', 'c'], N),
+        'treat': np.random.normal(size=N),
+    })
+    df['y'] = (df['treat'] + .2 * df['state'] + .1 * (df['year'] - 2008) +
+               np.random.normal(size=N))
+    df['z'] = df['treat'] + np.random.normal(size=N)
+    return df
+
+
+def dummies(col, prefix, drop=None):
+    out = pd.get_dummies(col).astype(float)
+    if drop is not None:
+        out = out.drop(drop, axis=1)
+    out.columns = ['{}.{}'.format(int(c) if isinstance(c, float) else c,
+                                  prefix) for c in out.columns]
+    return out
+
+
+class TestParse(object):
+
+    def test_is_factor_term(self):
+        assert is_factor_term('i.state')
+        assert is_factor_term('ib2010.year#c.treat')
+        assert is_factor_term('i.state##i.year')
+        assert not is_factor_term('treat')
+        assert not is_factor_term('x.1')
+
+    def test_sources(self):
+        names = ['treat', 'i.group##c.treat', 'ibn.state']
+        assert factor_sources(names) == ['treat', 'group', 'state']
+
+
+class TestExpand(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = factor_data()
+
+    def test_main_effect(self):
+        result = expand_factors(self.df, ['i.state'])
+        expected = dummies(self.df['state'], 'state', drop=1)
+        assert list(result.columns) == list(expected.columns)
+        assert_array_almost_equal(result.sparse.to_dense(), expected)
+
+    def test_base_level(self):
+        result = expand_factors(self.df, ['ib2010.year'])
+        assert list(result.columns) == ['2008.year', '2009.year', '2011.year']
+        result = expand_factors(self.df, ['ibn.year'])
+        assert result.shape[1] == 4
+
+    def test_continuous_interaction(self):
+        result = expand_factors(self.df, ['i.group#c.treat'])
+        expected = dummies(self.df['group'], 'group').multiply(
+            self.df['treat'], axis=0)
+        expected.columns = [c + '#c.treat' for c in expected.columns]
+        assert list(result.columns) == list(expected.columns)
+        assert_array_almost_equal(result.sparse.to_dense(), expected)
+
+    def test_full_interaction(self):
+        result = expand_factors(self.df, ['i.group##c.treat'])
+        assert list(result.columns) == [
+            'b.group', 'c.group', 'treat', 'b.group#c.treat',
+            'c.group#c.treat']
+
+    def test_factor_interaction(self):
+        result = expand_factors(self.df, ['i.group##i.state'])
+        assert result.shape[1] == 2 + 5 + 2 * 5
+        assert 'b.group#2.state' in result.columns
+        # Without main effects, only the all-base cell is dropped
+        result = expand_factors(self.df, ['i.group#i.state'])
+        assert result.shape[1] == 3 * 6 - 1
+        assert 'a.group#1.state' not in result.columns
+
+    def test_repeated_terms(self):
+        result = expand_factors(self.df, ['i.state', 'i.group##i.state'])
+        assert result.shape[1] == 5 + 2 + 2 * 5
+
+    def test_bad_base(self):
+        try:
+            expand_factors(self.df, ['ib1999.year'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+class TestFactorReg(object):
+
+    @classmethod
+    def setup_class(cls):
+        df = factor_data()
+        state = dummies(df['state'], 'state', drop=1)
+        year = dummies(df['year'], 'year', drop=2010)
+        inter = dummies(df['group'], 'group').multiply(df['treat'], axis=0)
+        inter.columns = [c + '#c.treat' for c in inter.columns]
+        cls.df = df
+        cls.wide = pd.concat((df, state, year, inter), axis=1)
+        cls.factor_x = ['i.state', 'ib2010.year', 'i.group#c.treat']
+        cls.dummy_x = list(state.columns) + list(year.columns) + list(
+            inter.columns)
+
+    def _compare(self, result, expected):
+        assert list(result.beta.index) == list(expected.beta.index)
+        assert_array_almost_equal(result.beta, expected.beta)
+        assert_array_almost_equal(result.vce, expected.vce)
+
+    def test_reg(self):
+        expected = reg(self.wide, 'y', self.dummy_x, addcons=True,
+                       cluster='state')
+        result = reg(self.df, 'y', self.factor_x, addcons=True,
+                     cluster='state')
+        self._compare(result, expected)
+
+    def test_areg(self):
+        expected = reg(self.wide, 'y', self.dummy_x[5:], a_name='state')
+        result = reg(self.df, 'y', self.factor_x[1:], a_name='state')
+        self._compare(result, expected)
+
+    def test_collapse(self):
+        x = ['i.state', 'ib2010.year', 'i.group']
+        expected = reg(self.df, 'y', x, addcons=True, vce_type='robust')
+        result = reg(self.df, 'y', x, addcons=True, vce_type='robust',
+                     collapse=True)
+        self._compare(result, expected)
+
+    def test_ivreg(self):
+        expected = ivreg(self.wide, 'y', 'treat', 'z', self.dummy_x[:5],
+                         addcons=True)
+        result = ivreg(self.df, 'y', 'treat', 'z', 'i.state', addcons=True)
+        self._compare(result, expected)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,104 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg, ivreg
+from econtools.metrics.poisson import ppml
+
+
+def fe_data(N=1500):
+    np.random.seed(4321)
+    df = pd.DataFrame({
+        'a': np.random.randint(0, 25, N),
+        'b': np.random.randint(0, 12, N),
+        'x': np.random.normal(size=N),
+        'w': np.random.normal(size=N),
+        'fw': np.random.randint(1, 4, N),
+    })
+    df['z'] = df['x'] + np.random.normal(size=N)
+    fe_a = np.random.normal(size=25)
+    fe_b = np.random.normal(size=12)
+    df['y'] = (df['x'] + df['w'] + fe_a[df['a']] + fe_b[df['b']] +
+               np.random.normal(size=N))
+    dummies = pd.get_dummies(df['a'], prefix='a').astype(float)
+    return df, pd.concat((df, dummies), axis=1), list(dummies.columns)
+
+
+class TestFixedEffects(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df, cls.wide, cls.dummies = fe_data()
+
+    def _compare(self, result, expected):
+        fe = result.fixed_effects().sort_index()
+        assert fe.index.name == 'a'
+        assert_array_almost_equal(fe.values, expected.beta[self.dummies])
+
+    def test_reg(self):
+        result = reg(self.df, 'y', ['x', 'w'], a_name='a', save_fe=True)
+        expected = reg(self.wide, 'y', ['x', 'w'] + self.dummies)
+        self._compare(result, expected)
+
+    def test_fwt(self):
+        result = reg(self.df, 'y', ['x', 'w'], a_name='a', fwt_name='fw',
+                     save_fe=True)
+        expected = reg(self.wide, 'y', ['x', 'w'] + self.dummies,
+                       fwt_name='fw')
+        self._compare(result, expected)
+
+    def test_ivreg(self):
+        result = ivreg(self.df, 'y', 'x', 'z', 'w', a_name='a', save_fe=True)
+        expected = ivreg(self.wide, 'y', 'x', 'z', ['w'] + self.dummies)
+        self._compare(result, expected)
+
+    def test_multiway(self):
+        result = reg(self.df, 'y', ['x', 'w'], a_name=['a', 'b'],
+                     save_fe=True)
+        fe = result.fixed_effects()
+        dummies_b = pd.get_dummies(self.df['b'], prefix='b').astype(float)
+        wide = pd.concat((self.wide, dummies_b.iloc[:, 1:]), axis=1)
+        expected = reg(wide, 'y', ['x', 'w'] + self.dummies +
+                       list(dummies_b.columns[1:]))
+        fitted = (fe['a'][self.df['a']].values +
+                  fe['b'][self.df['b']].values +
+                  self.df[['x', 'w']].values.dot(result.beta.values))
+        assert_array_almost_equal(fitted, expected.yhat)
+        assert abs(fe['b'][self.df['b']].mean()) < 1e-10
+
+    def test_ppml(self):
+        df = self.df.copy()
+        df['count'] = np.random.poisson(np.exp(.3 * df['x']))
+        result = ppml(df, 'count', 'x', a_name=['a', 'b'], save_fe=True)
+        fe = result.fixed_effects()
+        mu = np.exp(fe['a'][df['a']].values + fe['b'][df['b']].values +
+                    result.beta['x'] * df['x'].values)
+        assert_array_almost_equal(mu, result.yhat.values)
+
+    def test_no_fe(self):
+        result = reg(self.df, 'y', ['x', 'w'], addcons=True, save_fe=True)
+        try:
+            result.fixed_effects()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+    def test_not_saved(self):
+        # Nothing N-length is kept by default
+        result = reg(self.df, 'y', ['x', 'w'], a_name='a')
+        assert not hasattr(result, '_fe')
+        try:
+            result.fixed_effects()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
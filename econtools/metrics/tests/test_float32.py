@@ -0,0 +1,151 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.design import Float32Design, downcast_error
+
+
+def float32_data(N=5000):
+    np.random.seed(13579)
+    x_names = ['x{}'.format(i) for i in range(4)]
+    df = pd.DataFrame(np.random.normal(size=(N, 4)), columns=x_names)
+    df['g'] = np.random.randint(0, 50, N)
+    df['aw'] = np.random.uniform(.5, 2, N)
+    df['fw'] = np.random.randint(1, 4, N)
+    df['y'] = df[x_names].sum(axis=1) + np.random.normal(size=N)
+    df32 = df.copy()
+    df32[x_names] = df32[x_names].astype(np.float32)
+    return df, df32, x_names
+
+
+class Float32Compare(object):
+
+    reg_args = {}
+    # Demeaned or weighted regressors are rounded to float32 again
+    rounded = False
+
+    @classmethod
+    def setup_class(cls):
+        df, df32, x = float32_data()
+        args = dict(addcons=True, **cls.reg_args)
+        # Same (float32) data, so only accumulation precision differs
+        cls.expected = reg(df32, 'y', x, **args)
+        cls.result = reg(df32, 'y', x, dtype='float32', **args)
+
+    def test_beta(self):
+        assert_array_almost_equal(self.result.beta, self.expected.beta,
+                                  decimal=6 if self.rounded else 10)
+
+    def test_se(self):
+        assert_array_almost_equal(self.result.se / self.expected.se,
+                                  np.ones(len(self.expected.se)),
+                                  decimal=6 if self.rounded else 8)
+
+    def test_diag(self):
+        diag = self.result.float32_diag
+        assert (diag['downcast_err'] > 0) == self.rounded
+        assert diag['err_bound'] < 1e-6
+        assert diag['refine_step'] < 1e-10
+
+
+class TestFloat32_std(Float32Compare):
+    reg_args = {}
+
+
+class TestFloat32_robust(Float32Compare):
+    reg_args = {'vce_type': 'robust'}
+
+
+class TestFloat32_hc2(Float32Compare):
+    reg_args = {'vce_type': 'hc2'}
+
+
+class TestFloat32_cluster(Float32Compare):
+    reg_args = {'cluster': 'g'}
+
+
+class TestFloat32_areg(Float32Compare):
+    reg_args = {'a_name': 'g'}
+    rounded = True
+
+
+class TestFloat32_awt(Float32Compare):
+    reg_args = {'awt_name': 'aw'}
+    rounded = True
+
+
+class TestFloat32_fwt(Float32Compare):
+    reg_args = {'fwt_name': 'fw'}
+
+
+class TestFloat32Diag(object):
+
+    def test_downcast(self):
+        df, __, x = float32_data()
+        result = reg(df, 'y', x, addcons=True, dtype='float32')
+        expected = reg(df, 'y', x, addcons=True)
+        diag = result.float32_diag
+        assert 0 < diag['downcast_err'] < 1e-7
+        assert (np.abs(result.beta - expected.beta).max() <
+                diag['err_bound'] * np.abs(expected.beta).max())
+
+    def test_ill_conditioned(self):
+        df, __, x = float32_data()
+        df['x_near'] = df['x0'] + 1e-4 * df['x1']
+        result = reg(df, 'y', x + ['x_near'], addcons=True, dtype='float32')
+        assert result.float32_diag['err_bound'] > 1e-2
+
+    def test_bad_dtype(self):
+        df, __, x = float32_data(10)
+        try:
+            reg(df, 'y', x, dtype='float16')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+class TestFloat32Design(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(1029)
+        cls.x = np.random.normal(size=(103, 3)).astype(np.float32)
+        cls.X = Float32Design(cls.x, ['a', 'b', 'c'], chunk_size=10)
+        cls.x64 = cls.x.astype(np.float64)
+
+    def test_gram(self):
+        w = np.random.uniform(size=103)
+        assert_array_almost_equal(self.X.gram(w),
+                                  (self.x64.T * w).dot(self.x64))
+
+    def test_tdot(self):
+        v = np.random.normal(size=103)
+        assert_array_almost_equal(self.X.tdot(v), self.x64.T.dot(v))
+        assert self.X.tdot(v).dtype == np.float64
+
+    def test_cluster_meat(self):
+        codes = np.random.randint(0, 7, 103)
+        resid = np.random.normal(size=103)
+        scores = pd.DataFrame(self.x64 * resid[:, np.newaxis]).groupby(
+            codes).sum().values
+        assert_array_almost_equal(self.X.cluster_meat(resid, codes),
+                                  scores.T.dot(scores))
+
+    def test_multiply(self):
+        scaled = self.X.multiply(np.arange(103.))
+        assert scaled.values.dtype == np.float32
+
+    def test_downcast_error(self):
+        df = pd.DataFrame({'a': [1., 1 / 3.], 'b': [2., 4.]})
+        assert 0 < downcast_error(df) < 1e-7
+        assert downcast_error(df.astype(np.float32)) == 0
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
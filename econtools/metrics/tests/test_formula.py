@@ -0,0 +1,146 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg, ivreg
+from econtools.metrics.formula import compile_formula
+
+
+def formula_data(N=2000):
+    np.random.seed(24680)
+    df = pd.DataFrame({
+        'fe1': np.random.randint(0, 25, N),
+        'fe2': np.random.randint(0, 10, N),
+        'state': np.random.randint(0, 4, N),
+        'clust': np.random.randint(0, 30, N),
+        'x1': np.random.normal(size=N),
+        'z1': np.random.normal(size=N),
+        'z2': np.random.normal(size=N),
+    })
+    df['x3'] = df['z1'] + df['z2'] + np.random.normal(size=N)
+    df['y'] = (df['x1'] + df['x3'] + .1 * df['fe1'] - .2 * df['fe2'] +
+               np.random.normal(size=N))
+    return df
+
+
+class TestCompile(object):
+
+    def test_ols(self):
+        plan = compile_formula('y ~ x1 + i.state')
+        assert plan.y_name == 'y'
+        assert plan.x_name == ['x1', 'i.state']
+        assert plan.a_name is None
+        assert not plan.is_iv
+        assert not plan.addcons
+
+    def test_full(self):
+        plan = compile_formula('y ~ 1 + x1 | fe1 + fe2 | (x3 ~ z1 + z2)')
+        assert plan.x_name == ['x1']
+        assert plan.a_name == ['fe1', 'fe2']
+        assert plan.endog == ['x3']
+        assert plan.instruments == ['z1', 'z2']
+        assert plan.addcons
+
+    def test_iv_first(self):
+        plan = compile_formula('y ~ x1 | x3 ~ z1 | fe1')
+        assert plan.a_name == 'fe1'
+        assert plan.endog == ['x3']
+
+    def test_cache(self):
+        formula = 'y ~ x1 | fe1'
+        assert compile_formula(formula) is compile_formula(formula)
+
+    def test_bad(self):
+        for formula in ('~ x1', 'y ~ x1 | fe1 | fe2',
+                        'y ~ x1 | (x3 ~ z1) | (x1 ~ z2)'):
+            try:
+                compile_formula(formula)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(formula)
+
+
+class TestFormulaReg(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = formula_data()
+
+    def _compare(self, result, expected):
+        assert list(result.beta.index) == list(expected.beta.index)
+        assert_array_almost_equal(result.beta, expected.beta)
+        assert_array_almost_equal(result.vce, expected.vce)
+
+    def test_reg(self):
+        expected = reg(self.df, 'y', ['x1', 'i.state'], addcons=True,
+                       cluster='clust')
+        result = reg(self.df, 'y ~ 1 + x1 + i.state', cluster='clust')
+        self._compare(result, expected)
+
+    def test_reg_fe(self):
+        expected = reg(self.df, 'y', 'x1', a_name=['fe1', 'fe2'])
+        result = reg(self.df, 'y ~ x1 | fe1 + fe2')
+        self._compare(result, expected)
+
+    def test_ivreg(self):
+        expected = ivreg(self.df, 'y', 'x3', ['z1', 'z2'], 'x1',
+                         a_name='fe1', vce_type='robust')
+        result = ivreg(self.df, 'y ~ x1 | fe1 | (x3 ~ z1 + z2)',
+                       vce_type='robust')
+        self._compare(result, expected)
+
+    def test_wrong_estimator(self):
+        for func, formula in ((reg, 'y ~ x1 | (x3 ~ z1)'),
+                              (ivreg, 'y ~ x1 | fe1')):
+            try:
+                func(self.df, formula)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(formula)
+
+    def test_conflict(self):
+        try:
+            reg(self.df, 'y ~ x1 | fe1', a_name='fe2')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+class TestMultiwayFE(object):
+
+    @classmethod
+    def setup_class(cls):
+        df = formula_data()
+        dummies = pd.get_dummies(df['fe2'], prefix='d').iloc[:, 1:]
+        cls.dummy_names = list(dummies.columns)
+        cls.df = df.join(dummies.astype(float))
+
+    def _compare(self, **kwargs):
+        expected = reg(self.df, 'y', ['x1'] + self.dummy_names, a_name='fe1',
+                       **kwargs)
+        result = reg(self.df, 'y', 'x1', a_name=['fe1', 'fe2'], **kwargs)
+        assert_array_almost_equal(result.beta['x1'], expected.beta['x1'])
+        assert_array_almost_equal(result.se['x1'], expected.se['x1'])
+        assert_array_almost_equal(result.r2, expected.r2)
+        assert result.K == expected.K
+
+    def test_std(self):
+        self._compare()
+
+    def test_cluster(self):
+        self._compare(cluster='clust')
+
+    def test_nested(self):
+        # `fe1` nested in clusters doesn't count against DoF
+        self._compare(cluster='fe1')
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,112 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg, f_test, f_test_batch, f_test_nl
+
+
+def ftest_data(N=800, K=12):
+    np.random.seed(60221)
+    x_name = ['x{}'.format(i) for i in range(K)]
+    df = pd.DataFrame(np.random.normal(size=(N, K)), columns=x_name)
+    df['clust'] = np.random.randint(0, 60, N)
+    df['y'] = .5 * df['x0'] + 2 * df['x1'] + np.random.normal(size=N)
+    return df, x_name
+
+
+class TestFtestBatch(object):
+
+    @classmethod
+    def setup_class(cls):
+        df, x_name = ftest_data()
+        cls.x_name = x_name
+        cls.results = reg(df, 'y', x_name, cluster='clust', addcons=True)
+        np.random.seed(1)
+        cls.groups = [list(np.random.choice(x_name, size=size,
+                                            replace=False))
+                      for size in np.random.randint(1, 5, 40)]
+
+    def test_joint(self):
+        result = self.results.Ftest_batch(self.groups)
+        expected = np.array([self.results.Ftest(g) for g in self.groups])
+        assert_array_almost_equal(result['F'].values, expected[:, 0])
+        assert_array_almost_equal(result['pF'].values, expected[:, 1])
+
+    def test_equal(self):
+        groups = [g for g in self.groups if len(g) > 1]
+        result = self.results.Ftest_batch(groups, equal=True)
+        expected = np.array([self.results.Ftest(g, equal=True)
+                             for g in groups])
+        assert_array_almost_equal(result['F'].values, expected[:, 0])
+
+    def test_labels(self):
+        result = self.results.Ftest_batch({'a': ['x0', 'x1'], 'b': 'x2'})
+        assert list(result.index) == ['a', 'b']
+        assert_array_almost_equal(result.loc['b', 'F'],
+                                  self.results.Ftest('x2')[0])
+
+    def test_matrices(self):
+        V, beta = self.results.vce.values, self.results.beta.values
+        K = len(beta)
+        np.random.seed(2)
+        R = [np.random.normal(size=(q, K)) for q in (1, 3, 2, 3)]
+        r = [np.random.normal(size=len(R_i)) for R_i in R]
+        F, pF = f_test_batch(V, R, beta, r=r, df_d=self.results.df_r)
+        for i, (R_i, r_i) in enumerate(zip(R, r)):
+            expected = f_test(V, R_i, beta, r_i, self.results.df_r)
+            assert_array_almost_equal((F[i], pF[i]), expected)
+
+    def test_combinations(self):
+        V, beta = self.results.vce.values, self.results.beta.values
+        np.random.seed(3)
+        combos = np.random.normal(size=(5, len(beta)))
+        F, __ = f_test_batch(V, combos, beta, df_d=self.results.df_r)
+        se = np.sqrt(np.einsum('ij,jk,ik->i', combos, V, combos))
+        assert_array_almost_equal(F, (combos.dot(beta) / se) ** 2)
+
+
+class TestFtestNonlinear(object):
+
+    @classmethod
+    def setup_class(cls):
+        df, x_name = ftest_data()
+        cls.results = reg(df, 'y', x_name, vce_type='robust')
+
+    def test_linear(self):
+        # A linear restriction is the usual F test
+        result = self.results.Ftest_nl(lambda b: [b['x0'] + b['x1'] - 2.5])
+        R = np.zeros((1, len(self.results.beta)))
+        R[0, :2] = 1
+        expected = f_test(self.results.vce.values, R,
+                          self.results.beta.values, np.array([2.5]),
+                          self.results.df_r)
+        assert_array_almost_equal(result, expected)
+
+    def test_jacobian(self):
+        def func(b):
+            return [b['x0'] * b['x1'], b['x2'] ** 2]
+
+        def jac(b):
+            J = np.zeros((2, len(b)))
+            J[0, :2] = b['x1'], b['x0']
+            J[1, 2] = 2 * b['x2']
+            return J
+
+        numeric = self.results.Ftest_nl(func, r=[1, 0])
+        exact = self.results.Ftest_nl(func, r=[1, 0], jac=jac)
+        assert_array_almost_equal(numeric, exact)
+
+    def test_array_beta(self):
+        V, beta = self.results.vce.values, self.results.beta.values
+        F, pF = f_test_nl(V, lambda b: np.exp(b[0]), beta, 100, r=1)
+        grad = np.exp(beta[0])
+        expected = (np.exp(beta[0]) - 1) ** 2 / (grad ** 2 * V[0, 0])
+        assert_array_almost_equal(F, expected)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,105 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+import numpy.linalg as la
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import ivreg
+
+
+def gmm_data(N=500):
+    np.random.seed(2468)
+    df = pd.DataFrame(np.random.normal(size=(N, 4)),
+                      columns=['z1', 'z2', 'z3', 'w1'])
+    df['g'] = np.random.randint(0, 30, N)
+    v = np.random.normal(size=N)
+    df['x'] = df['z1'] + .5*df['z2'] + .3*df['z3'] + .5*df['w1'] + v
+    df['y'] = (1 + .5*df['x'] + df['w1'] + .8*v +
+               np.random.normal(size=N)*(1 + np.abs(df['z1'])))
+    return df
+
+
+def _gmm_step(X, Z, y, W):
+    XZW = X.T.dot(Z).dot(W)
+    return la.solve(XZW.dot(Z.T).dot(X), XZW.dot(Z.T).dot(y))
+
+
+class TestGMM(object):
+
+    @classmethod
+    def setup_class(cls):
+        df = gmm_data()
+        cls.df = df
+        N = df.shape[0]
+        cls.Z = np.column_stack((df[['z1', 'z2', 'z3', 'w1']].values,
+                                 np.ones(N)))
+        cls.X = np.column_stack((df[['x', 'w1']].values, np.ones(N)))
+        cls.y = df['y'].values
+        cls.b_2sls = _gmm_step(cls.X, cls.Z, cls.y, la.inv(cls.Z.T.dot(cls.Z)))
+        cls.args = (df, 'y', 'x', ['z1', 'z2', 'z3'], 'w1')
+
+    def _robust_weight(self, beta):
+        Zu = self.Z * (self.y - self.X.dot(beta))[:, np.newaxis]
+        return la.inv(Zu.T.dot(Zu))
+
+    def test_gmm2s_robust(self):
+        W = self._robust_weight(self.b_2sls)
+        expected = _gmm_step(self.X, self.Z, self.y, W)
+        u = self.y - self.X.dot(expected)
+        expected_J = self.Z.T.dot(u).dot(W).dot(self.Z.T.dot(u))
+        result = ivreg(*self.args, addcons=True, iv_method='gmm2s',
+                       vce_type='robust')
+        assert_array_almost_equal(result.beta.values, expected)
+        assert_array_almost_equal(result.J, expected_J)
+        assert result.J_df == 2
+
+    def test_gmm2s_robust_vce(self):
+        W = self._robust_weight(self.b_2sls)
+        beta = _gmm_step(self.X, self.Z, self.y, W)
+        u = self.y - self.X.dot(beta)
+        bread = la.inv(self.X.T.dot(self.Z).dot(W).dot(self.Z.T).dot(self.X))
+        Zu = self.Z * u[:, np.newaxis]
+        XZW = self.X.T.dot(self.Z).dot(W)
+        meat = XZW.dot(Zu.T.dot(Zu)).dot(XZW.T)
+        N, K = self.X.shape
+        expected = bread.dot(meat).dot(bread) * N / (N - K)
+        result = ivreg(*self.args, addcons=True, iv_method='gmm2s',
+                       vce_type='robust')
+        assert_array_almost_equal(result.vce.values, expected)
+
+    def test_igmm_cluster_fixed_point(self):
+        result = ivreg(*self.args, addcons=True, iv_method='igmm',
+                       cluster='g')
+        beta = result.beta.values
+        Zu = self.Z * (self.y - self.X.dot(beta))[:, np.newaxis]
+        cluster_Zu = pd.DataFrame(Zu).groupby(self.df['g'].values).sum()
+        W = la.inv(cluster_Zu.T.dot(cluster_Zu).values)
+        assert_array_almost_equal(_gmm_step(self.X, self.Z, self.y, W), beta)
+        assert result.gmm_iter > 2
+
+    def test_homosk_is_2sls(self):
+        result = ivreg(*self.args, addcons=True, iv_method='gmm2s')
+        expected = ivreg(*self.args, addcons=True)
+        assert_array_almost_equal(result.beta, expected.beta)
+        assert_array_almost_equal(result.vce, expected.vce)
+        u = self.y - self.X.dot(self.b_2sls)
+        ZZ_inv = la.inv(self.Z.T.dot(self.Z))
+        Zu = self.Z.T.dot(u)
+        sargan = Zu.dot(ZZ_inv).dot(Zu) / (u.dot(u) / len(u))
+        assert_array_almost_equal(result.J, sargan)
+
+    def test_just_identified(self):
+        result = ivreg(self.df, 'y', 'x', 'z1', 'w1', addcons=True,
+                       iv_method='gmm2s', vce_type='robust')
+        expected = ivreg(self.df, 'y', 'x', 'z1', 'w1', addcons=True,
+                         vce_type='robust')
+        assert_array_almost_equal(result.beta, expected.beta)
+        assert_array_almost_equal(result.vce, expected.vce)
+        assert np.isnan(result.J_p)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
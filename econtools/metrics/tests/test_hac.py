@@ -0,0 +1,149 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg, ivreg, _meat_hac
+
+
+def panel_data(n_units=25, n_periods=16):
+    np.random.seed(314159)
+    df = pd.DataFrame({
+        'unit': np.repeat(np.arange(n_units), n_periods),
+        'year': np.tile(np.arange(2000, 2000 + n_periods), n_units),
+    })
+    # Unbalanced, with gaps
+    df = df.sample(frac=.8, random_state=271).reset_index(drop=True)
+    N = df.shape[0]
+    shock = np.random.normal(size=n_periods)[df['year'] - 2000]
+    df['x'] = np.random.normal(size=N) + shock
+    df['z'] = df['x'] + np.random.normal(size=N)
+    df['y'] = 1 + df['x'] + shock + np.random.normal(size=N)
+    return df
+
+
+def brute_force_meat(xu, time, panel, lags, kern='bartlett'):
+    lag = np.abs(time[:, np.newaxis] - time[np.newaxis, :]) / (lags + 1)
+    if kern == 'bartlett':
+        W = 1 - lag
+    else:
+        W = np.where(lag <= .5, 1 - 6 * lag ** 2 + 6 * lag ** 3,
+                     2 * (1 - lag) ** 3)
+    W[lag >= 1] = 0
+    if panel is not None:
+        W *= panel[:, np.newaxis] == panel[np.newaxis, :]
+    return xu.T.dot(W).dot(xu)
+
+
+class TestMeatHAC(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = panel_data()
+        cls.xu = np.random.normal(size=(cls.df.shape[0], 3))
+        cls.time = cls.df['year'].values
+        cls.unit = cls.df['unit'].values
+
+    def test_panel(self):
+        result = _meat_hac(self.xu, self.df['year'], self.df['unit'], 3)
+        expected = brute_force_meat(self.xu, self.time, self.unit, 3)
+        assert_array_almost_equal(result, expected)
+
+    def test_parzen(self):
+        result = _meat_hac(self.xu, self.df['year'], self.df['unit'], 4,
+                           kern='parzen')
+        expected = brute_force_meat(self.xu, self.time, self.unit, 4,
+                                    kern='parzen')
+        assert_array_almost_equal(result, expected)
+
+    def test_driscoll_kraay(self):
+        result = _meat_hac(self.xu, self.df['year'], None, 2, aggregate=True)
+        expected = brute_force_meat(self.xu, self.time, None, 2)
+        assert_array_almost_equal(result, expected)
+
+    def test_time_series(self):
+        one_unit = (self.unit == 0)
+        xu = self.xu[one_unit]
+        time = self.time[one_unit]
+        result = _meat_hac(xu, time, None, 2)
+        expected = brute_force_meat(xu, time, None, 2)
+        assert_array_almost_equal(result, expected)
+
+    def test_zero_lags(self):
+        result = _meat_hac(self.xu, self.df['year'], self.df['unit'], 0)
+        assert_array_almost_equal(result, self.xu.T.dot(self.xu))
+
+    def test_repeated_time(self):
+        try:
+            _meat_hac(self.xu, self.df['year'], None, 2)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+class TestRegHAC(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = panel_data()
+
+    def _manual_vce(self, result, aggregate):
+        df = self.df
+        X = np.column_stack((df['x'], np.ones(df.shape[0])))
+        xu = X * result.resid.values[:, np.newaxis]
+        panel = None if aggregate else df['unit'].values
+        meat = brute_force_meat(xu, df['year'].values, panel, 2)
+        xpx_inv = np.linalg.inv(X.T.dot(X))
+        return xpx_inv.dot(meat).dot(xpx_inv)
+
+    def test_newey_west(self):
+        hac = {'time': 'year', 'panel': 'unit', 'lags': 2}
+        result = reg(self.df, 'y', 'x', addcons=True, hac=hac)
+        N, K = self.df.shape[0], 2
+        expected = self._manual_vce(result, False) * N / (N - K)
+        assert_array_almost_equal(result.vce, expected)
+        assert result.df_t == N - K
+
+    def test_driscoll_kraay(self):
+        hac = {'time': 'year', 'lags': 2}
+        result = reg(self.df, 'y', 'x', addcons=True,
+                     vce_type='driscoll-kraay', hac=hac)
+        N, K, T = self.df.shape[0], 2, self.df['year'].nunique()
+        correct = (N - 1) / (N - K) * T / (T - 1)
+        expected = self._manual_vce(result, True) * correct
+        assert_array_almost_equal(result.vce, expected)
+        assert result.df_t == T - 1
+
+    def test_collapse(self):
+        df = self.df.copy()
+        df['x'] = (df['x'] > 0).astype(float)
+        hac = {'time': 'year', 'lags': 2}
+        args = dict(addcons=True, vce_type='driscoll-kraay', hac=hac)
+        expected = reg(df, 'y', 'x', **args)
+        result = reg(df, 'y', 'x', collapse=True, **args)
+        assert_array_almost_equal(result.vce, expected.vce)
+
+    def test_gmm(self):
+        hac = {'time': 'year', 'panel': 'unit', 'lags': 2}
+        result = ivreg(self.df, 'y', 'x', 'z', [], addcons=True, hac=hac,
+                       iv_method='gmm2s')
+        assert np.isfinite(result.se).all()
+
+    def test_conflict(self):
+        for kwargs in ({'vce_type': 'hac'},
+                       {'cluster': 'unit', 'hac': {'time': 'year'}},
+                       {'vce_type': 'robust', 'hac': {'time': 'year'}}):
+            try:
+                reg(self.df, 'y', 'x', **kwargs)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(kwargs)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,144 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+import numpy.linalg as la
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import ivreg, _get_h
+
+
+class TestJIVE(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(1357)
+        N = 120
+        df = pd.DataFrame(np.random.normal(size=(N, 4)),
+                          columns=['z1', 'z2', 'z3', 'w1'])
+        v = np.random.normal(size=N)
+        df['x'] = df['z1'] + .5*df['z2'] + .3*df['z3'] + .5*df['w1'] + v
+        df['y'] = 1 + .5*df['x'] + df['w1'] + .8*v + np.random.normal(size=N)
+        cls.df = df
+        Z = np.column_stack((df[['z1', 'z2', 'z3', 'w1']].values,
+                             np.ones(N)))
+        W = np.column_stack((df['w1'].values, np.ones(N)))
+        cls.X = np.column_stack((df[['x', 'w1']].values, np.ones(N)))
+        cls.y = df['y'].values
+        # Brute-force leave-one-out first stages
+        x = df['x'].values
+        cls.loo_Z = np.zeros(N)
+        cls.loo_W = np.zeros(N)
+        for i in range(N):
+            keep = np.arange(N) != i
+            cls.loo_Z[i] = Z[i].dot(la.lstsq(Z[keep], x[keep], rcond=None)[0])
+            cls.loo_W[i] = W[i].dot(la.lstsq(W[keep], x[keep], rcond=None)[0])
+
+    def _expected(self, xhat):
+        Xhat = self.X.copy()
+        Xhat[:, 0] = xhat
+        A = la.inv(Xhat.T.dot(self.X))
+        beta = A.dot(Xhat.T.dot(self.y))
+        u = self.y - self.X.dot(beta)
+        N, K = self.X.shape
+        vce = u.dot(u) / (N - K) * A.dot(Xhat.T.dot(Xhat)).dot(A.T)
+        return beta, vce
+
+    def _result(self, method):
+        return ivreg(self.df, 'y', 'x', ['z1', 'z2', 'z3'], 'w1',
+                     addcons=True, iv_method=method)
+
+    def test_jive(self):
+        beta, vce = self._expected(self.loo_Z)
+        result = self._result('jive')
+        assert_array_almost_equal(result.beta.values, beta)
+        assert_array_almost_equal(result.vce.values, vce)
+
+    def test_ujive(self):
+        # Kolesar (2013): `x_tilde'y / x_tilde'x`, `w` not partialled out
+        x_tilde = self.loo_Z - self.loo_W
+        x, W = self.X[:, 0], self.X[:, 1:]
+        b = x_tilde.dot(self.y) / x_tilde.dot(x)
+        gamma = la.lstsq(W, self.y - b * x, rcond=None)[0]
+        result = self._result('ujive')
+        assert_array_almost_equal(result.beta.values, np.r_[b, gamma])
+
+    def test_ujive_robust(self):
+        # Sandwich from the estimating equations `x_tilde'(y - x*b) = 0` and
+        # `W'(y - x*b - W*gamma) = 0`
+        x_tilde = self.loo_Z - self.loo_W
+        x, W = self.X[:, 0], self.X[:, 1:]
+        b = x_tilde.dot(self.y) / x_tilde.dot(x)
+        gamma = la.lstsq(W, self.y - b * x, rcond=None)[0]
+        N, K = self.X.shape
+        G = np.zeros((K, K))
+        G[0, 0] = x_tilde.dot(x)
+        G[1:, 0] = W.T.dot(x)
+        G[1:, 1:] = W.T.dot(W)
+        u = self.y - b * x - W.dot(gamma)
+        scores = np.column_stack((x_tilde, W)) * u[:, np.newaxis]
+        A = la.inv(G)
+        vce = A.dot(scores.T.dot(scores)).dot(A.T) * N / (N - K)
+        result = ivreg(self.df, 'y', 'x', ['z1', 'z2', 'z3'], 'w1',
+                       addcons=True, iv_method='ujive', vce_type='robust')
+        assert_array_almost_equal(result.vce.values, vce)
+
+
+class TestUJIVECoverage(object):
+
+    @classmethod
+    def setup_class(cls):
+        # Monte Carlo with a large intercept, which must not enter the meat
+        rng = np.random.RandomState(2468)
+        N, reps = 200, 150
+        cls.beta, cls.se = [], {None: [], 'robust': [], 'cluster': []}
+        for __ in range(reps):
+            df = pd.DataFrame(rng.normal(size=(N, 4)),
+                              columns=['z1', 'z2', 'z3', 'w1'])
+            v = rng.normal(size=N)
+            df['x'] = (df['z1'] + .5*df['z2'] + .5*df['z3'] +
+                       .5*df['w1'] + v)
+            df['y'] = 50 + df['x'] + df['w1'] + .5*v + rng.normal(size=N)
+            df['clust'] = np.arange(N) // 4
+            for vce_type in cls.se:
+                kwargs = ({'cluster': 'clust'} if vce_type == 'cluster'
+                          else {'vce_type': vce_type})
+                result = ivreg(df, 'y', 'x', ['z1', 'z2', 'z3'], 'w1',
+                               addcons=True, iv_method='ujive', **kwargs)
+                cls.se[vce_type].append(result.se['x'])
+            cls.beta.append(result.beta['x'])
+        cls.beta = np.array(cls.beta)
+        # Spread of beta from the IQR, which is less noisy than the SD
+        q25, q75 = np.percentile(cls.beta, [25, 75])
+        cls.sd = (q75 - q25) / 1.349
+
+    def test_se(self):
+        for vce_type, se in self.se.items():
+            assert abs(np.median(se) / self.sd - 1) < .25
+
+    def test_coverage(self):
+        for vce_type, se in self.se.items():
+            # Inflated SEs would cover the true beta every time
+            covered = np.abs(self.beta - 1) < 1.96 * np.array(se)
+            assert .85 < covered.mean() < .99
+
+    def test_vce_paths_agree(self):
+        ratio = np.mean(self.se['robust']) / np.mean(self.se[None])
+        assert abs(ratio - 1) < .05
+
+
+class TestLeverage(object):
+
+    def test_chunks(self):
+        np.random.seed(42)
+        x = np.random.normal(size=(1001, 3))
+        xpx_inv = la.inv(x.T.dot(x))
+        expected = np.diag(x.dot(xpx_inv).dot(x.T))
+        result = _get_h(pd.DataFrame(x), xpx_inv, chunk_size=100)
+        assert_array_almost_equal(result, expected)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
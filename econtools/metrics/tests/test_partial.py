@@ -0,0 +1,143 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.partial import PartialCache
+from econtools.metrics.regutil import demean_multi
+
+
+def spec_data(N=1500):
+    np.random.seed(97531)
+    controls = ['c{}'.format(i) for i in range(6)]
+    df = pd.DataFrame(np.random.normal(size=(N, 6)), columns=controls)
+    df['fe1'] = np.random.randint(0, 40, N)
+    df['fe2'] = np.random.randint(0, 15, N)
+    df['clust'] = np.random.randint(0, 30, N)
+    df['aw'] = np.random.uniform(.5, 2, N)
+    df['fw'] = np.random.randint(1, 4, N)
+    for i in range(3):
+        df['t{}'.format(i)] = (np.random.normal(size=N) + .1 * df['fe1'] +
+                               df['c0'])
+    df['y'] = df['t0'] + df[controls].sum(axis=1) + np.random.normal(size=N)
+    df['y2'] = df['y'] + df['t1']
+    # Missing values in a treatment change the sample
+    df.loc[::50, 't2'] = np.nan
+    return df, controls
+
+
+class CacheCompare(object):
+
+    reg_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        cls.df, cls.controls = spec_data()
+        cls.cache = PartialCache(cls.controls)
+        specs = [('y', 't0'), ('y', 't1'), ('y2', 't1'), ('y', 't2'),
+                 ('y', 't0')]
+        cls.pairs = []
+        for y, t in specs:
+            expected = reg(cls.df, y, [t] + cls.controls, **cls.reg_args)
+            result = reg(cls.df, y, [t] + cls.controls, cache=cls.cache,
+                         **cls.reg_args)
+            cls.pairs.append((result, expected))
+
+    def test_beta(self):
+        for result, expected in self.pairs:
+            assert list(result.beta.index) == list(expected.beta.index)
+            assert_array_almost_equal(result.beta, expected.beta)
+
+    def test_vce(self):
+        for result, expected in self.pairs:
+            assert_array_almost_equal(result.vce, expected.vce)
+            assert result.df_t == expected.df_t
+
+    def test_resid(self):
+        for result, expected in self.pairs:
+            assert_array_almost_equal(result.resid, expected.resid)
+            assert_array_almost_equal(result.r2, expected.r2)
+
+    def test_samples(self):
+        # Missing `t2` is a second sample
+        assert len(self.cache) == 2
+
+
+class TestCache_cluster(CacheCompare):
+    reg_args = {'a_name': ['fe1', 'fe2'], 'cluster': 'clust'}
+
+
+class TestCache_robust(CacheCompare):
+    reg_args = {'addcons': True, 'vce_type': 'robust'}
+
+
+class TestCache_areg_awt(CacheCompare):
+    reg_args = {'a_name': 'fe1', 'awt_name': 'aw', 'vce_type': 'hc2'}
+
+
+class TestCache_fwt(CacheCompare):
+    reg_args = {'a_name': ['fe1', 'fe2'], 'fwt_name': 'fw',
+                'vce_type': 'robust'}
+
+
+class TestPartialCache(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df, cls.controls = spec_data()
+
+    def test_reuse(self):
+        cache = PartialCache(self.controls)
+        args = dict(a_name=['fe1', 'fe2'], cache=cache)
+        reg(self.df, 'y', ['t0'] + self.controls, **args)
+        entry, = cache._entries.values()
+        grams = dict(entry.grams)
+        reg(self.df, 'y', ['t1'] + self.controls, **args)
+        assert set(col for col, __ in entry.demeaned) == set(self.controls)
+        # Control cross products are not recalculated
+        for key, G in grams.items():
+            assert entry.grams[key] is G
+
+    def test_modified_column(self):
+        df = self.df.copy()
+        cache = PartialCache(self.controls)
+        args = dict(a_name=['fe1', 'fe2'])
+        for t in ('t0', 't1'):
+            df['treat'] = df[t]
+            df['c1'] = self.df['c1'] + self.df[t]
+            expected = reg(df, 'y', ['treat'] + self.controls, **args)
+            result = reg(df, 'y', ['treat'] + self.controls, cache=cache,
+                         **args)
+            assert_array_almost_equal(result.beta, expected.beta)
+            assert_array_almost_equal(result.vce, expected.vce)
+
+    def test_new_df(self):
+        cache = PartialCache(self.controls)
+        reg(self.df, 'y', ['t0'] + self.controls, cache=cache)
+        reg(self.df.copy(), 'y', ['t0'] + self.controls, cache=cache)
+        assert len(cache) == 1
+
+    def test_collapse(self):
+        try:
+            reg(self.df, 'y', ['t0'] + self.controls, collapse=True,
+                cache=PartialCache(self.controls))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+    def test_demean_columnwise(self):
+        codes_list = [self.df['fe1'].values, self.df['fe2'].values]
+        v = self.df[['c0', 'c1', 'y']].values
+        together = demean_multi(codes_list, v)
+        for col in range(3):
+            alone = demean_multi(codes_list, v[:, col])
+            assert np.array_equal(together[:, col], alone)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,120 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.poisson import ppml
+
+
+def poisson_data(N=3000):
+    np.random.seed(8080)
+    df = pd.DataFrame({
+        'a': np.random.randint(0, 30, N),
+        'b': np.random.randint(0, 20, N),
+        'c': np.random.randint(0, 100, N),
+        'x1': np.random.normal(size=N),
+        'x2': np.random.uniform(size=N),
+    })
+    fe_a = np.random.normal(scale=.5, size=30)
+    fe_b = np.random.normal(scale=.5, size=20)
+    mu = np.exp(.3 * df['x1'] - .5 * df['x2'] + fe_a[df['a']] +
+                fe_b[df['b']])
+    df['y'] = np.random.poisson(mu).astype(float)
+    # Group `a == 3` is separated
+    df.loc[df['a'] == 3, 'y'] = 0
+    return df
+
+
+class TestPPML(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = poisson_data()
+        cls.result = ppml(cls.df, 'y', ['x1', 'x2'], a_name=['a', 'b'],
+                          cluster='c')
+
+    def test_dummies(self):
+        df = self.df[self.df['a'] != 3]
+        dummies = pd.concat(
+            (pd.get_dummies(df['a'], prefix='a').iloc[:, 1:],
+             pd.get_dummies(df['b'], prefix='b').iloc[:, 1:]),
+            axis=1).astype(float)
+        wide = pd.concat((df, dummies), axis=1)
+        expected = ppml(wide, 'y', ['x1', 'x2'] + list(dummies.columns),
+                        addcons=True, cluster='c')
+        x = ['x1', 'x2']
+        assert_array_almost_equal(self.result.beta, expected.beta[x])
+        assert_array_almost_equal(self.result.se, expected.se[x])
+        assert self.result.K == expected.K
+
+    def test_score(self):
+        x = self.df.loc[self.result.sample, ['x1', 'x2']].values
+        score = x.T.dot(self.result.resid.values)
+        assert_array_almost_equal(score / self.result.N, np.zeros(2))
+
+    def test_separated(self):
+        assert self.result.separated == (self.df['a'] == 3).sum()
+        assert not self.result.sample[self.df['a'] == 3].any()
+        assert self.result.N == (self.df['a'] != 3).sum()
+
+    def test_formula(self):
+        result = ppml(self.df, 'y ~ x1 + x2 | a + b', cluster='c')
+        assert_array_almost_equal(result.beta, self.result.beta)
+
+
+class TestPPMLClosedForm(object):
+
+    def test_binary(self):
+        np.random.seed(3)
+        df = pd.DataFrame({'d': np.random.randint(0, 2, 500).astype(float)})
+        df['y'] = np.random.poisson(1 + df['d']).astype(float)
+        result = ppml(df, 'y', 'd', addcons=True)
+        means = df.groupby('d')['y'].mean()
+        assert_array_almost_equal(
+            result.beta.values,
+            [np.log(means[1] / means[0]), np.log(means[0])])
+
+
+class TestPPMLSeparation(object):
+
+    def test_regressor(self):
+        df = poisson_data()
+        df['s'] = 0.
+        df.loc[(df['y'] == 0) & (df.index < 200), 's'] = 1.
+        result = ppml(df, 'y', ['x1', 'x2', 's'], a_name='a')
+        assert result.omitted == ['s']
+        assert list(result.beta.index) == ['x1', 'x2']
+        assert result.separated >= ((df['y'] == 0) & (df.index < 200)).sum()
+
+    def test_regressor_both_signs(self):
+        # Zero whenever `y` is positive, but both signs where `y` is zero:
+        # the MLE exists, so nothing but group `a == 3` is dropped
+        df = poisson_data()
+        at_zero = (df['y'] == 0) & (df.index < 200)
+        df['s'] = 0.
+        df.loc[at_zero, 's'] = np.where(np.arange(at_zero.sum()) % 2, 1., -1.)
+        result = ppml(df, 'y', ['x1', 'x2', 's'], a_name=['a', 'b'])
+        assert result.separated == (df['a'] == 3).sum()
+        assert result.omitted == []
+        x = df.loc[result.sample, ['x1', 'x2', 's']].values
+        score = x.T.dot(result.resid.values)
+        assert_array_almost_equal(score / result.N, np.zeros(3))
+
+    def test_errors(self):
+        df = poisson_data(200)
+        for kwargs in ({'vce_type': 'hc2'}, {'y_name': 'x1'}):
+            args = dict(df=df, y_name='y', x_name='x2', addcons=True)
+            args.update(kwargs)
+            try:
+                ppml(**args)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(kwargs)
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
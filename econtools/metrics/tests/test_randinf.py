@@ -0,0 +1,103 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.randinf import (randinf, RandInf, _Partialled,
+                                       _permute_within)
+
+
+def ri_data(n_clusters=60, n_per=8, effect=.3):
+    np.random.seed(11235)
+    df = pd.DataFrame({'g': np.repeat(np.arange(n_clusters), n_per)})
+    N = df.shape[0]
+    df['s'] = df['g'] % 3
+    df['fe'] = np.random.randint(0, 6, N)
+    df['t'] = (np.random.rand(n_clusters) > .5).astype(float)[df['g']]
+    df['x'] = np.random.normal(size=N)
+    df['y'] = effect * df['t'] + df['x'] + np.random.normal(size=N)
+    return df
+
+
+class TestRandInf(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = ri_data()
+        cls.args = dict(a_name='fe', cluster='g', strata='s', reps=200,
+                        seed=42, batch=64)
+        cls.result = randinf(cls.df, 'y', 't', 'x', **cls.args)
+
+    def test_observed(self):
+        expected = reg(self.df, 'y', ['t', 'x'], a_name='fe', cluster='g')
+        assert_array_almost_equal(self.result.beta, expected.beta)
+        assert_array_almost_equal(self.result.se, expected.se)
+
+    def test_null(self):
+        assert len(self.result.ri_null) == 200
+        expected = np.mean(np.abs(self.result.ri_null) >=
+                           np.abs(self.result.beta['t']))
+        assert self.result.ri_p == expected
+
+    def test_seed(self):
+        again = randinf(self.df, 'y', 't', 'x', n_jobs=2, **self.args)
+        assert_array_equal(again.ri_null, self.result.ri_null)
+
+    def test_cluster_constant(self):
+        df = self.df.copy()
+        df.loc[0, 't'] = 1 - df.loc[0, 't']
+        try:
+            randinf(df, 'y', 't', 'x', cluster='g', reps=10)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+class TestFWL(object):
+
+    def test_betas(self):
+        df = ri_data()
+        worker = RandInf(df, 'y', ['t', 'x'], treat_name='t', reps=1,
+                         strata=None, seed=0, n_jobs=1, batch=1,
+                         a_name='fe', nosingles=True, addcons=None,
+                         nocons=False, vce_type=None, cluster=None,
+                         awt_name=None, shac=None)
+        worker.main()
+        t = np.random.normal(size=(df.shape[0], 3))
+        result = worker.partialled.betas(t)
+        for col in range(3):
+            df['t_sim'] = t[:, col]
+            expected = reg(df, 'y', ['t_sim', 'x'], a_name='fe')
+            assert_array_almost_equal(result[col], expected.beta['t_sim'])
+
+    def test_no_controls(self):
+        partialled = _Partialled(None, None)
+        y = np.random.normal(size=20)
+        partialled.y_tilde = partialled.residualize(y)
+        t = np.random.normal(size=(20, 1))
+        assert_array_almost_equal(partialled.betas(t),
+                                  t[:, 0].dot(y) / t[:, 0].dot(t[:, 0]))
+
+
+class TestPermute(object):
+
+    def test_within_strata(self):
+        rng = np.random.default_rng(0)
+        strata = np.array([0, 1, 0, 1, 1, 2, 2, 0])
+        t = np.arange(8.)
+        t_perm = _permute_within(t, strata, rng, 50)
+        for s in range(3):
+            in_s = strata == s
+            expected = np.sort(t[in_s])
+            for row in t_perm[:, in_s]:
+                assert_array_equal(np.sort(row), expected)
+        assert len(set(map(tuple, t_perm))) > 1
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
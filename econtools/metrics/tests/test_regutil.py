@@ -2,8 +2,11 @@ import pandas as pd
 import numpy as np
 
 from pandas.util.testing import assert_frame_equal
+from numpy.testing import assert_array_almost_equal, assert_array_equal
 
-from econtools.metrics.regutil import winsorize
+from econtools.metrics.core import reg
+from econtools.metrics.regutil import (winsorize, ClusterStructure,
+                                       prune_singletons)
 
 
 class TestWinsorize(object):
@@ -43,6 +46,72 @@ class TestWinsorize(object):
         assert_frame_equal(expected, result)
 
 
+class TestClusterStructure(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(1123)
+        cls.cluster = pd.Series(np.random.choice(list('dbca'), 50), name='g')
+        cls.clusters = ClusterStructure(cls.cluster)
+        cls.xu = np.random.randn(50, 3)
+
+    def test_counts(self):
+        assert self.clusters.n_clusters == 4
+        expected = self.cluster.value_counts()[
+            pd.unique(self.cluster)].values
+        assert_array_equal(self.clusters.counts, expected)
+
+    def test_meat(self):
+        scores = pd.DataFrame(self.xu).groupby(self.cluster.values).sum()
+        expected = scores.values.T.dot(scores.values)
+        assert_array_almost_equal(self.clusters.meat(self.xu), expected)
+
+    def test_nests(self):
+        coarser = self.cluster.map({'a': 0, 'b': 0, 'c': 1, 'd': 2})
+        assert not self.clusters.nests(coarser.rename('h'))
+        finer = self.cluster + pd.Series(np.arange(50) % 2).astype(str)
+        assert self.clusters.nests(finer)
+        assert self.clusters.nests(self.cluster)
+
+
+class TestPruneSingletons(object):
+
+    def test_chain(self):
+        # Dropping row 0 (singleton in `a`) leaves row 1 alone in `b`, etc.
+        a = np.array([0, 1, 1, 2, 2, 3, 3])
+        b = np.array([0, 0, 1, 1, 2, 2, 2])
+        keep, rounds = prune_singletons([a, b])
+        assert_array_equal(keep, [False, False, False, False, False, True,
+                                  True])
+        assert rounds == [1, 1, 1, 1, 1]
+
+    def test_fixed_point(self):
+        np.random.seed(4321)
+        codes_list = [np.random.randint(0, 300, 1000),
+                      np.random.randint(0, 400, 1000)]
+        keep, rounds = prune_singletons(codes_list)
+        assert sum(rounds) == (~keep).sum()
+        assert len(rounds) > 1
+        for codes in codes_list:
+            assert not (np.bincount(codes[keep]) == 1).any()
+        # Nothing left to drop
+        __, again = prune_singletons([codes[keep] for codes in codes_list])
+        assert again == []
+
+    def test_reg(self):
+        np.random.seed(8765)
+        df = pd.DataFrame({'a': np.random.randint(0, 300, 1000),
+                           'b': np.random.randint(0, 400, 1000),
+                           'x': np.random.normal(size=1000)})
+        df['y'] = df['x'] + np.random.normal(size=1000)
+        result = reg(df, 'y', 'x', a_name=['a', 'b'])
+        keep, rounds = prune_singletons(
+            [pd.factorize(df[col])[0] for col in ('a', 'b')])
+        assert result.N == keep.sum()
+        assert_array_equal(result.sample.values, keep)
+        assert result.singletons == rounds
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
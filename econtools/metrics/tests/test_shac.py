@@ -14,7 +14,8 @@ from numpy.testing import (assert_array_almost_equal,)
 
 from econtools.util import group_id
 
-from econtools.metrics.core import reg
+from econtools.metrics.core import (reg, _meat_shac, _meat_shac_dense,
+                                    _meat_hac)
 
 
 class SHACRegCompare(object):
@@ -72,6 +73,140 @@ class TestSHAC_reg(SHACRegCompare):
         assert_array_almost_equal(expected, result)
 
 
+class TestSHACPanel(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(8642)
+        n_units, n_periods = 40, 8
+        loc = np.random.rand(n_units, 2)
+        df = pd.DataFrame({
+            'unit': np.repeat(np.arange(n_units), n_periods),
+            'year': np.tile(np.arange(n_periods), n_units),
+        })
+        df = df.sample(frac=.8, random_state=97).reset_index(drop=True)
+        df['lon'] = loc[df['unit'], 0]
+        df['lat'] = loc[df['unit'], 1]
+        cls.df = df
+        cls.xu = np.random.randn(df.shape[0], 3)
+
+    def _brute_force(self, kern, band, lag):
+        lon, lat = self.df['lon'].values, self.df['lat'].values
+        dist = np.sqrt((lon[:, np.newaxis] - lon)**2 +
+                       (lat[:, np.newaxis] - lat)**2)
+        W = (dist <= band).astype(float)
+        if kern == 'tria':
+            W *= 1 - dist / band
+        year = self.df['year'].values
+        W *= np.maximum(1 - np.abs(year[:, np.newaxis] - year) / (lag + 1), 0)
+        return self.xu.T.dot(W).dot(self.xu)
+
+    def _meat(self, kern, band, lag):
+        return _meat_shac(self.xu, self.df['lon'], self.df['lat'], kern, band,
+                          self.df['year'], lag)
+
+    def test_unif(self):
+        assert_array_almost_equal(self._meat('unif', .3, 2),
+                                  self._brute_force('unif', .3, 2))
+
+    def test_tria(self):
+        assert_array_almost_equal(self._meat('tria', .3, 2),
+                                  self._brute_force('tria', .3, 2))
+
+    def test_contemporaneous(self):
+        assert_array_almost_equal(self._meat('unif', .3, 0),
+                                  self._brute_force('unif', .3, 0))
+
+    def test_small_band(self):
+        # Only own-location pairs, i.e., Newey-West within units
+        expected = _meat_hac(self.xu, self.df['year'], self.df['unit'], 2)
+        assert_array_almost_equal(self._meat('unif', 1e-6, 2), expected)
+
+    def test_lag_needs_time(self):
+        shac = dict(x='lon', y='lat', kern='unif', band=.3, lag=2)
+        try:
+            reg(self.df, 'lon', 'lat', shac=shac)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+class TestSHACBlocked(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(2468)
+        N = 250
+        cls.lon = pd.Series(np.random.rand(N))
+        cls.lat = pd.Series(np.random.rand(N))
+        cls.xu = np.random.randn(N, 3)
+        dist = np.sqrt((cls.lon.values[:, np.newaxis] - cls.lon.values)**2 +
+                       (cls.lat.values[:, np.newaxis] - cls.lat.values)**2)
+        cls.W = (1 - dist / .4) * (dist <= .4)
+
+    def test_blocks(self):
+        expected = self.xu.T.dot(self.W).dot(self.xu)
+        for block in (16, 100, 1000):
+            result = _meat_shac_dense(self.xu, self.lon, self.lat, 'tria', .4,
+                                      block=block)
+            assert_array_almost_equal(result, expected)
+
+    def test_threads(self):
+        expected = self.xu.T.dot(self.W).dot(self.xu)
+        result = _meat_shac_dense(self.xu, self.lon, self.lat, 'tria', .4,
+                                  n_jobs=3, block=32)
+        assert_array_almost_equal(result, expected)
+
+
+def haversine(lon, lat):
+    lon, lat = np.radians(lon), np.radians(lat)
+    dlon = lon[:, np.newaxis] - lon
+    dlat = lat[:, np.newaxis] - lat
+    a = (np.sin(dlat / 2)**2 +
+         np.cos(lat[:, np.newaxis]) * np.cos(lat) * np.sin(dlon / 2)**2)
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(a))
+
+
+class TestSHACHaversine(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(1357)
+        N = 300
+        # High latitudes and both sides of the date line
+        cls.lon = pd.Series(np.random.uniform(170, 190, N) % 360 - 180)
+        cls.lat = pd.Series(np.random.uniform(60, 75, N))
+        cls.xu = np.random.randn(N, 2)
+
+    def _brute_force(self, kern, band):
+        dist = haversine(self.lon.values, self.lat.values)
+        W = (dist <= band).astype(float)
+        if kern == 'tria':
+            W *= 1 - dist / band
+        return self.xu.T.dot(W).dot(self.xu)
+
+    def test_unif(self):
+        result = _meat_shac(self.xu, self.lon, self.lat, 'unif', 250,
+                            shac_metric='haversine')
+        assert_array_almost_equal(result, self._brute_force('unif', 250))
+
+    def test_tria(self):
+        result = _meat_shac(self.xu, self.lon, self.lat, 'tria', 250,
+                            shac_metric='haversine')
+        assert_array_almost_equal(result, self._brute_force('tria', 250))
+
+    def test_bad_metric(self):
+        df = pd.DataFrame({'lon': self.lon, 'lat': self.lat})
+        shac = dict(x='lon', y='lat', kern='unif', band=1, metric='manhattan')
+        try:
+            reg(df, 'lon', 'lat', shac=shac)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
 if __name__ == '__main__':
     import pytest
     pytest.main()
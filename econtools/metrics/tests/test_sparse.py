@@ -0,0 +1,146 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+import scipy.sparse as sp
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg, ivreg
+from econtools.metrics.design import SparseDesign, densify
+
+
+def sparse_data(N=2000):
+    np.random.seed(1357)
+    df = pd.DataFrame({
+        'x1': np.random.normal(size=N),
+        'g': np.random.randint(0, 30, N),
+        's': np.random.randint(0, 8, N),
+        'aw': np.random.uniform(.5, 2, N),
+        'fw': np.random.randint(1, 3, N),
+        'lat': np.random.uniform(size=N),
+        'lon': np.random.uniform(size=N),
+    })
+    df['y'] = df['x1'] + .1 * df['g'] + np.random.normal(size=N)
+    df['z'] = df['x1'] + np.random.normal(size=N)
+    dummies = pd.get_dummies(df['g'], prefix='d').astype(float).iloc[:, 1:]
+    sparse = pd.DataFrame.sparse.from_spmatrix(
+        sp.csr_matrix(dummies.values), index=df.index,
+        columns=dummies.columns)
+    # Put a dense regressor after the sparse ones to check column order
+    x = list(dummies.columns) + ['x1']
+    return df.join(dummies), df.join(sparse), x
+
+
+class SparseCompare(object):
+
+    reg_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        dense, sparse, x = sparse_data()
+        args = dict(addcons=True, **cls.reg_args)
+        cls.expected = reg(dense, 'y', x, **args)
+        cls.result = reg(sparse, 'y', x, **args)
+
+    def test_beta(self):
+        assert_array_almost_equal(self.result.beta, self.expected.beta)
+        assert list(self.result.beta.index) == list(self.expected.beta.index)
+
+    def test_vce(self):
+        assert_array_almost_equal(self.result.vce, self.expected.vce)
+
+    def test_r2(self):
+        assert_array_almost_equal(self.result.r2, self.expected.r2)
+
+
+class TestSparse_std(SparseCompare):
+    reg_args = {}
+
+
+class TestSparse_robust(SparseCompare):
+    reg_args = {'vce_type': 'robust'}
+
+
+class TestSparse_hc2(SparseCompare):
+    reg_args = {'vce_type': 'hc2'}
+
+
+class TestSparse_hc3(SparseCompare):
+    reg_args = {'vce_type': 'hc3'}
+
+
+class TestSparse_cluster(SparseCompare):
+    reg_args = {'cluster': 's'}
+
+
+class TestSparse_shac(SparseCompare):
+    reg_args = {'shac': dict(x='lon', y='lat', kern='tria', band=.1)}
+
+
+class TestSparse_awt(SparseCompare):
+    reg_args = {'awt_name': 'aw', 'vce_type': 'robust'}
+
+
+class TestSparse_fwt(SparseCompare):
+    reg_args = {'fwt_name': 'fw', 'collapse': True, 'cluster': 's'}
+
+
+class TestSparse_areg(SparseCompare):
+    reg_args = {'a_name': 's'}
+
+
+class TestSparse_iv(object):
+
+    def test_iv(self):
+        dense, sparse, x = sparse_data()
+        w = [c for c in x if c != 'x1']
+        expected = ivreg(dense, 'y', 'x1', 'z', w, addcons=True)
+        result = ivreg(sparse, 'y', 'x1', 'z', w, addcons=True)
+        assert_array_almost_equal(result.vce, expected.vce)
+
+
+class TestSparseDesign(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(2468)
+        N = 50
+        cls.df = pd.DataFrame({
+            'a': np.random.normal(size=N),
+            'b': pd.arrays.SparseArray(
+                np.random.randint(0, 2, N).astype(float), fill_value=0.),
+            'c': np.random.normal(size=N),
+        })
+        cls.X = SparseDesign.from_frame(cls.df)
+        cls.dense = densify(cls.df).values
+
+    def test_columns(self):
+        assert list(self.X.columns) == ['a', 'b', 'c']
+        assert_array_almost_equal(self.X.toarray(), self.dense)
+
+    def test_dot(self):
+        beta = np.array([1., 2., 3.])
+        assert_array_almost_equal(self.X.dot(beta), self.dense.dot(beta))
+        v = np.arange(50.)
+        assert_array_almost_equal(self.X.tdot(v), self.dense.T.dot(v))
+
+    def test_gram(self):
+        w = np.arange(50.)
+        assert_array_almost_equal(self.X.gram(w),
+                                  (self.dense.T * w).dot(self.dense))
+
+    def test_leverage(self):
+        xpx_inv = np.linalg.inv(self.dense.T.dot(self.dense))
+        expected = np.einsum('ij,jk,ik->i', self.dense, xpx_inv, self.dense)
+        assert_array_almost_equal(self.X.leverage(xpx_inv, chunk_size=7),
+                                  expected)
+
+    def test_dense_passthrough(self):
+        df = densify(self.df)
+        assert SparseDesign.from_frame(df) is df
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
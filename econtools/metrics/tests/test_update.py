@@ -0,0 +1,153 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.update import UpdatableReg
+
+
+def update_data(N=1200):
+    np.random.seed(112358)
+    df = pd.DataFrame(np.random.normal(size=(N, 6)), columns=list('abcdef'))
+    df['fe'] = np.random.randint(0, 30, N)
+    df['clust'] = np.random.randint(0, 40, N)
+    df['aw'] = np.random.uniform(.5, 2, N)
+    df['y'] = (df[['a', 'b', 'c']].sum(axis=1) + .1 * df['fe'] +
+               np.random.normal(size=N))
+    df['dup'] = 2 * df['a'] - df['b']
+    return df
+
+
+class UpdateCompare(object):
+
+    reg_args = {}
+    steps = (('add', ['c', 'd']), ('drop', 'a'), ('add', 'e'),
+             ('drop', ['d', 'b']), ('add', ['a', 'f']))
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = update_data()
+        model = UpdatableReg(cls.df, 'y', ['a', 'b'], **cls.reg_args)
+        x_name = ['a', 'b']
+        cls.pairs = [(model.results, reg(cls.df, 'y', x_name,
+                                         **cls.reg_args))]
+        for step, names in cls.steps:
+            if step == 'add':
+                result = model.add_columns(names)
+                x_name = x_name + list(np.atleast_1d(names))
+            else:
+                result = model.drop_columns(names)
+                x_name = [x for x in x_name if x not in np.atleast_1d(names)]
+            cls.pairs.append((result, reg(cls.df, 'y', x_name,
+                                          **cls.reg_args)))
+
+    def test_beta(self):
+        for result, expected in self.pairs:
+            assert_array_almost_equal(result.beta,
+                                      expected.beta[result.beta.index])
+
+    def test_vce(self):
+        for result, expected in self.pairs:
+            cols = result.beta.index
+            assert_array_almost_equal(result.vce, expected.vce.loc[cols,
+                                                                   cols])
+            assert_array_almost_equal(result.pt, expected.pt[cols])
+
+    def test_stats(self):
+        for result, expected in self.pairs:
+            assert result.N == expected.N
+            assert result.K == expected.K
+            assert result.df_t == expected.df_t
+            assert_array_almost_equal(result.r2, expected.r2)
+            assert_array_almost_equal(result.F, expected.F)
+
+
+class TestUpdate_std(UpdateCompare):
+    reg_args = {}
+
+
+class TestUpdate_robust(UpdateCompare):
+    reg_args = {'vce_type': 'robust', 'addcons': True}
+
+
+class TestUpdate_cluster_fe(UpdateCompare):
+    reg_args = {'cluster': 'clust', 'a_name': 'fe'}
+
+
+class TestUpdate_cluster_awt(UpdateCompare):
+    reg_args = {'cluster': 'clust', 'awt_name': 'aw', 'addcons': True}
+
+
+class TestUpdateLargeMean(object):
+
+    def test_ssr(self):
+        # y'y - b'X'y loses the whole SSR here
+        df = update_data()
+        df['y'] = 1e8 + df['a'] + 1e-3 * df['f']
+        model = UpdatableReg(df, 'y', ['b'], addcons=True,
+                             vce_type='robust')
+        for result, x_name in ((model.add_columns('a'), ['b', 'a']),
+                               (model.drop_columns('b'), ['a'])):
+            expected = reg(df, 'y', x_name, addcons=True, vce_type='robust')
+            np.testing.assert_allclose(result.ssr, expected.ssr, rtol=1e-6)
+            np.testing.assert_allclose(result.r2, expected.r2, rtol=1e-9)
+            np.testing.assert_allclose(result.se,
+                                       expected.se[result.se.index],
+                                       rtol=1e-4)
+
+
+class TestUpdateErrors(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = update_data()
+
+    def test_collinear(self):
+        model = UpdatableReg(self.df, 'y', ['a', 'b'])
+        try:
+            model.add_columns(['c', 'dup'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+        # Nothing was added
+        assert list(model.add_columns('d').beta.index) == ['a', 'b', 'd']
+
+    def test_bad_names(self):
+        model = UpdatableReg(self.df, 'y', ['a', 'b'])
+        for method, names in ((model.add_columns, 'a'),
+                              (model.drop_columns, 'c'),
+                              (model.drop_columns, ['a', 'b'])):
+            try:
+                method(names)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(names)
+
+    def test_missing(self):
+        df = self.df.copy()
+        df.loc[3, 'c'] = np.nan
+        model = UpdatableReg(df, 'y', ['a', 'b'])
+        try:
+            model.add_columns('c')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+    def test_vce_type(self):
+        try:
+            UpdatableReg(self.df, 'y', ['a', 'b'], vce_type='hc2')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
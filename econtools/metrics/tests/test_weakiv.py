@@ -0,0 +1,98 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import reg
+from econtools.metrics.weakiv import weakiv, clr_pvalue
+
+
+def weak_iv_data(N=300, strength=.2):
+    np.random.seed(1234)
+    df = pd.DataFrame(np.random.normal(size=(N, 3)),
+                      columns=['z1', 'z2', 'w1'])
+    df['g'] = np.random.randint(0, 20, N)
+    v = np.random.normal(size=N)
+    df['x'] = strength*(df['z1'] + .5*df['z2']) + .5*df['w1'] + v
+    df['y'] = 1 + .5*df['x'] + df['w1'] + .8*v + np.random.normal(size=N)
+    return df
+
+
+class WeakIVCompare(object):
+
+    vce_args = {}
+
+    @classmethod
+    def setup_class(cls):
+        cls.df = weak_iv_data()
+        cls.grid = np.linspace(-3, 3, 7)
+        cls.result = weakiv(cls.df, 'y', 'x', ['z1', 'z2'], ['w1'],
+                            addcons=True, grid=cls.grid, **cls.vce_args)
+        expected = []
+        for b0 in cls.grid:
+            df = cls.df.copy()
+            df['e'] = df['y'] - b0*df['x']
+            res = reg(df, 'e', ['z1', 'z2', 'w1'], addcons=True,
+                      **cls.vce_args)
+            expected.append(res.Ftest(['z1', 'z2']))
+        cls.expected = np.array(expected)
+
+    def test_ar_stat(self):
+        assert_array_almost_equal(self.result.ar_stat, self.expected[:, 0])
+
+    def test_ar_p(self):
+        assert_array_almost_equal(self.result.ar_p, self.expected[:, 1])
+
+
+class TestWeakIV_std(WeakIVCompare):
+    vce_args = {}
+
+
+class TestWeakIV_robust(WeakIVCompare):
+    vce_args = {'vce_type': 'robust'}
+
+
+class TestWeakIV_cluster(WeakIVCompare):
+    vce_args = {'cluster': 'g'}
+
+
+class TestWeakIV_areg(WeakIVCompare):
+    vce_args = {'a_name': 'g'}
+
+
+class TestWeakIV_sets(object):
+
+    def test_ar_set_is_grid_acceptance(self):
+        df = weak_iv_data()
+        res = weakiv(df, 'y', 'x', ['z1', 'z2'], ['w1'], addcons=True)
+        accepted = res.grid[res.ar_p > .05]
+        lo, hi = res.ar_confset[0]
+        assert len(res.ar_confset) == 1
+        assert (lo, hi) == (accepted.min(), accepted.max())
+        # CLR is efficient, contains the estimate
+        clr_lo, clr_hi = res.clr_confset[0]
+        assert clr_lo < res.beta['x'] < clr_hi
+
+    def test_unbounded(self):
+        df = weak_iv_data(strength=0)
+        res = weakiv(df, 'y', 'x', ['z1', 'z2'], ['w1'], addcons=True,
+                     grid=np.linspace(-5, 5, 101))
+        assert res.ar_confset[0][0] == -np.inf
+        assert res.ar_confset[-1][1] == np.inf
+
+    def test_clr_pvalue_sim(self):
+        np.random.seed(4321)
+        k, m, r = 3, 6., 10.
+        c1 = np.random.chisquare(1, 200000)
+        ck = np.random.chisquare(k - 1, 200000)
+        lr = .5*(c1 + ck - r + np.sqrt((c1 + ck + r)**2 - 4*ck*r))
+        expected = (lr > m).mean()
+        result = clr_pvalue(np.array([m]), np.array([r]), k)[0]
+        assert abs(expected - result) < .003
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,89 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+
+from numpy.testing import assert_array_almost_equal
+
+from econtools.metrics.core import ivreg
+
+
+class TestCategoricalInstrument(object):
+
+    @classmethod
+    def setup_class(cls):
+        np.random.seed(97531)
+        N = 1000
+        df = pd.DataFrame(np.random.normal(size=(N, 2)), columns=['w1', 'z1'])
+        df['court'] = np.random.randint(0, 5, N)
+        df['judge'] = df['court'] * 10 + np.random.randint(0, 10, N)
+        df['other'] = np.random.randint(0, 4, N)
+        judge_effect = np.random.normal(size=50)
+        v = np.random.normal(size=N)
+        df['x'] = judge_effect[df['judge']] + .5*df['w1'] + .3*df['z1'] + v
+        df['y'] = 1 + .5*df['x'] + df['w1'] + .8*v + np.random.normal(size=N)
+        df['wt'] = np.random.uniform(.5, 2, N)
+        dummies = pd.get_dummies(df['judge'], prefix='j').astype(float)
+        cls.df = df
+        cls.df_dummies = df.join(dummies)
+        cls.judge_cols = list(dummies.columns)
+        # Drop one judge per court when `court` is absorbed
+        cls.judge_cols_nested = [c for c in cls.judge_cols
+                                 if int(c[2:]) % 10 != 0]
+
+    def _compare(self, result, expected):
+        assert_array_almost_equal(result.beta, expected.beta)
+        assert_array_almost_equal(result.vce, expected.vce)
+
+    def test_2sls(self):
+        result = ivreg(self.df, 'y', 'x', 'z1', 'w1', zcat_name='judge',
+                       addcons=True, vce_type='robust')
+        expected = ivreg(self.df_dummies, 'y', 'x',
+                         self.judge_cols[1:] + ['z1'], 'w1', addcons=True,
+                         vce_type='robust')
+        self._compare(result, expected)
+
+    def test_2sls_weights(self):
+        result = ivreg(self.df, 'y', 'x', 'z1', 'w1', zcat_name='judge',
+                       addcons=True, awt_name='wt')
+        expected = ivreg(self.df_dummies, 'y', 'x',
+                         self.judge_cols[1:] + ['z1'], 'w1', addcons=True,
+                         awt_name='wt')
+        self._compare(result, expected)
+
+    def test_2sls_areg_not_nested(self):
+        result = ivreg(self.df, 'y', 'x', [], 'w1', zcat_name='judge',
+                       a_name='other')
+        expected = ivreg(self.df_dummies, 'y', 'x', self.judge_cols[1:],
+                         'w1', a_name='other')
+        self._compare(result, expected)
+
+    def test_jive(self):
+        result = ivreg(self.df, 'y', 'x', 'z1', 'w1', zcat_name='judge',
+                       addcons=True, iv_method='jive')
+        expected = ivreg(self.df_dummies, 'y', 'x',
+                         self.judge_cols[1:] + ['z1'], 'w1', addcons=True,
+                         iv_method='jive')
+        self._compare(result, expected)
+
+    def test_ujive_areg(self):
+        result = ivreg(self.df, 'y', 'x', [], 'w1', zcat_name='judge',
+                       a_name='court', iv_method='ujive', cluster='court')
+        expected = ivreg(self.df_dummies, 'y', 'x', self.judge_cols_nested,
+                         'w1', a_name='court', iv_method='ujive',
+                         cluster='court')
+        self._compare(result, expected)
+
+    def test_loo_not_nested(self):
+        try:
+            ivreg(self.df, 'y', 'x', [], 'w1', zcat_name='judge',
+                  a_name='other', iv_method='jive')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError
+
+
+if __name__ == '__main__':
+    import pytest
+    pytest.main()
@@ -0,0 +1,313 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+from scipy.linalg import solve_triangular
+
+from econtools.util import force_list
+from econtools.metrics.core import (Regression, Results, sandwich,
+                                    _cross_moments, _meat_robust,
+                                    _wrapSigma)
+from econtools.metrics.design import as_float
+from econtools.metrics.factor import has_factor_terms
+
+
+class UpdatableReg(Regression):
+    """OLS regression that can add and drop regressors without refitting.
+
+    Args:
+        df (DataFrame): Data with any relevant variables.
+        y_name (str): Column name in ``df`` of the dependent variable.
+        x_name (str or list): Column name(s) in ``df`` of the starting
+            regressors.
+
+    Keyword Args:
+        vce_type (str): ``None`` (default), ``'robust'`` (or ``'hc1'``), or
+            ``'cluster'`` (requires ``cluster``).
+        a_name (str or list): Column name(s) in ``df`` of fixed effects to
+            absorb.
+        **Other keyword args are as in :py:func:`~econtools.metrics.reg`:
+            ``cluster``, ``nosingles``, ``addcons``, ``nocons``,
+            ``awt_name``, and ``save_fe``.
+
+    Attributes:
+        results (Results): Results of the current model, the same as
+            :py:func:`~econtools.metrics.reg` except that ``yhat``,
+            ``resid``, and ``fixed_effects`` (with ``save_fe``) are only
+            available for the starting model.
+
+    Example:
+        >>> model = UpdatableReg(df, 'y', ['x1', 'x2'], cluster='state')
+        >>> results = model.add_columns('x3')
+        >>> results = model.drop_columns(['x1', 'x3'])
+
+    Notes:
+        The model keeps the upper Cholesky factor :math:`R` of :math:`X'X`
+        (:math:`R'R = X'X`), :math:`(X'X)^{-1}`, :math:`X'y`, the means and
+        centered cross products of :math:`X` and :math:`y` (for the sum of
+        squared residuals, which :math:`y'y - b'X'y` loses if :math:`y` has
+        a large mean), and, for clustered VCEs, :math:`X'X` and :math:`X'y`
+        within each cluster. Adding a column appends a row and column to
+        :math:`R` and updates :math:`(X'X)^{-1}` by the partitioned inverse;
+        dropping one deletes its column of :math:`R`, restores triangularity
+        with Givens rotations, and downdates :math:`(X'X)^{-1}`. Each takes
+        :math:`O(K^2)` operations.
+
+        Only the new column's cross products with ``y`` and the current
+        regressors pass over the data (:math:`O(NK)`). Coefficients and the
+        homoskedastic VCE are then found in :math:`O(K^2)`. The robust and
+        clustered VCEs are not: their meat is quadratic in the residuals, and
+        every coefficient can change with an update, so it can't be kept as
+        K-by-K sums. The clustered VCE is found from the cluster-level cross
+        products (:math:`O(GK^2)` for :math:`G` clusters) and the robust VCE
+        from the residuals of every observation (:math:`O(NK^2)`).
+
+        The sample is set when the model is created. Added columns must not
+        be missing in it.
+    """
+
+    sparse_x = False
+    # Factor, inverse, and cross products (replaced, not modified in place)
+    _state = ('_R', '_xpx_inv', '_xpy', '_moments', '_cluster_xpx',
+              '_cluster_xpy')
+
+    def __init__(self, df, y_name, x_name,
+                 a_name=None, nosingles=True,
+                 vce_type=None, cluster=None,
+                 addcons=None, nocons=False,
+                 awt_name=None, save_fe=False,
+                 ):
+        super(UpdatableReg, self).__init__(
+            df, y_name, x_name,
+            a_name=a_name, nosingles=nosingles, addcons=addcons,
+            nocons=nocons, vce_type=vce_type, cluster=cluster, shac=None,
+            awt_name=awt_name, save_fe=save_fe)
+        if self.vce_type not in (None, 'robust', 'hc1', 'cluster'):
+            raise ValueError(
+                "VCE type '{}' not supported for updates".format(
+                    self.vce_type))
+        if self.factor_terms:
+            raise ValueError("Factor variables are not supported for updates")
+        self._dof = None
+        self.results = self.main()
+        self.x = None       # Kept by column in `_x_cols`
+
+    def add_columns(self, x_name):
+        """Add regressors and refit.
+
+        Args:
+            x_name (str or list): Column name(s) in ``df`` to add.
+
+        Returns:
+            A :py:class:`~econtools.metrics.core.Results` object.
+        """
+        new = self._prep_columns(force_list(x_name))
+        saved = {name: self.__dict__.get(name) for name in self._state}
+        saved['_cols'] = list(self._cols)
+        try:
+            for name, v in new.items():
+                self._append(name, v)
+                self._x_cols[name] = v
+        except ValueError:
+            # Leave the model as it was
+            self.__dict__.update(saved)
+            for name in new:
+                self._x_cols.pop(name, None)
+            raise
+        return self._refit()
+
+    def drop_columns(self, x_name):
+        """Drop regressors and refit.
+
+        Args:
+            x_name (str or list): Column name(s) of current regressors to
+                drop.
+
+        Returns:
+            A :py:class:`~econtools.metrics.core.Results` object.
+        """
+        names = force_list(x_name)
+        for name in names:
+            if name not in self._cols or names.count(name) > 1:
+                raise ValueError("`{}` is not a regressor".format(name))
+        if len(names) == len(self._cols):
+            raise ValueError("Cannot drop all regressors")
+        for name in names:
+            self._delete(self._cols.index(name))
+            del self._x_cols[name]
+        return self._refit()
+
+    def _prep_columns(self, names):
+        """ New columns in the sample, demeaned and weighted like `x`. """
+        if has_factor_terms(names, self.df.columns):
+            raise ValueError("Factor variables are not supported for updates")
+        for name in names:
+            if name in self._cols or names.count(name) > 1:
+                raise ValueError("`{}` is already a regressor".format(name))
+        new = self.df.loc[self.sample.values, names].reset_index(drop=True)
+        if new.isnull().any().any():
+            raise ValueError("Added columns are missing in the sample")
+        new = as_float(new)
+        if self.A is not None:
+            new = self._demean_within(new)
+        if self.AWT is not None:
+            new = new.multiply(self.row_wt, axis=0)
+        return {name: new[name].values for name in names}
+
+    def estimate(self):
+        y = self.y.values
+        x = self.x.values
+        self._cols = list(self.x.columns)
+        # Regressors by column, so updates don't copy the whole design
+        self._x_cols = {name: x[:, j] for j, name in enumerate(self._cols)}
+        self._xpy = x.T.dot(y)
+        # Count, means, and centered cross products of `x` and `y` (last)
+        self._moments = _cross_moments(np.column_stack((x, y)))
+        xpx = x.T.dot(x)
+        self._R = np.linalg.cholesky(xpx).T
+        self._xpx_inv = np.linalg.inv(xpx)
+        if self.vce_type == 'cluster':
+            K = x.shape[1]
+            self._cluster_xpy = self.clusters.sums(x * y[:, np.newaxis])
+            self._cluster_xpx = np.empty((self.clusters.n_clusters, K, K))
+            for col in range(K):
+                self._cluster_xpx[:, :, col] = self.clusters.sums(
+                    x * x[:, col:col + 1])
+        self._refresh()
+        self._set_sst(self.y)
+
+    def _append(self, name, v):
+        """ Add column `v` to the factor, inverse, and cross products. """
+        columns = [self._x_cols[col] for col in self._cols]
+        b = np.array([col.dot(v) for col in columns])
+        c = v.dot(v)
+        # Cholesky: [[R, r], [0, d]] with R'r = b, d^2 = c - r'r
+        r = solve_triangular(self._R, b, trans='T')
+        d2 = c - r.dot(r)
+        if d2 <= 1e-12 * c:
+            raise ValueError(
+                "`{}` is collinear with the other regressors".format(name))
+        K = len(self._cols)
+        R = np.zeros((K + 1, K + 1))
+        R[:K, :K] = self._R
+        R[:K, K] = r
+        R[K, K] = np.sqrt(d2)
+        self._R = R
+        # Partitioned inverse; `d2` is the Schur complement of `c`
+        k = self._xpx_inv.dot(b)
+        xpx_inv = np.empty((K + 1, K + 1))
+        xpx_inv[:K, :K] = self._xpx_inv + np.outer(k, k) / d2
+        xpx_inv[:K, K] = xpx_inv[K, :K] = -k / d2
+        xpx_inv[K, K] = 1 / d2
+        self._xpx_inv = xpx_inv
+
+        y = self.y.values
+        self._xpy = np.append(self._xpy, v.dot(y))
+        # Centered cross products of `v`, inserted before `y`
+        n, mean, dev_cross = self._moments
+        v_dev = v - v.mean()
+        cross = np.array([(col - m).dot(v_dev)
+                          for col, m in zip(columns + [v, y],
+                                            np.insert(mean, K, v.mean()))])
+        dev_cross = np.insert(np.insert(dev_cross, K, 0, axis=0), K, 0,
+                              axis=1)
+        dev_cross[K, :] = dev_cross[:, K] = cross
+        self._moments = (n, np.insert(mean, K, v.mean()), dev_cross)
+        if self.vce_type == 'cluster':
+            G = self.clusters.n_clusters
+            cross = np.column_stack([self.clusters.sums(col * v)
+                                     for col in columns + [v]])
+            cluster_xpx = np.empty((G, K + 1, K + 1))
+            cluster_xpx[:, :K, :K] = self._cluster_xpx
+            cluster_xpx[:, :, K] = cluster_xpx[:, K, :] = cross
+            self._cluster_xpx = cluster_xpx
+            self._cluster_xpy = np.column_stack(
+                [self._cluster_xpy, self.clusters.sums(v * y)])
+        self._cols.append(name)
+
+    def _delete(self, j):
+        """ Remove column `j` from the factor, inverse, and cross products. """
+        R = np.delete(self._R, j, axis=1)
+        # Zero the subdiagonal left by the deleted column
+        for i in range(j, R.shape[1]):
+            a, b = R[i, i], R[i + 1, i]
+            h = np.hypot(a, b)
+            c, s = a / h, b / h
+            top, bottom = R[i, i:].copy(), R[i + 1, i:]
+            R[i, i:] = c * top + s * bottom
+            R[i + 1, i:] = c * bottom - s * top
+        self._R = R[:-1]
+
+        inv = self._xpx_inv
+        col = np.delete(inv[:, j], j)
+        self._xpx_inv = (np.delete(np.delete(inv, j, axis=0), j, axis=1) -
+                         np.outer(col, col) / inv[j, j])
+        self._xpy = np.delete(self._xpy, j)
+        n, mean, dev_cross = self._moments
+        self._moments = (n, np.delete(mean, j),
+                         np.delete(np.delete(dev_cross, j, axis=0), j,
+                                   axis=1))
+        if self.vce_type == 'cluster':
+            self._cluster_xpx = np.delete(
+                np.delete(self._cluster_xpx, j, axis=1), j, axis=2)
+            self._cluster_xpy = np.delete(self._cluster_xpy, j, axis=1)
+        del self._cols[j]
+
+    def _refit(self):
+        self._refresh()
+        self.get_vce()
+        self.set_dof()
+        self.inference()
+        return self.results
+
+    def _refresh(self):
+        """ Coefficients from the Cholesky factor: `R'R b = X'y`. """
+        beta = solve_triangular(
+            self._R, solve_triangular(self._R, self._xpy, trans='T'))
+        self.results = Results(beta=pd.Series(beta, index=self._cols),
+                               xpx_inv=self._xpx_inv)
+
+    def get_vce(self):
+        """ VCE from the cross products (no residuals unless robust). """
+        beta = self.results.beta.values
+        xpx_inv = self.results.xpx_inv
+        # SSR from centered moments, as in `BlockRegression`
+        n, mean, dev_cross = self._moments
+        coef = np.append(-beta, 1)
+        ssr = coef.dot(dev_cross).dot(coef) + n * mean.dot(coef) ** 2
+        self.results._ssr = ssr
+        if self.vce_type is None:
+            vce = ssr / self.y.shape[0] * xpx_inv
+        elif self.vce_type in ('robust', 'hc1'):
+            x = self._design()
+            resid = self.y.values - x.dot(beta)
+            vce = sandwich(xpx_inv, _meat_robust(x * resid[:, np.newaxis]),
+                           xpx_inv.T)
+        else:
+            scores = self._cluster_xpy - self._cluster_xpx.dot(beta)
+            vce = sandwich(xpx_inv, scores.T.dot(scores), xpx_inv.T)
+
+        vce = _wrapSigma((vce + vce.T) / 2, self.results.beta.index)
+        self.results._add_stat('vce', vce)
+        self.results._add_stat('sample', self.sample)
+        self.results._add_stat('singletons', self.singleton_rounds)
+        if self._dof is None:
+            yhat = self._design().dot(beta)
+            self.results._add_stat('yhat', pd.Series(yhat,
+                                                     name=self.y.name))
+            self.results._add_stat('resid', self.y - yhat)
+
+    def _set_NK(self):
+        # Fixed-effect DoF and total sum of squares don't change
+        if self._dof is None:
+            N, K = super(UpdatableReg, self)._set_NK()
+            self._dof = (N, K - len(self._cols), self.results._sst,
+                         self.results._nocons)
+        N, K_fe, sst, nocons = self._dof
+        self.results._sst = sst
+        self.results._nocons = nocons
+        return N, len(self._cols) + K_fe
+
+    def _design(self):
+        """ Current regressors as an array. """
+        return np.column_stack([self._x_cols[col] for col in self._cols])
@@ -0,0 +1,284 @@
+from __future__ import division
+
+import pandas as pd
+import numpy as np
+import numpy.linalg as la
+import scipy.stats as stats
+from scipy.special import gammaln
+
+from econtools.metrics.core import (IVReg, vce_homosk, vce_robust,
+                                    vce_cluster, vce_shac, vce_hac, df_std,
+                                    df_cluster, df_shac, _fe_dof)
+
+
+def weakiv(df, y_name, x_name, z_name, w_name,
+           grid=None, npoints=1000, level=.95, clr=True,
+           a_name=None, nosingles=True,
+           vce_type=None, cluster=None, shac=None, hac=None,
+           addcons=None, nocons=False,
+           awt_name=None,
+           ):
+    """Weak-instrument robust confidence sets (Anderson-Rubin and CLR).
+
+    Args:
+        df (DataFrame): Data with any relevant variables.
+        y_name (str): Column name in ``df`` of the dependent variable.
+        x_name (str or list): Column name in ``df`` of the (single) endogenous
+            regressor.
+        z_name (str or list): Column name(s) in ``df`` of the excluded
+            instrument(s)
+        w_name (str or list): Column name(s) in ``df`` of the included
+            instruments/exogenous regressors
+
+    Keyword Args:
+        grid (array-like): Null values of the coefficient on ``x_name`` at
+            which the tests are evaluated. Default is ``npoints`` evenly
+            spaced points centered on the 2SLS estimate and spanning four
+            times the width of its Wald confidence interval.
+        npoints (int): Defaults to 1000. Number of grid points if ``grid`` is
+            not passed.
+        level (float): Defaults to .95. Confidence level of the sets.
+        clr (bool): Defaults to True. Also calculate the conditional
+            likelihood ratio (CLR) test and confidence set. Requires more
+            than one excluded instrument to differ from Anderson-Rubin.
+        **All other keyword args in :py:func:`~econtools.metrics.ivreg` may
+            also be used.
+
+    Returns:
+        The 2SLS :py:class:`~econtools.metrics.core.Results` object with
+        extra attributes:
+            - ``grid`` (*array*): Null values that were tested.
+            - ``ar_stat``, ``ar_p`` (*array*): Anderson-Rubin F-stat and
+              p-value at each point in ``grid``.
+            - ``ar_confset`` (*list*): AR confidence set as a list of
+              ``(low, high)`` intervals. An interval that touches the edge of
+              ``grid`` is extended to infinity when the AR test does not
+              reject as the null goes to infinity (i.e., the first stage is
+              insignificant at ``level``).
+            - ``clr_stat``, ``clr_p``, ``clr_confset``: Same, for the CLR test
+              (only if ``clr=True``). CLR intervals are bounded by ``grid``.
+
+    Notes:
+        VCE types ``'hc2'`` and ``'hc3'`` are not supported.
+
+        ``y``, ``x``, and ``z`` are partialled out of the included instruments
+        once. Since the residual from regressing :math:`y - x\\beta_0` on the
+        instruments is linear in :math:`\\beta_0`, each supported VCE is a
+        quadratic in :math:`\\beta_0` whose coefficients are found by applying
+        the usual ``vce_*`` functions to the reduced-form residuals. The
+        statistics are then evaluated on the whole grid with array operations.
+
+        The AR statistic uses the same F distribution and degrees of freedom
+        as :py:meth:`~econtools.metrics.core.Results.Ftest` on the
+        regression of :math:`y - x\\beta_0` on all instruments. The CLR test
+        is the heteroskedasticity-robust version of Kleibergen (2005) with
+        p-values from the asymptotic conditional distribution (Andrews,
+        Moreira, and Stock, 2007). With ``cluster``, ``shac``, or ``hac``, the
+        cross-covariance of the two reduced forms is estimated by its
+        symmetric part.
+    """
+
+    WeakIVWorker = WeakIV(
+        df, y_name, x_name, z_name, w_name,
+        grid=grid, npoints=npoints, level=level, clr=clr,
+        a_name=a_name, nosingles=nosingles, addcons=addcons, nocons=nocons,
+        iv_method='2sls', _kappa_debug=None,
+        vce_type=vce_type, cluster=cluster, shac=shac, hac=hac,
+        awt_name=awt_name,
+    )
+
+    results = WeakIVWorker.main()
+    return results
+
+
+class WeakIV(IVReg):
+
+    def __init__(self, *args, **kwargs):
+        super(WeakIV, self).__init__(*args, **kwargs)
+        if len(self.x_name) != 1:
+            raise ValueError("Weak IV sets require one endogenous regressor")
+        if self.vce_type in ('hc2', 'hc3'):
+            raise ValueError(
+                "VCE type '{}' not supported for weak IV sets".format(
+                    self.vce_type))
+
+    def main(self):
+        results = super(WeakIV, self).main()
+        self._partial_out_w()
+        self.grid = self._set_grid()
+        self.weak_iv_tests()
+        return results
+
+    def _partial_out_w(self):
+        """ Residualize `y`, `x`, and `z` on included instruments once. """
+        yxz = np.column_stack((self.y.values, self.x.values, self.z.values))
+        if self.w is not None and not self.w.empty:
+            w = self.w.values
+            coeffs = la.lstsq(w, yxz, rcond=None)[0]
+            yxz = yxz - w.dot(coeffs)
+        self.y_tilde = yxz[:, 0]
+        self.x_tilde = yxz[:, 1]
+        self.z_tilde = yxz[:, 2:]
+
+    def _set_grid(self):
+        if self.grid is not None:
+            return np.sort(np.asarray(self.grid, dtype=np.float64).ravel())
+        beta = self.results.beta[self.x_name[0]]
+        width = (self.results.ci_hi - self.results.ci_lo)[self.x_name[0]]
+        return np.linspace(beta - 2 * width, beta + 2 * width, self.npoints)
+
+    def weak_iv_tests(self):
+        z = self.z_tilde
+        k = z.shape[1]
+        zpz_inv = la.inv(z.T.dot(z))
+        pi_y = zpz_inv.dot(z.T.dot(self.y_tilde))
+        pi_x = zpz_inv.dot(z.T.dot(self.x_tilde))
+        u_y = self.y_tilde - z.dot(pi_y)
+        u_x = self.x_tilde - z.dot(pi_x)
+
+        # VCE of reduced forms; V(b0) = W_yy - 2*b0*W_yx + b0^2 W_xx
+        W_yy = self._rf_vce(zpz_inv, u_y)
+        W_xx = self._rf_vce(zpz_inv, u_x)
+        W_yx = (self._rf_vce(zpz_inv, u_y + u_x) - W_yy - W_xx) / 2
+        __, vce_correct, t_df = self._ar_dof(k)
+        W_yy, W_xx, W_yx = [vce_correct * W for W in (W_yy, W_xx, W_yx)]
+
+        b0 = self.grid
+        g = pi_y[np.newaxis, :] - b0[:, np.newaxis] * pi_x[np.newaxis, :]
+        V_gg = (W_yy[np.newaxis, :, :]
+                - 2 * b0[:, np.newaxis, np.newaxis] * W_yx[np.newaxis, :, :]
+                + b0[:, np.newaxis, np.newaxis] ** 2 * W_xx[np.newaxis, :, :])
+        Vinv_g = _batch_solve(V_gg, g)
+        ar_wald = np.einsum('gk,gk->g', g, Vinv_g)
+
+        ar_stat = ar_wald / k
+        ar_p = stats.f.sf(ar_stat, k, t_df)
+        alpha = 1 - self.level
+        # As b0 -> +/-inf, AR -> first-stage Wald stat
+        fs_wald = pi_x.dot(la.solve(W_xx, pi_x)) / k
+        ar_unbounded = stats.f.sf(fs_wald, k, t_df) > alpha
+        ar_confset = _accept_to_intervals(b0, ar_p > alpha, ar_unbounded)
+
+        self.results._add_stat('grid', b0)
+        self.results._add_stat('ar_stat', ar_stat)
+        self.results._add_stat('ar_p', ar_p)
+        self.results._add_stat('ar_confset', ar_confset)
+
+        if not self.clr:
+            return
+
+        # Kleibergen (2005): orthogonalize first stage wrt `g`
+        V_xg = W_yx[np.newaxis, :, :] - b0[:, np.newaxis, np.newaxis] * W_xx
+        D = pi_x[np.newaxis, :] - np.einsum('gij,gj->gi', V_xg, Vinv_g)
+        Vinv_Vgx = _batch_solve(V_gg, np.transpose(V_xg, (0, 2, 1)))
+        V_DD = W_xx[np.newaxis, :, :] - np.einsum('gij,gjk->gik', V_xg,
+                                                  Vinv_Vgx)
+        rk = np.einsum('gk,gk->g', D, _batch_solve(V_DD, D))
+        Vinv_D = _batch_solve(V_gg, D)
+        lm = np.einsum('gk,gk->g', g, Vinv_D) ** 2 / np.einsum(
+            'gk,gk->g', D, Vinv_D)
+        clr_stat = .5 * (ar_wald - rk + np.sqrt(
+            (ar_wald + rk) ** 2 - 4 * (ar_wald - lm) * rk))
+        clr_p = clr_pvalue(clr_stat, rk, k)
+        clr_confset = _accept_to_intervals(b0, clr_p > alpha, False)
+
+        self.results._add_stat('clr_stat', clr_stat)
+        self.results._add_stat('clr_p', clr_p)
+        self.results._add_stat('clr_confset', clr_confset)
+
+    def _rf_vce(self, zpz_inv, resid):
+        """ VCE of reduced-form coefficients on `z_tilde` for `resid`. """
+        z = self.z_tilde
+        vce_type = self.vce_type
+        if vce_type is None:
+            return vce_homosk(zpz_inv, resid)
+        # `vce_*` functions expect DataFrame regressors
+        z = pd.DataFrame(z, columns=self.z.columns)
+        if vce_type in ('robust', 'hc1'):
+            return vce_robust(zpz_inv, resid, z)
+        elif vce_type == 'cluster':
+            return vce_cluster(zpz_inv, resid, z, self.clusters)
+        elif vce_type == 'shac':
+            return vce_shac(zpz_inv, resid, z, *self._shac_args())
+        elif vce_type in ('hac', 'driscoll-kraay'):
+            return vce_hac(zpz_inv, resid, z, *self._hac_args())
+        else:
+            raise ValueError
+
+    def _ar_dof(self, k):
+        """ DoF for the regression of `y - x*b0` on all instruments. """
+        N = self.y.shape[0]
+        K = k
+        if self.w is not None:
+            K += self.w.shape[1]
+        if self.A is not None:
+            K += _fe_dof(self.A, self.clusters)
+
+        vce_type = self.vce_type
+        if vce_type in (None, 'robust', 'hc1'):
+            df, vce_correct = df_std(N, K)
+        elif vce_type == 'cluster':
+            df, vce_correct, __ = df_cluster(N, K, self.clusters)
+        elif vce_type == 'shac':
+            df, vce_correct = df_shac(N, K)
+        elif vce_type == 'hac':
+            df, vce_correct = df_std(N, K)
+        elif vce_type == 'driscoll-kraay':
+            df, vce_correct, __ = df_cluster(N, K, self.hac_time)
+
+        return K, vce_correct, df
+
+
+def clr_pvalue(clr_stat, rk, k, nodes=64):
+    """
+    Asymptotic p-value of the CLR statistic conditional on the rank statistic
+    `rk` with `k` instruments, using the integral representation of Andrews,
+    Moreira, and Stock (2007). With `k = 1` the CLR is the AR stat.
+    """
+    clr_stat = np.asarray(clr_stat, dtype=np.float64)
+    rk = np.asarray(rk, dtype=np.float64)
+    if k == 1:
+        return stats.chi2.sf(clr_stat, 1)
+
+    # Substitute s = sin(theta) to remove the endpoint singularity
+    x, wts = np.polynomial.legendre.leggauss(nodes)
+    theta = (x + 1) * np.pi / 4
+    wts = wts * np.pi / 4
+    s2 = np.sin(theta) ** 2
+    log_K4 = gammaln(k / 2) - .5 * np.log(np.pi) - gammaln((k - 1) / 2)
+
+    m = np.maximum(clr_stat, 1e-300)[:, np.newaxis]
+    r = rk[:, np.newaxis]
+    chi_arg = (m + r) / (1 + (r / m) * s2[np.newaxis, :])
+    integrand = stats.chi2.cdf(chi_arg, k) * np.cos(theta) ** (k - 2)
+    p = 1 - 2 * np.exp(log_K4) * integrand.dot(wts)
+    return np.clip(p, 0, 1)
+
+
+def _batch_solve(A, b):
+    """ Solve a stack of linear systems `A[g] x = b[g]`. """
+    if b.ndim == A.ndim - 1:
+        return la.solve(A, b[..., np.newaxis])[..., 0]
+    return la.solve(A, b)
+
+
+def _accept_to_intervals(grid, accept, unbounded):
+    """ Collapse a boolean acceptance region on `grid` into intervals. """
+    intervals = []
+    if not accept.any():
+        return intervals
+    edges = np.diff(accept.astype(np.int8))
+    starts = list(np.where(edges == 1)[0] + 1)
+    ends = list(np.where(edges == -1)[0])
+    if accept[0]:
+        starts.insert(0, 0)
+    if accept[-1]:
+        ends.append(len(grid) - 1)
+    for start, end in zip(starts, ends):
+        lo, hi = grid[start], grid[end]
+        if unbounded and start == 0:
+            lo = -np.inf
+        if unbounded and end == len(grid) - 1:
+            hi = np.inf
+        intervals.append((lo, hi))
+    return intervals